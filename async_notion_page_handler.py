@@ -0,0 +1,169 @@
+from collections import deque
+from typing import AsyncIterator
+from notion_client import AsyncClient
+from page_snapshot import PageSnapshot, as_snapshot
+from audit_log import audit
+from notion_page_handler import (
+    NotionPageHandler, build_page_name_properties, build_title_checked_properties, build_assignee_properties,
+    build_mention_rich_text, build_block_text, build_paragraph_block, retrieve_page
+)
+
+
+class AsyncNotionPageHandler(NotionPageHandler):
+    """
+    Async counterpart of NotionPageHandler built on notion_client.AsyncClient.
+
+    The read accessors (status, assignees, due date, ...) are inherited and work on the cached
+    page snapshot; every method that talks to Notion is a coroutine.
+    """
+
+    def __init__(self, page_id, notion_client: AsyncClient, page, mutation_queue=None, filter_properties: list = None,
+                 user_directory=None):
+        self.page_id = page_id
+        self.notion_client = notion_client
+        self.mutation_queue = mutation_queue
+        self.filter_properties = filter_properties
+        self.user_directory = user_directory
+        self.page: PageSnapshot = as_snapshot(page)
+
+    @classmethod
+    def from_page(cls, page, notion_client: AsyncClient, mutation_queue=None, user_directory=None):
+        """Build a handler from a page object (or snapshot) returned by a database query without refetching it."""
+        page = as_snapshot(page)
+        return cls(page.id.replace('-', ''), notion_client, page=page, mutation_queue=mutation_queue,
+                   user_directory=user_directory)
+
+    @classmethod
+    async def retrieve(cls, page_id, notion_client: AsyncClient, mutation_queue=None, filter_properties: list = None,
+                       user_directory=None):
+        """Retrieve a page, or only the properties in `filter_properties`, and build a handler for it."""
+        page_data = await retrieve_page(notion_client, page_id, filter_properties)
+        return cls(page_id, notion_client, page=page_data, mutation_queue=mutation_queue,
+                   filter_properties=filter_properties, user_directory=user_directory)
+
+    async def refresh_page_data(self) -> PageSnapshot:
+        """Retrieve the page again and replace the cached snapshot."""
+        self.page = PageSnapshot.from_page(await retrieve_page(self.notion_client, self.page_id, self.filter_properties))
+        return self.page
+
+    async def _update_properties(self, properties: dict):
+        if self.mutation_queue is not None:
+            self.mutation_queue.update_properties(self.page_id, properties)
+            return
+        await self.notion_client.pages.update(page_id=self.page_id, properties=properties)
+
+    async def _create_comment(self, rich_text: list, on_sent=None):
+        if self.mutation_queue is not None:
+            self.mutation_queue.add_comment(self.page_id, rich_text, on_sent)
+            return
+        try:
+            await self.notion_client.comments.create(parent={"page_id": self.page_id}, rich_text=rich_text)
+        except Exception:
+            if on_sent is not None:
+                on_sent(False)
+            raise
+        if on_sent is not None:
+            on_sent(True)
+
+    async def update_page_name(self, new_name: str):
+        try:
+            await self._update_properties(build_page_name_properties(new_name))
+        except Exception as err:
+            print("UPDATING PAGE NAME ERR ==> ", err)
+
+    async def add_comment(self, comment: str = 'Invalid Name detected'):
+        try:
+            await self._create_comment([{"text": {"content": comment}}])
+        except Exception as err:
+            print("ADDING COMMENTS ERR ==> ", err)
+
+    async def mention_and_comment(self, user_id: str, comment: str, on_sent=None):
+        if not self.is_valid_user(user_id):
+            print(f"SKIPPING COMMENT MENTIONING {user_id}: NOT A WORKSPACE MEMBER")
+            audit('target_skipped', page_id=self.page_id, user_id=user_id, action='comment')
+            if on_sent is not None:
+                on_sent(False)
+            return
+        try:
+            await self._create_comment(build_mention_rich_text(user_id, comment), on_sent)
+        except Exception as err:
+            print("ADDING COMMENTS ERR ==> ", err)
+
+    async def mark_page_as_checked(self):
+        try:
+            await self._update_properties(build_title_checked_properties())
+        except Exception as err:
+            print("COULDN'T MARK PAGE AS CHECKED ==> ", err)
+
+    async def assign_user_to_page(self, user_id):
+        if not self.is_valid_user(user_id):
+            print(f"SKIPPING ASSIGNMENT OF {user_id}: NOT A WORKSPACE MEMBER")
+            audit('target_skipped', page_id=self.page_id, user_id=user_id, action='assign')
+            return
+        try:
+            await self._update_properties(build_assignee_properties(user_id))
+            print("Page assigned successfully to the last editor")
+        except Exception as err:
+            print("ASSIGN USER TO PAGE ERR: ", err)
+
+    async def nudge_page_assignee(self, comment: str):
+        page_assignees = self.get_page_assignees()
+
+        try:
+            for assignee in page_assignees:
+                await self.mention_and_comment(assignee["id"], comment)
+
+        except Exception as err:
+            print("ERROR NUDGING ASSIGNEE: ", err)
+
+    async def nudge_page_owner(self, comment: str):
+        page_owner = self.get_page_owner()
+
+        try:
+            await self.mention_and_comment(page_owner["id"], comment)
+
+        except Exception as err:
+            print("ERROR NUDGING PROJECT OWNER: ", err)
+
+    async def iter_page_blocks(self) -> AsyncIterator[dict]:
+        """Yield the page's child blocks one response at a time instead of collecting them all."""
+        next_cursor = None
+
+        while True:
+            response = await self.notion_client.blocks.children.list(
+                block_id=self.page_id,
+                page_size=100,
+                start_cursor=next_cursor
+            )
+            for block in response.get("results", []):
+                yield block
+
+            next_cursor = response.get("next_cursor")
+            if not next_cursor:
+                break
+
+    async def get_page_blocks(self) -> list:
+        return [block async for block in self.iter_page_blocks()]
+
+    async def get_last_page_blocks(self, count: int = 1) -> list:
+        """The last `count` child blocks; only that many are kept in memory while paging through the rest."""
+        tail = deque(maxlen=count)
+        async for block in self.iter_page_blocks():
+            tail.append(block)
+        return list(tail)
+
+    async def update_block_text(self, block_id, block_type, updated_text):
+        try:
+            await self.notion_client.blocks.update(
+                block_id=block_id,
+                **build_block_text(block_type, updated_text)
+            )
+        except Exception as e:
+            print(f"Error updating block {block_id} text: {e}")
+
+    async def add_new_text_block(self, content):
+        """Add a new text block to the page."""
+        await self.notion_client.blocks.children.append(
+            block_id=self.page_id,
+            children=[build_paragraph_block(content)]
+        )
@@ -0,0 +1,138 @@
+import asyncio
+from typing import List, Dict, AsyncIterator, Optional
+from notion_client import AsyncClient
+from notion_project_handler import NotionProjectHandler, NAME_BATCH_SIZE
+from notion_page_handler import TASK_NAME_COMMENT
+from async_notion_page_handler import AsyncNotionPageHandler
+from async_pipeline import run_pipeline, DEFAULT_CONCURRENCY
+from notion_filters import checkbox_equals
+from page_snapshot import PageSnapshot, as_snapshot
+from audit_log import audit
+
+
+class AsyncNotionProjectHandler(NotionProjectHandler):
+    """Async counterpart of NotionProjectHandler built on notion_client.AsyncClient."""
+
+    def __init__(self, workspace: Dict, notion_client: AsyncClient):
+        self.notion_client = notion_client
+        self.database_id = workspace["database_id"]
+        self.workspace = workspace
+        # Set by the rule engine so name fixes are buffered with the run's other writes
+        self.mutation_queue = None
+        # Set by the rule engine when a rule mentions or assigns people
+        self.user_directory = None
+        # The schema last retrieved with `get_database_properties`; None until then
+        self.database_properties: Optional[Dict] = None
+        self.pending_name_checks = []
+
+    async def add_title_checkbox_to_database_schema(self):
+        if self.has_title_checkbox():
+            return
+        try:
+            await self.notion_client.databases.update(
+                self.database_id,
+                properties={
+                    "title checked": {
+                        "checkbox": {}
+                    }
+                }
+            )
+        except Exception as err:
+            print("add_title_checkbox_to_database_schema ERR ==> ", err)
+
+    async def get_database_properties(self) -> Dict:
+        """Return the property schema of the database, keyed by property name."""
+        try:
+            database = await self.notion_client.databases.retrieve(database_id=self.database_id)
+            self.database_properties = database.get("properties", {})
+            return self.database_properties
+        except Exception as err:
+            print("get_database_properties ERR ==> ", err)
+            return {}
+
+    async def get_all_pages_in_database(self, filter: Dict = None, sorts: List[Dict] = None,
+                                        page_size: int = 100, filter_properties: List[str] = None
+                                        ) -> AsyncIterator[Dict]:
+        """Yield the pages of the database as they arrive, following `next_cursor` until the end."""
+        query = {"database_id": self.database_id, "page_size": page_size}
+        if filter:
+            query["filter"] = filter
+        if sorts:
+            query["sorts"] = sorts
+        if filter_properties:
+            query["filter_properties"] = filter_properties
+
+        while True:
+            try:
+                response = await self.notion_client.databases.query(**query)
+            except Exception as err:
+                print("get_all_pages_in_database ERR ==> ", err)
+                return
+
+            for page in response.get("results", []):
+                yield page
+
+            next_cursor = response.get("next_cursor")
+            if not response.get("has_more") or not next_cursor:
+                return
+            query["start_cursor"] = next_cursor
+
+    async def queue_project_name_check(self, page):
+        """Queue a page (object or snapshot) for the next batched name check, flushing once a full batch is pending."""
+        page = as_snapshot(page)
+        project_name = self.get_unchecked_project_name(page)
+        if project_name is None:
+            return
+        self.pending_name_checks.append((page, project_name))
+        if len(self.pending_name_checks) >= NAME_BATCH_SIZE:
+            await self.flush_project_name_checks()
+
+    async def flush_project_name_checks(self):
+        """Check every queued project name with one Claude request and fix the invalid ones."""
+        pending, self.pending_name_checks = self.pending_name_checks, []
+        if not pending:
+            return
+        # The Anthropic SDK call is blocking, so it runs on a worker thread
+        verdicts = await asyncio.to_thread(
+            self.analyze_project_names_with_ai, [project_name for _, project_name in pending]
+        )
+        results = await asyncio.gather(*(
+            self.__apply_name_verdict(page, project_name, is_valid, suggestion)
+            for (page, project_name), (is_valid, suggestion) in zip(pending, verdicts)
+        ), return_exceptions=True)
+        for (page, _), result in zip(pending, results):
+            if isinstance(result, Exception):
+                print(f"ERROR APPLYING NAME CHECK TO PAGE {page.id} ==> ", result)
+
+    async def __apply_name_verdict(self, page: PageSnapshot, project_name: str, is_valid: bool,
+                                   suggestion: Optional[str]):
+        notion_page_handler = AsyncNotionPageHandler.from_page(page, self.notion_client, self.mutation_queue)
+        audit('name_checked', page_id=page.id, name=project_name, valid=is_valid,
+              suggestion=None if is_valid else suggestion)
+        if is_valid:
+            await notion_page_handler.mark_page_as_checked()
+            return
+        if not suggestion:
+            # Found invalid by the local rules, which never rename a page
+            await notion_page_handler.add_comment(TASK_NAME_COMMENT)
+            await notion_page_handler.mark_page_as_checked()
+            return
+
+        await notion_page_handler.add_comment()
+        await notion_page_handler.update_page_name(suggestion)  # marks page as checked as well
+
+        print(f"""
+                    Workspace: {self.workspace['name']}
+                    Invalid project name: {project_name}
+                    Suggested name: {suggestion}
+                """)
+
+    async def check_projects_for_proper_naming(self, concurrency: int = DEFAULT_CONCURRENCY):
+        """Check projects in a workspace for proper naming, `concurrency` pages at a time"""
+        try:
+            await self.add_title_checkbox_to_database_schema()
+            pages = self.get_all_pages_in_database(filter=checkbox_equals("title checked", False))
+            await run_pipeline(pages, self.queue_project_name_check, concurrency)
+            await self.flush_project_name_checks()
+        except Exception as e:
+            print(f"Error processing workspace {self.workspace['name']}: {str(e)}")
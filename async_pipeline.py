@@ -0,0 +1,44 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Union
+
+DEFAULT_CONCURRENCY = 8
+
+
+def get_workspace_concurrency(workspace: dict) -> int:
+    """Number of pages processed at once for a workspace; 1 keeps the sequential path."""
+    try:
+        return max(1, int(workspace.get('concurrency', 1)))
+    except (TypeError, ValueError):
+        return 1
+
+
+async def run_pipeline(pages: AsyncIterator[Union[dict, str]], process: Callable[[Union[dict, str]], Awaitable], concurrency: int = DEFAULT_CONCURRENCY):
+    """
+    Run `process` over pages streamed from `pages` with at most `concurrency` pages in flight.
+
+    Pages are fetched by the producer while workers evaluate and mutate earlier ones. The queue
+    between them is bounded, so a slow mutation stage applies back-pressure to the database
+    query instead of buffering the whole table. A failure on one page is reported and does not
+    stop the others. Items are page objects, or page ids when pages are rechecked by id.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker():
+        while True:
+            page = await queue.get()
+            if page is None:
+                return
+            try:
+                await process(page)
+            except Exception as err:
+                page_id = page.get('id') if isinstance(page, dict) else page
+                print(f"PIPELINE ERR ON PAGE {page_id} ==> ", err)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        async for page in pages:
+            await queue.put(page)
+    finally:
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
@@ -0,0 +1,251 @@
+"""
+Audit trail of what the automations decided and did (names found invalid, assignees set, people
+nudged, ...), as gzip-compressed NDJSON with one record per line.
+
+`audit()` only appends a record to an in-memory batch. A background thread compresses full
+batches, and batches older than AUDIT_FLUSH_SECONDS, and hands them to the sink, so rule loops
+never wait on the write. Memory is bounded: when the writer falls behind by more than
+AUDIT_MAX_PENDING_BATCHES batches, new batches are dropped and counted instead of queued.
+
+Each run is written to one object: batches are appended to a local file as gzip members, or
+uploaded as parts and composed into a single Cloud Storage object when the run ends. Concatenated
+gzip members read back as one stream (`zcat`, `gzip.open`). Deployed functions without an audit
+bucket print the records to stdout instead, one JSON line each, where Cloud Logging keeps them.
+"""
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from instrumentation import current_workspace, track_call
+from get_workspaces_api_keys import get_storage_client
+
+AUDIT_BATCH_RECORDS = int(os.getenv("AUDIT_BATCH_RECORDS", 1000))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", 10))
+AUDIT_MAX_PENDING_BATCHES = int(os.getenv("AUDIT_MAX_PENDING_BATCHES", 8))
+# Cloud Storage composes at most 32 objects per request
+MAX_COMPOSE_SOURCES = 32
+
+
+class AuditSink:
+    """Where a run's compressed batches go; `close` is called once after the last batch."""
+    compressed = True
+
+    def write(self, data: bytes):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileAuditSink(AuditSink):
+    """Appends the batches to one local `.ndjson.gz` file. Meant for tests and local runs."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, data: bytes):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'ab') as file:
+            file.write(data)
+
+
+class StdoutAuditSink(AuditSink):
+    """Prints the batches uncompressed, one JSON record per line, for Cloud Logging to keep."""
+    compressed = False
+
+    def write(self, data: bytes):
+        print(data.decode('utf-8'), end='', flush=True)
+
+
+class GCSAuditSink(AuditSink):
+    """Uploads each batch as a part object, and composes the parts into one object when the run ends."""
+
+    def __init__(self, bucket_name: str, object_name: str):
+        self.bucket = get_storage_client().bucket(bucket_name)
+        self.object_name = object_name
+        self.parts = []
+
+    def write(self, data: bytes):
+        part = self.bucket.blob(f"{self.object_name}.part-{len(self.parts):05d}")
+        with track_call("gcs", "upload", len(data)):
+            part.upload_from_string(data, content_type='application/gzip')
+        self.parts.append(part)
+
+    def close(self):
+        if not self.parts:
+            return
+        destination = self.bucket.blob(self.object_name)
+        destination.content_type = 'application/gzip'
+        sources = self.parts[:MAX_COMPOSE_SOURCES]
+        rest = self.parts[MAX_COMPOSE_SOURCES:]
+        while True:
+            with track_call("gcs", "compose"):
+                destination.compose(sources)
+            if not rest:
+                break
+            sources, rest = [destination] + rest[:MAX_COMPOSE_SOURCES - 1], rest[MAX_COMPOSE_SOURCES - 1:]
+        for part in self.parts:
+            try:
+                with track_call("gcs", "delete"):
+                    part.delete()
+            except Exception as err:
+                print(f"ERROR DELETING AUDIT PART {part.name} ==> ", err)
+
+
+class AuditLog:
+    """Buffers audit records and writes them out in compressed batches on a background thread."""
+
+    def __init__(self, sink: AuditSink, run_id: str, batch_records: int = AUDIT_BATCH_RECORDS,
+                 flush_seconds: float = AUDIT_FLUSH_SECONDS, max_pending_batches: int = AUDIT_MAX_PENDING_BATCHES):
+        self.sink = sink
+        self.run_id = run_id
+        self.batch_records = batch_records
+        self.flush_seconds = flush_seconds
+        self.batch: List[Dict] = []
+        self.batch_started = time.monotonic()
+        self.pending: "queue.Queue[Optional[List[Dict]]]" = queue.Queue(maxsize=max_pending_batches)
+        self.lock = threading.Lock()
+        self.stats = {'records': 0, 'batches': 0, 'bytes': 0, 'dropped': 0, 'failed': 0}
+        self.writer = threading.Thread(target=self.__write_batches, daemon=True)
+        self.writer.start()
+
+    def record(self, event: str, **fields):
+        """Buffer one record; never blocks on I/O."""
+        record = {'time': datetime.now(timezone.utc).isoformat(), 'run_id': self.run_id,
+                  'workspace': current_workspace.get(), 'event': event, **fields}
+        with self.lock:
+            self.batch.append(record)
+            if len(self.batch) < self.batch_records:
+                return
+            batch = self.__take_batch()
+        self.__enqueue(batch)
+
+    def __take_batch(self) -> List[Dict]:
+        batch, self.batch = self.batch, []
+        self.batch_started = time.monotonic()
+        return batch
+
+    def __enqueue(self, batch: List[Dict]):
+        try:
+            self.pending.put_nowait(batch)
+        except queue.Full:
+            with self.lock:
+                self.stats['dropped'] += len(batch)
+
+    def __write_batches(self):
+        while True:
+            try:
+                batch = self.pending.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                with self.lock:
+                    if not self.batch or time.monotonic() - self.batch_started < self.flush_seconds:
+                        continue
+                    batch = self.__take_batch()
+            if batch is None:
+                return
+            self.__write(batch)
+
+    def __write(self, batch: List[Dict]):
+        lines = ''.join(json.dumps(record, separators=(',', ':'), default=str) + '\n' for record in batch)
+        data = lines.encode('utf-8')
+        if self.sink.compressed:
+            data = gzip.compress(data)
+        try:
+            self.sink.write(data)
+        except Exception as err:
+            print("ERROR WRITING AUDIT BATCH ==> ", err)
+            with self.lock:
+                self.stats['failed'] += len(batch)
+            return
+        with self.lock:
+            self.stats['records'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['bytes'] += len(data)
+
+    def close(self) -> Dict:
+        """Write what is buffered, wait for the writer and close the sink; returns the counts of the run."""
+        with self.lock:
+            batch = self.__take_batch()
+        if batch:
+            # The hot loops are done, so wait for room rather than dropping the last batch
+            self.pending.put(batch)
+        self.pending.put(None)
+        self.writer.join()
+        try:
+            self.sink.close()
+        except Exception as err:
+            print("ERROR CLOSING AUDIT SINK ==> ", err)
+        return self.get_stats()
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return dict(self.stats)
+
+
+__audit_log: Optional[AuditLog] = None
+
+
+def is_running_in_cloud() -> bool:
+    """Whether this runs on Cloud Functions or Cloud Run, which set these variables."""
+    return bool(os.getenv('K_SERVICE') or os.getenv('FUNCTION_TARGET'))
+
+
+def create_audit_sink(entry_point: str, run_id: str) -> Optional[AuditSink]:
+    """
+    The sink configured for a run: one object per run in the AUDIT_LOG_BUCKET Cloud Storage bucket
+    when AUDIT_STORE=gcs, stdout with AUDIT_STORE=stdout, none with AUDIT_STORE=none, or a file under
+    AUDIT_DIR with AUDIT_STORE=file. AUDIT_STORE defaults to gcs when AUDIT_LOG_BUCKET is set.
+    Otherwise, and when gcs is asked for without a bucket, deployed functions (whose /tmp is lost
+    with the instance) use stdout and local runs a file. The bucket has to be named explicitly so the
+    log never lands next to the workspace secrets.
+    """
+    bucket_name = os.getenv('AUDIT_LOG_BUCKET')
+    fallback_store = 'stdout' if is_running_in_cloud() else 'file'
+    store = os.getenv('AUDIT_STORE') or ('gcs' if bucket_name else fallback_store)
+    if store == 'none':
+        return None
+    if store == 'gcs' and not bucket_name:
+        print(f"AUDIT_STORE=gcs WITHOUT AUDIT_LOG_BUCKET, WRITING THE AUDIT LOG TO {fallback_store.upper()}")
+        store = fallback_store
+    started = datetime.now(timezone.utc)
+    name = f"{started:%Y-%m-%d}/{entry_point}-{started:%H%M%S}-{run_id}.ndjson.gz"
+    if store == 'gcs':
+        return GCSAuditSink(bucket_name, f"audit/{name}")
+    if store == 'stdout':
+        return StdoutAuditSink()
+    return FileAuditSink(os.path.join(os.getenv('AUDIT_DIR', '/tmp/notion-audit'), name))
+
+
+@contextmanager
+def start_audit(entry_point: str):
+    """Collect the `audit()` records of the block and write them out when it exits; yields the AuditLog or None."""
+    global __audit_log
+    run_id = uuid.uuid4().hex[:12]
+    try:
+        sink = create_audit_sink(entry_point, run_id)
+    except Exception as err:
+        print("ERROR CREATING AUDIT SINK ==> ", err)
+        sink = None
+    audit_log = __audit_log = AuditLog(sink, run_id) if sink else None
+    try:
+        yield audit_log
+    finally:
+        __audit_log = None
+        if audit_log is not None:
+            stats = audit_log.close()
+            if stats['dropped'] or stats['failed']:
+                print("AUDIT RECORDS LOST ==> ", stats)
+
+
+def audit(event: str, **fields):
+    """Record what an automation did; a no-op outside of `start_audit`."""
+    if __audit_log is not None:
+        __audit_log.record(event, **fields)
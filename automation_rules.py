@@ -0,0 +1,441 @@
+"""Per-page automations run by the rule engine, each with a sync and an async implementation."""
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from notion_page_handler import (
+    STALE_ASSIGNEE_COMMENT, STALE_OWNER_COMMENT, MISSING_KPI_COMMENT, get_block_text_with_full_stop,
+    ends_with_full_stop, get_days_since, is_past_due
+)
+from relation_resolver import RelationResolver, AsyncRelationResolver
+from json_store import get_json_store
+from nudge_ledger import load_nudge_ledger
+from audit_log import audit
+from name_classifier import name_check_stats
+from notion_filters import checkbox_equals, status_or_empty_filter, missing_kpi_and_checklist_filter
+
+def wait_for_writes(project_handler):
+    """Wait until the writes buffered so far were sent, so their nudges are confirmed in the ledger."""
+    if project_handler.mutation_queue is not None:
+        project_handler.mutation_queue.wait()
+
+
+async def wait_for_writes_async(project_handler):
+    if project_handler.mutation_queue is not None:
+        await project_handler.mutation_queue.wait()
+
+
+# A new or restored page can be acted on by every rule
+TRIGGER_ALL_EVENT_TYPES = {'page.created', 'page.undeleted', 'page.moved'}
+
+
+class Rule:
+    """
+    An automation evaluated against every page of a database scan.
+
+    `apply` receives a NotionPageHandler and a NotionProjectHandler; `apply_async` receives
+    their async counterparts. Rules re-check their own conditions in `apply`, because the
+    engine scans the union of every selected rule's query filter.
+    """
+    name: str = None
+    # Time-based rules can fire on pages nobody edited, so incremental runs recheck them from a due-date index
+    time_based: bool = False
+    # Properties whose changes can make the rule act on a page, and whether content edits can; for webhook events
+    watched_properties: tuple = ()
+    watches_content: bool = False
+    # Properties the rule reads, so queries and retrieves can leave the others out; None reads every property
+    read_properties: Optional[tuple] = None
+    # Whether the rule mentions or assigns people, whom the workspace's user directory is needed to check
+    targets_users: bool = False
+
+    def applies_to_database(self, properties: Dict) -> bool:
+        """Whether the rule is relevant for a database with this property schema."""
+        return True
+
+    def get_query_filter(self, properties: Dict) -> Optional[Dict]:
+        """Server-side filter narrowing the pages this rule looks at; None means every page."""
+        return None
+
+    def is_triggered_by(self, event_types, property_names: Optional[set]) -> bool:
+        """
+        Whether a page's change events can make the rule act on it.
+
+        :param event_types: Webhook event types, e.g. "page.properties_updated".
+        :param property_names: Names of the updated properties; None when unknown.
+        """
+        if TRIGGER_ALL_EVENT_TYPES.intersection(event_types):
+            return True
+        if self.watches_content and 'page.content_updated' in event_types:
+            return True
+        if 'page.properties_updated' in event_types:
+            return property_names is None or not property_names.isdisjoint(self.watched_properties)
+        return False
+
+    def get_due_index_entry(self, page_handler) -> Optional[Dict]:
+        """What an incremental run must remember to recheck the page later without a scan; None to forget it."""
+        return None
+
+    def is_due_for_recheck(self, entry: Dict, now: datetime = None) -> bool:
+        return False
+
+    def prepare(self, project_handler):
+        pass
+
+    async def prepare_async(self, project_handler):
+        pass
+
+    def apply(self, page_handler, project_handler):
+        raise NotImplementedError
+
+    async def apply_async(self, page_handler, project_handler):
+        raise NotImplementedError
+
+    def finish(self, project_handler):
+        """Called once after the scan, for rules that batch work across pages."""
+        pass
+
+    async def finish_async(self, project_handler):
+        pass
+
+
+class ProjectNamingRule(Rule):
+    """Checks project names against the naming convention, in batches, and renames the invalid ones."""
+    name = 'naming'
+    watched_properties = ('Project name', 'title checked')
+    read_properties = ('Project name', 'title checked')
+
+    def get_query_filter(self, properties: Dict) -> Optional[Dict]:
+        return checkbox_equals("title checked", False)
+
+    def prepare(self, project_handler):
+        # A no-op when the schema the engine retrieved already has the checkbox
+        project_handler.add_title_checkbox_to_database_schema()
+
+    async def prepare_async(self, project_handler):
+        await project_handler.add_title_checkbox_to_database_schema()
+
+    def apply(self, page_handler, project_handler):
+        project_handler.queue_project_name_check(page_handler.page)
+
+    async def apply_async(self, page_handler, project_handler):
+        await project_handler.queue_project_name_check(page_handler.page)
+
+    def finish(self, project_handler):
+        project_handler.flush_project_name_checks()
+        project_handler.save_name_verdicts()
+        print("NAME CHECKS BY TIER ==> ", name_check_stats.get_report())
+
+    async def finish_async(self, project_handler):
+        await project_handler.flush_project_name_checks()
+        project_handler.save_name_verdicts()
+        print("NAME CHECKS BY TIER ==> ", name_check_stats.get_report())
+
+
+class AssigneeBackfillRule(Rule):
+    """Assigns in-progress pages without an assignee to their last editor."""
+    name = 'assignee'
+    watched_properties = ('Status', 'Assignee')
+    read_properties = ('Status', 'Assignee')
+    targets_users = True
+
+    def get_query_filter(self, properties: Dict) -> Optional[Dict]:
+        return status_or_empty_filter(properties, 'In progress')
+
+    def __get_user_to_assign(self, page_handler):
+        status = page_handler.get_page_status()
+        if status and (status != 'in-progress'):
+            return None
+        assignee_data = page_handler.get_page_assignees()
+        if len(assignee_data) > 0:
+            return None
+        last_editor_id = page_handler.page.last_edited_by_id
+        # Pages last edited by an integration (these automations included) or a guest are left alone
+        if not last_editor_id or not page_handler.is_valid_user(last_editor_id):
+            return None
+        print("SETTING ASSIGNEE")
+        audit('assignee_backfilled', page_id=page_handler.page_id, user_id=last_editor_id)
+        return page_handler.get_page_last_editor_id()
+
+    def apply(self, page_handler, project_handler):
+        last_editor_id = self.__get_user_to_assign(page_handler)
+        if last_editor_id:
+            page_handler.assign_user_to_page(last_editor_id)
+
+    async def apply_async(self, page_handler, project_handler):
+        last_editor_id = self.__get_user_to_assign(page_handler)
+        if last_editor_id:
+            await page_handler.assign_user_to_page(last_editor_id)
+
+
+class StaleTaskNudgeRule(Rule):
+    """Nudges the assignees, or the owner, of not-started tasks that are stale or overdue."""
+    name = 'nudge'
+    time_based = True
+    watched_properties = ('Status', 'Assignee', 'Created Date')
+    read_properties = ('Status', 'Assignee', 'Created Date')
+    targets_users = True
+    stale_after_days = 14
+
+    def __init__(self):
+        self.ledger = None
+
+    def prepare(self, project_handler):
+        # People already nudged about a page are left alone until their cooldown has passed
+        self.ledger = load_nudge_ledger(project_handler.database_id, self.name)
+
+    async def prepare_async(self, project_handler):
+        self.prepare(project_handler)
+
+    def finish(self, project_handler):
+        if self.ledger is not None:
+            wait_for_writes(project_handler)
+            self.ledger.save()
+
+    async def finish_async(self, project_handler):
+        if self.ledger is not None:
+            await wait_for_writes_async(project_handler)
+            self.ledger.save()
+
+    def get_query_filter(self, properties: Dict) -> Optional[Dict]:
+        return status_or_empty_filter(properties, 'Not started')
+
+    def __has_nudgeable_status(self, page_handler) -> bool:
+        status = page_handler.get_page_status()
+        return not status or status == 'Not started'
+
+    def __needs_nudge(self, page_handler) -> bool:
+        if not self.__has_nudgeable_status(page_handler):
+            return False
+        stale_period = page_handler.get_days_since_last_edit()
+        is_due = page_handler.check_if_task_is_due()
+        return stale_period > self.stale_after_days or is_due
+
+    def get_due_index_entry(self, page_handler) -> Optional[Dict]:
+        last_edited_time = page_handler.page.last_edited_time
+        if not last_edited_time or not self.__has_nudgeable_status(page_handler):
+            return None
+        return {"last_edited_time": last_edited_time, "due": page_handler.get_page_due_date()}
+
+    def is_due_for_recheck(self, entry: Dict, now: datetime = None) -> bool:
+        return get_days_since(entry["last_edited_time"], now) > self.stale_after_days or is_past_due(entry["due"], now)
+
+    def __get_nudges(self, page_handler) -> Tuple[List[str], Optional[str]]:
+        """The people due a nudge about the page (its assignees, or else its owner) and the comment for them."""
+        if not self.__needs_nudge(page_handler):
+            self.ledger.forget(page_handler.page_id)
+            return [], None
+        assignees = page_handler.get_page_assignees()
+        if assignees:
+            recipient_ids, comment = [assignee['id'] for assignee in assignees], STALE_ASSIGNEE_COMMENT
+        else:
+            owner = page_handler.get_page_owner()
+            recipient_ids, comment = [owner['id']] if owner else [], STALE_OWNER_COMMENT
+        recipient_ids = [recipient_id for recipient_id in recipient_ids if page_handler.is_valid_user(recipient_id)]
+        recipient_ids = self.ledger.take_due(page_handler.page_id, recipient_ids)
+        if recipient_ids:
+            print("NUDGING ASSIGNEE" if assignees else "NUDGING PROJECT OWNER")
+            audit('stale_task_nudged', page_id=page_handler.page_id, recipient_ids=recipient_ids,
+                  target='assignees' if assignees else 'owner', due_date=page_handler.get_page_due_date(),
+                  days_since_last_edit=page_handler.get_days_since_last_edit())
+        return recipient_ids, comment
+
+    def apply(self, page_handler, project_handler):
+        recipient_ids, comment = self.__get_nudges(page_handler)
+        for recipient_id in recipient_ids:
+            page_handler.mention_and_comment(recipient_id, comment,
+                                             partial(self.ledger.confirm, page_handler.page_id, recipient_id))
+
+    async def apply_async(self, page_handler, project_handler):
+        recipient_ids, comment = self.__get_nudges(page_handler)
+        for recipient_id in recipient_ids:
+            await page_handler.mention_and_comment(recipient_id, comment,
+                                                   partial(self.ledger.confirm, page_handler.page_id, recipient_id))
+
+
+class KpiChecklistRule(Rule):
+    """Asks the people assigned to an accountability's roles to attach a KPI or a checklist."""
+    name = 'kpi'
+    watched_properties = ('Accountability', 'KPI', 'Checklist', 'Roles')
+    read_properties = ('Accountability', 'KPI', 'Checklist', 'Roles')
+    targets_users = True
+
+    def __init__(self, batch_size: int = 50):
+        self.batch_size = batch_size
+        self.pending = []
+        self.relation_resolver = None
+        self.async_relation_resolver = None
+        self.ledger = None
+
+    def applies_to_database(self, properties: Dict) -> bool:
+        # An empty schema means it could not be retrieved, so fall back to checking each page
+        return not properties or 'Accountability' in properties
+
+    def get_query_filter(self, properties: Dict) -> Optional[Dict]:
+        return missing_kpi_and_checklist_filter(properties)
+
+    def __get_role_ids(self, page_handler) -> tuple:
+        if not page_handler.page.has_accountability:
+            return ()
+        if page_handler.check_for_checklist_or_kpi():
+            return ()
+        return page_handler.page.role_ids
+
+    def prepare(self, project_handler):
+        self.ledger = load_nudge_ledger(project_handler.database_id, self.name)
+
+    async def prepare_async(self, project_handler):
+        self.prepare(project_handler)
+
+    def __get_due_recipients(self, page_handler, assignees) -> List[str]:
+        recipient_ids = self.ledger.take_due(page_handler.page_id, [
+            assignee['id'] for assignee in assignees if page_handler.is_valid_user(assignee['id'])
+        ])
+        for _ in recipient_ids:
+            print('TAGGING THE ASSIGNEE AND COMMENTING...')
+        if recipient_ids:
+            audit('missing_kpi_nudged', page_id=page_handler.page_id, recipient_ids=recipient_ids,
+                  role_ids=list(page_handler.page.role_ids))
+        return recipient_ids
+
+    def apply(self, page_handler, project_handler):
+        role_ids = self.__get_role_ids(page_handler)
+        if not role_ids:
+            self.ledger.forget(page_handler.page_id)
+            return
+        # Pages are handled in batches so the roles they link to can be retrieved together
+        self.pending.append((page_handler, role_ids))
+        if len(self.pending) >= self.batch_size:
+            self.__flush(project_handler)
+
+    def finish(self, project_handler):
+        self.__flush(project_handler)
+        if self.ledger is not None:
+            wait_for_writes(project_handler)
+            self.ledger.save()
+
+    async def finish_async(self, project_handler):
+        if self.ledger is not None:
+            await wait_for_writes_async(project_handler)
+            self.ledger.save()
+
+    def __flush(self, project_handler):
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        if self.relation_resolver is None:
+            self.relation_resolver = RelationResolver(project_handler.workspace['token'])
+        self.relation_resolver.prefetch(role_id for _, role_ids in pending for role_id in role_ids)
+        for page_handler, role_ids in pending:
+            assignees = [assignee for role_id in role_ids
+                         for assignee in self.relation_resolver.get_assigned_to(role_id) or []]
+            for recipient_id in self.__get_due_recipients(page_handler, assignees):
+                page_handler.mention_and_comment(recipient_id, MISSING_KPI_COMMENT,
+                                                 partial(self.ledger.confirm, page_handler.page_id, recipient_id))
+            # The engine already flushed the page, so send its merged comment now
+            page_handler.flush_writes()
+
+    async def apply_async(self, page_handler, project_handler):
+        role_ids = self.__get_role_ids(page_handler)
+        if not role_ids:
+            self.ledger.forget(page_handler.page_id)
+            return
+        if self.async_relation_resolver is None:
+            self.async_relation_resolver = AsyncRelationResolver(page_handler.notion_client)
+        assignees = [assignee for role_id in role_ids
+                     for assignee in await self.async_relation_resolver.get_assigned_to(role_id) or []]
+        for recipient_id in self.__get_due_recipients(page_handler, assignees):
+            await page_handler.mention_and_comment(recipient_id, MISSING_KPI_COMMENT,
+                                                   partial(self.ledger.confirm, page_handler.page_id, recipient_id))
+
+
+class FullStopRule(Rule):
+    """
+    Ends the content of every page with a full stop.
+
+    Only the last block of a page is kept while its blocks are paged through. Pages found already
+    ending with a full stop are remembered with their `last_edited_time`, so later runs skip them
+    until they are edited again.
+    """
+    name = 'full_stop'
+    watches_content = True
+    # Only the page's content and its `last_edited_time`
+    read_properties = ()
+
+    def __init__(self):
+        self.store = None
+        self.key = None
+        self.checked_pages: Dict[str, str] = {}
+
+    def prepare(self, project_handler):
+        self.store = get_json_store('block_scan')
+        self.key = f"{project_handler.database_id}:{self.name}"
+        self.checked_pages = self.store.load(self.key).get('checked_pages', {})
+
+    async def prepare_async(self, project_handler):
+        self.prepare(project_handler)
+
+    def finish(self, project_handler):
+        if self.store is None:
+            return
+        try:
+            self.store.save(self.key, {'checked_pages': self.checked_pages})
+        except Exception as err:
+            print("ERROR SAVING CHECKED PAGES ==> ", err)
+
+    async def finish_async(self, project_handler):
+        self.finish(project_handler)
+
+    def __is_unchanged(self, page_handler) -> bool:
+        last_edited_time = page_handler.page.last_edited_time
+        return bool(last_edited_time) and self.checked_pages.get(page_handler.page_id) == last_edited_time
+
+    def __remember_checked(self, page_handler):
+        # Pages that get a full stop are not remembered: the edit changes their last_edited_time anyway
+        last_edited_time = page_handler.page.last_edited_time
+        if last_edited_time:
+            self.checked_pages[page_handler.page_id] = last_edited_time
+
+    def __get_last_block_update(self, last_block: dict):
+        """Return (block_id, block_type, updated_text); updated_text is None when a new block must be added."""
+        return last_block.get("id"), last_block.get("type"), get_block_text_with_full_stop(last_block)
+
+    def apply(self, page_handler, project_handler):
+        if self.__is_unchanged(page_handler):
+            return
+        blocks = page_handler.get_last_page_blocks()
+        if not blocks or ends_with_full_stop(blocks[-1]):
+            self.__remember_checked(page_handler)
+            return
+        block_id, block_type, updated_text = self.__get_last_block_update(blocks[-1])
+        audit('full_stop_added', page_id=page_handler.page_id, block_id=block_id, new_block=updated_text is None)
+        if updated_text is not None:
+            page_handler.update_block_text(block_id, block_type, updated_text)
+        else:
+            page_handler.add_new_text_block(".")
+            print(f"Added a new text block below the last block ID: {block_id}")
+
+    async def apply_async(self, page_handler, project_handler):
+        if self.__is_unchanged(page_handler):
+            return
+        blocks = await page_handler.get_last_page_blocks()
+        if not blocks or ends_with_full_stop(blocks[-1]):
+            self.__remember_checked(page_handler)
+            return
+        block_id, block_type, updated_text = self.__get_last_block_update(blocks[-1])
+        audit('full_stop_added', page_id=page_handler.page_id, block_id=block_id, new_block=updated_text is None)
+        if updated_text is not None:
+            await page_handler.update_block_text(block_id, block_type, updated_text)
+        else:
+            await page_handler.add_new_text_block(".")
+            print(f"Added a new text block below the last block ID: {block_id}")
+
+
+# Rules keep per-run state (batches, memoized lookups), so the engine builds fresh instances for every run
+RULES: Dict[str, type] = {
+    rule.name: rule for rule in [
+        ProjectNamingRule,
+        AssigneeBackfillRule,
+        StaleTaskNudgeRule,
+        KpiChecklistRule,
+        FullStopRule,
+    ]
+}
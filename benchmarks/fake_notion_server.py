@@ -0,0 +1,646 @@
+"""
+Local stand-in for the Notion API, for offline benchmarks.
+
+It serves the endpoints the automations use: database retrieve/update/query (filters, sorts and
+pagination), page retrieve/update, comments, block children list/append, block update and users.
+It also answers Anthropic's messages endpoint so project-name checks can run offline.
+
+Pages and blocks are generated deterministically from their index, so a workspace of 100k pages
+costs little memory; only writes are stored. Latency and 429 responses can be injected, and every
+request is counted per endpoint, with status codes and bytes transferred.
+
+    python benchmarks/fake_notion_server.py --pages 10000 --port 8765
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+PAGE_KIND, ROLE_KIND, BLOCK_KIND, USER_KIND, DATABASE_KIND = 1, 2, 3, 4, 5
+STATUSES = [
+    {"id": "not-started", "name": "Not started", "color": "default"},
+    {"id": "in-progress", "name": "In progress", "color": "blue"},
+    {"id": "done", "name": "Done", "color": "green"},
+]
+NOUNS = ["drawer", "invoice backlog", "onboarding docs", "release notes", "supplies", "budget", "website copy",
+         "hiring plan", "sales deck", "customer survey", "office move", "newsletter", "pricing page", "roadmap"]
+PARTICIPLES = ["stocked", "organized", "published", "approved", "written", "sent", "reviewed", "updated"]
+IMPERATIVES = ["Fix", "Update", "Write", "Review", "Prepare", "Organize", "Plan", "Send"]
+EXTRA_PROPERTY_KINDS = ["formula", "rollup", "rich_text"]
+MAX_QUERY_SNAPSHOTS = 16
+ID_PATTERN = re.compile(r'[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}')
+
+
+def make_id(kind: int, seed: int, index: int) -> str:
+    return str(uuid.UUID(int=(kind << 120) | ((seed & 0xFFFFFFFFFFFF) << 64) | index))
+
+
+def parse_id(object_id: str) -> Tuple[int, int]:
+    """:return: (kind, index) of an id built by `make_id`, dashed or not."""
+    value = uuid.UUID(object_id).int
+    return value >> 120, value & 0xFFFFFFFFFFFFFFFF
+
+
+def format_timestamp(moment: datetime) -> str:
+    # Notion timestamps are minute-granular
+    return moment.replace(second=0, microsecond=0).strftime('%Y-%m-%dT%H:%M:00.000Z')
+
+
+class SyntheticWorkspace:
+    """
+    One synthetic Notion database of `pages` projects, linked to role pages and a pool of users.
+
+    A page is rebuilt from its index on every read and then overlaid with the writes made to it.
+    """
+
+    def __init__(self, pages: int = 10000, seed: int = 0, users: int = 50, pages_per_role: int = 50,
+                 max_blocks: int = 300, extra_properties: int = 0):
+        """
+        :param extra_properties: Columns the automations never read (formulas, rollups, notes) added
+            to every project, as real databases have plenty of them.
+        """
+        self.page_count = pages
+        self.seed = seed
+        self.user_count = users
+        self.role_count = max(1, pages // pages_per_role)
+        self.max_blocks = max_blocks
+        self.extra_properties = extra_properties
+        self.database_id = make_id(DATABASE_KIND, seed, 0)
+        self.now = datetime.now(timezone.utc)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every write, going back to the seeded state."""
+        with self.lock:
+            self.page_writes: Dict[str, Dict] = {}
+            self.block_writes: Dict[str, Dict] = {}
+            self.appended_blocks: Dict[str, List[Dict]] = {}
+            self.comments: Dict[str, List[Dict]] = {}
+            self.schema_writes: Dict[str, Dict] = {}
+
+    def __user(self, index: int) -> Dict:
+        return {"object": "user", "id": make_id(USER_KIND, self.seed, index)}
+
+    def get_user(self, index: int) -> Dict:
+        user = self.__user(index)
+        if index % 10 == 9:
+            user.update({"type": "bot", "name": f"Bot {index}", "bot": {}})
+        else:
+            user.update({"type": "person", "name": f"User {index}",
+                         "person": {"email": f"user{index}@example.com"}})
+        return user
+
+    def get_database(self) -> Dict:
+        properties = {
+            "Project name": {"id": "title", "type": "title", "title": {}},
+            "title checked": {"id": "title-checked", "type": "checkbox", "checkbox": {}},
+            "Status": {"id": "status", "type": "status", "status": {"options": STATUSES}},
+            "Assignee": {"id": "assignee", "type": "people", "people": {}},
+            "Assigned To": {"id": "assigned-to", "type": "people", "people": {}},
+            "Created Date": {"id": "created-date", "type": "date", "date": {}},
+            "Accountability": {"id": "accountability", "type": "rich_text", "rich_text": {}},
+            "KPI": {"id": "kpi", "type": "relation", "relation": {}},
+            "Checklist": {"id": "checklist", "type": "relation", "relation": {}},
+            "Roles": {"id": "roles", "type": "relation", "relation": {}},
+        }
+        for index in range(self.extra_properties):
+            kind = EXTRA_PROPERTY_KINDS[index % len(EXTRA_PROPERTY_KINDS)]
+            properties[f"{kind.capitalize()} {index}"] = {"id": f"extra-{index}", "type": kind, kind: {}}
+        for name, value in self.schema_writes.items():
+            # Updating a property keeps its id; new ones get an id of their own
+            properties[name] = dict(properties.get(name) or {"id": name.lower().replace(" ", "-")}, **value)
+        return {"object": "database", "id": self.database_id, "title": [], "properties": properties}
+
+    def __project_name(self, rng: random.Random) -> str:
+        noun = rng.choice(NOUNS)
+        style = rng.random()
+        if style < 0.4:
+            return f"{noun.capitalize()} {'have' if noun.endswith('s') else 'has'} been {rng.choice(PARTICIPLES)}"
+        if style < 0.7:
+            return f"{rng.choice(IMPERATIVES)} {noun}"
+        return f"Q{rng.randint(1, 4)} {noun}"
+
+    def __build_page(self, index: int) -> Dict:
+        rng = random.Random(self.seed * 1_000_003 + index)
+        page_id = make_id(PAGE_KIND, self.seed, index)
+        created = self.now - timedelta(days=rng.randint(30, 400))
+        last_edited = self.now - timedelta(days=rng.randint(0, 60), minutes=rng.randint(0, 1440))
+        status = rng.choice(STATUSES + [None])
+        assignees = [self.__user(rng.randrange(self.user_count))] if rng.random() < 0.5 else []
+        due = self.now + timedelta(days=rng.randint(-30, 30))
+        has_kpi = rng.random() < 0.5
+        roles = [{"id": make_id(ROLE_KIND, self.seed, rng.randrange(self.role_count))}
+                 for _ in range(rng.randint(0, 2))]
+        name = self.__project_name(rng)
+        return {
+            "object": "page",
+            "id": page_id,
+            "created_time": format_timestamp(created),
+            "last_edited_time": format_timestamp(last_edited),
+            "created_by": self.__user(rng.randrange(self.user_count)),
+            "last_edited_by": self.__user(rng.randrange(self.user_count)),
+            "archived": False,
+            "parent": {"type": "database_id", "database_id": self.database_id},
+            "properties": {
+                "Project name": {"id": "title", "type": "title", "title": [
+                    {"type": "text", "text": {"content": name}, "plain_text": name}
+                ]},
+                "title checked": {"id": "title-checked", "type": "checkbox", "checkbox": rng.random() < 0.3},
+                "Status": {"id": "status", "type": "status", "status": status},
+                "Assignee": {"id": "assignee", "type": "people", "people": assignees},
+                "Assigned To": {"id": "assigned-to", "type": "people", "people": []},
+                "Created Date": {"id": "created-date", "type": "date", "date": {
+                    "start": (due - timedelta(days=14)).strftime('%Y-%m-%d'), "end": due.strftime('%Y-%m-%d')
+                }},
+                "Accountability": {"id": "accountability", "type": "rich_text", "rich_text": []},
+                "KPI": {"id": "kpi", "type": "relation",
+                        "relation": [{"id": make_id(ROLE_KIND, self.seed, 0)}] if has_kpi else []},
+                "Checklist": {"id": "checklist", "type": "relation", "relation": []},
+                "Roles": {"id": "roles", "type": "relation", "relation": roles},
+                **self.__build_extra_properties(rng, name),
+            },
+        }
+
+    def __build_extra_properties(self, rng: random.Random, name: str) -> Dict:
+        properties = {}
+        for index in range(self.extra_properties):
+            kind = EXTRA_PROPERTY_KINDS[index % len(EXTRA_PROPERTY_KINDS)]
+            if kind == "formula":
+                value = {"type": "string", "string": f"{name} / {rng.randint(0, 10 ** 6)}"}
+            elif kind == "rollup":
+                value = {"type": "array", "function": "show_original", "array": [
+                    {"type": "number", "number": rng.randint(0, 1000)} for _ in range(rng.randint(1, 4))
+                ]}
+            else:
+                notes = f"Notes on {name}: {rng.choice(NOUNS)}"
+                value = [{"type": "text", "text": {"content": notes, "link": None}, "annotations": {
+                    "bold": False, "italic": False, "strikethrough": False, "underline": False, "code": False,
+                    "color": "default"}, "plain_text": notes, "href": None}]
+            properties[f"{kind.capitalize()} {index}"] = {"id": f"extra-{index}", "type": kind, kind: value}
+        return properties
+
+    def __build_role(self, index: int) -> Dict:
+        rng = random.Random(self.seed * 2_000_003 + index)
+        return {
+            "object": "page",
+            "id": make_id(ROLE_KIND, self.seed, index),
+            "created_time": format_timestamp(self.now - timedelta(days=400)),
+            "last_edited_time": format_timestamp(self.now - timedelta(days=100)),
+            "created_by": self.__user(0),
+            "last_edited_by": self.__user(0),
+            "archived": False,
+            "properties": {
+                "Name": {"id": "title", "type": "title", "title": [
+                    {"type": "text", "text": {"content": f"Role {index}"}, "plain_text": f"Role {index}"}
+                ]},
+                "Assigned To": {"id": "assigned-to", "type": "people", "people": [
+                    self.__user(rng.randrange(self.user_count)) for _ in range(rng.randint(1, 3))
+                ]},
+            },
+        }
+
+    def get_page(self, page_id: str) -> Optional[Dict]:
+        try:
+            kind, index = parse_id(page_id)
+        except ValueError:
+            return None
+        if kind == PAGE_KIND and index < self.page_count:
+            page = self.__build_page(index)
+        elif kind == ROLE_KIND and index < self.role_count:
+            page = self.__build_role(index)
+        else:
+            return None
+        writes = self.page_writes.get(page['id'])
+        if writes:
+            page['properties'].update(writes['properties'])
+            page['last_edited_time'] = writes['last_edited_time']
+        return page
+
+    def iter_pages(self) -> Iterator[Dict]:
+        for index in range(self.page_count):
+            yield self.get_page(make_id(PAGE_KIND, self.seed, index))
+
+    def __touch(self, page_id: str) -> Dict:
+        writes = self.page_writes.setdefault(page_id, {"properties": {}})
+        writes['last_edited_time'] = format_timestamp(datetime.now(timezone.utc))
+        return writes
+
+    def update_page(self, page_id: str, properties: Dict) -> Optional[Dict]:
+        page = self.get_page(page_id)
+        if page is None:
+            return None
+        with self.lock:
+            writes = self.__touch(page['id'])
+            for name, value in properties.items():
+                writes['properties'][name] = {"id": name, "type": next(iter(value), None), **value}
+        return self.get_page(page_id)
+
+    def add_comment(self, page_id: str, rich_text: List[Dict]) -> Optional[Dict]:
+        page = self.get_page(page_id)
+        if page is None:
+            return None
+        comment = {"object": "comment", "id": str(uuid.uuid4()), "parent": {"type": "page_id", "page_id": page['id']},
+                   "rich_text": rich_text}
+        with self.lock:
+            self.comments.setdefault(page['id'], []).append(comment)
+        return comment
+
+    def __block_count(self, page_index: int) -> int:
+        rng = random.Random(self.seed * 3_000_017 + page_index)
+        # Most pages are short; one in ten is a long meeting-notes page
+        return rng.randint(50, self.max_blocks) if rng.random() < 0.1 else rng.randint(0, 20)
+
+    def __build_block(self, page_index: int, position: int) -> Dict:
+        rng = random.Random(self.seed * 4_000_037 + page_index * 65536 + position)
+        block_id = make_id(BLOCK_KIND, self.seed, (page_index << 16) | position)
+        text = f"Line {position} of the notes" + ("." if rng.random() < 0.5 else "")
+        block = {"object": "block", "id": block_id, "type": "paragraph", "has_children": False,
+                 "paragraph": {"rich_text": [{"type": "text", "text": {"content": text}, "plain_text": text}]}}
+        block.update(self.block_writes.get(block_id, {}))
+        return block
+
+    def get_blocks(self, page_id: str) -> Optional[List[Dict]]:
+        try:
+            kind, index = parse_id(page_id)
+        except ValueError:
+            return None
+        if kind != PAGE_KIND or index >= self.page_count:
+            return None
+        blocks = [self.__build_block(index, position) for position in range(self.__block_count(index))]
+        return blocks + self.appended_blocks.get(make_id(PAGE_KIND, self.seed, index), [])
+
+    def append_blocks(self, page_id: str, children: List[Dict]) -> Optional[List[Dict]]:
+        if self.get_blocks(page_id) is None:
+            return None
+        page_id = str(uuid.UUID(page_id))
+        blocks = [dict(child, id=str(uuid.uuid4()), has_children=False) for child in children]
+        with self.lock:
+            self.appended_blocks.setdefault(page_id, []).extend(blocks)
+            self.__touch(page_id)
+        return blocks
+
+    def update_block(self, block_id: str, body: Dict) -> Optional[Dict]:
+        try:
+            kind, index = parse_id(block_id)
+        except ValueError:
+            return None
+        if kind != BLOCK_KIND:
+            return None
+        page_index, position = index >> 16, index & 0xFFFF
+        with self.lock:
+            self.block_writes[str(uuid.UUID(block_id))] = body
+            self.__touch(make_id(PAGE_KIND, self.seed, page_index))
+        return self.__build_block(page_index, position)
+
+
+def matches_filter(page: Dict, query_filter: Optional[Dict]) -> bool:
+    """Evaluate the subset of Notion's filter language the automations use."""
+    if not query_filter:
+        return True
+    if "or" in query_filter:
+        return any(matches_filter(page, f) for f in query_filter["or"])
+    if "and" in query_filter:
+        return all(matches_filter(page, f) for f in query_filter["and"])
+    if query_filter.get("timestamp"):
+        timestamp = query_filter["timestamp"]
+        condition = query_filter[timestamp]
+        value = page.get(timestamp, "")
+        if "on_or_after" in condition:
+            return value >= condition["on_or_after"]
+        if "after" in condition:
+            return value > condition["after"]
+        if "before" in condition:
+            return value < condition["before"]
+        return True
+
+    prop = page["properties"].get(query_filter.get("property"), {})
+    for kind in ("status", "checkbox", "relation", "people", "select"):
+        if kind not in query_filter:
+            continue
+        condition = query_filter[kind]
+        value = prop.get(kind)
+        if kind == "status" or kind == "select":
+            name = value.get("name") if value else None
+            if condition.get("is_empty"):
+                return name is None
+            if condition.get("is_not_empty"):
+                return name is not None
+            if "equals" in condition:
+                return name == condition["equals"]
+            if "does_not_equal" in condition:
+                return name != condition["does_not_equal"]
+        if kind == "checkbox":
+            return bool(value) == condition.get("equals", bool(value))
+        if kind in ("relation", "people"):
+            if condition.get("is_empty"):
+                return not value
+            if condition.get("is_not_empty"):
+                return bool(value)
+            if "contains" in condition:
+                return any(item["id"] == condition["contains"] for item in value or [])
+    return True
+
+
+def sort_pages(pages: List[Dict], sorts: Optional[List[Dict]]) -> List[Dict]:
+    for sort in reversed(sorts or []):
+        key = sort.get("timestamp")
+        if key:
+            pages.sort(key=lambda page: page.get(key, ""), reverse=sort.get("direction") == "descending")
+    return pages
+
+
+def select_properties(page: Dict, property_ids: List[str]) -> Dict:
+    if not property_ids:
+        return page
+    wanted = set(property_ids)
+    properties = {name: value for name, value in page["properties"].items() if name in wanted or value.get("id") in wanted}
+    return dict(page, properties=properties)
+
+
+def answer_naming_prompt(prompt: str) -> str:
+    """Canned Claude answer: names with "is"/"are"/"has been"/"have been" are valid."""
+    def verdict(name: str) -> Tuple[str, str]:
+        if re.search(r'\s(?:is|are|has been|have been)\s', f" {name.lower()} "):
+            return "valid", name
+        return "invalid", f"{name} is done"
+
+    batch = re.search(r'numbered from 1:\s*(\[.*?\])\s*\n', prompt, re.S)
+    if batch:
+        names = json.loads(batch.group(1))
+        return json.dumps([
+            {"index": index, "verdict": verdict(name)[0], "suggestion": verdict(name)[1]}
+            for index, name in enumerate(names, start=1)
+        ])
+    single = re.search(r'naming convention: "(.*)"', prompt)
+    result, suggestion = verdict(single.group(1) if single else "")
+    return f"{result}\n{suggestion}"
+
+
+class FakeNotionServer:
+    """Threaded HTTP server around a SyntheticWorkspace, with fault injection and per-endpoint counters."""
+
+    def __init__(self, workspace: SyntheticWorkspace, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, rate_limit_probability: float = 0.0, retry_after: float = 0.05):
+        self.workspace = workspace
+        self.latency = latency
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.random = random.Random(workspace.seed)
+        self.stats_lock = threading.Lock()
+        self.snapshots: "OrderedDict[str, List[str]]" = OrderedDict()
+        self.reset_stats()
+        self.httpd = ThreadingHTTPServer((host, port), self.__make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.calls = Counter()
+            self.statuses = Counter()
+            self.bytes_received = 0
+            self.bytes_sent = 0
+            self.rate_limited = 0
+
+    def get_stats(self) -> Dict:
+        with self.stats_lock:
+            return {
+                "calls": dict(self.calls),
+                "statuses": {str(status): count for status, count in self.statuses.items()},
+                "requests": sum(self.calls.values()),
+                "rate_limited": self.rate_limited,
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+            }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def record(self, endpoint: str, status: int, received: int, sent: int):
+        with self.stats_lock:
+            self.calls[endpoint] += 1
+            self.statuses[status] += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def __query(self, body: Dict, property_ids: List[str]) -> Dict:
+        page_size = min(int(body.get("page_size") or 100), 100)
+        cursor = body.get("start_cursor")
+        if cursor:
+            snapshot_key, offset = cursor.rsplit(":", 1)
+            page_ids = self.snapshots.get(snapshot_key)
+            if page_ids is None:
+                raise LookupError("cursor expired")
+            offset = int(offset)
+        else:
+            pages = [page for page in self.workspace.iter_pages() if matches_filter(page, body.get("filter"))]
+            page_ids = [page["id"] for page in sort_pages(pages, body.get("sorts"))]
+            snapshot_key = uuid.uuid4().hex
+            with self.stats_lock:
+                self.snapshots[snapshot_key] = page_ids
+                while len(self.snapshots) > MAX_QUERY_SNAPSHOTS:
+                    self.snapshots.popitem(last=False)
+            offset = 0
+
+        chunk = page_ids[offset:offset + page_size]
+        has_more = offset + page_size < len(page_ids)
+        return {
+            "object": "list",
+            "results": [select_properties(self.workspace.get_page(page_id), property_ids) for page_id in chunk],
+            "has_more": has_more,
+            "next_cursor": f"{snapshot_key}:{offset + page_size}" if has_more else None,
+            "type": "page_or_database",
+        }
+
+    def __paginate(self, items: List[Dict], params: Dict) -> Dict:
+        page_size = min(int(params.get("page_size", ["100"])[0]), 100)
+        offset = int(params.get("start_cursor", ["0"])[0] or 0)
+        has_more = offset + page_size < len(items)
+        return {"object": "list", "results": items[offset:offset + page_size], "has_more": has_more,
+                "next_cursor": str(offset + page_size) if has_more else None}
+
+    def handle(self, method: str, path: str, params: Dict, body: Dict) -> Tuple[str, int, Dict]:
+        """:return: (endpoint, status, response body)"""
+        workspace = self.workspace
+        parts = [part for part in path.split("/") if part][1:]  # drop the "v1" prefix
+        endpoint = f"{method} /v1/" + "/".join("{id}" if ID_PATTERN.fullmatch(part) else part for part in parts)
+
+        def not_found():
+            return endpoint, 404, {"object": "error", "status": 404, "code": "object_not_found",
+                                   "message": f"Could not find {path}"}
+
+        if parts == ["messages"] and method == "POST":
+            prompt = body["messages"][0]["content"]
+            text = answer_naming_prompt(prompt if isinstance(prompt, str) else prompt[0]["text"])
+            return endpoint, 200, {
+                "id": f"msg_{uuid.uuid4().hex}", "type": "message", "role": "assistant", "model": body.get("model"),
+                "content": [{"type": "text", "text": text}], "stop_reason": "end_turn", "stop_sequence": None,
+                "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4},
+            }
+
+        if parts[:1] == ["databases"] and len(parts) >= 2:
+            if parts[1].replace("-", "") != workspace.database_id.replace("-", ""):
+                return not_found()
+            if len(parts) == 3 and parts[2] == "query" and method == "POST":
+                try:
+                    return endpoint, 200, self.__query(body, params.get("filter_properties", []))
+                except LookupError:
+                    return endpoint, 400, {"object": "error", "status": 400, "code": "validation_error",
+                                           "message": "start_cursor is invalid"}
+            if len(parts) == 2 and method == "PATCH":
+                with workspace.lock:
+                    workspace.schema_writes.update(body.get("properties", {}))
+                return endpoint, 200, workspace.get_database()
+            if len(parts) == 2 and method == "GET":
+                return endpoint, 200, workspace.get_database()
+
+        if parts[:1] == ["pages"] and len(parts) == 2:
+            if method == "GET":
+                page = workspace.get_page(parts[1])
+            elif method == "PATCH":
+                page = workspace.update_page(parts[1], body.get("properties", {}))
+            else:
+                page = None
+            if page is None:
+                return not_found()
+            return endpoint, 200, select_properties(page, params.get("filter_properties", []))
+
+        if parts == ["comments"] and method == "POST":
+            comment = workspace.add_comment(body.get("parent", {}).get("page_id", ""), body.get("rich_text", []))
+            return (endpoint, 200, comment) if comment else not_found()
+
+        if parts[:1] == ["blocks"] and len(parts) == 3 and parts[2] == "children":
+            if method == "GET":
+                blocks = workspace.get_blocks(parts[1])
+                return (endpoint, 200, self.__paginate(blocks, params)) if blocks is not None else not_found()
+            if method == "PATCH":
+                blocks = workspace.append_blocks(parts[1], body.get("children", []))
+                return (endpoint, 200, {"object": "list", "results": blocks, "has_more": False,
+                                        "next_cursor": None}) if blocks is not None else not_found()
+        if parts[:1] == ["blocks"] and len(parts) == 2 and method == "PATCH":
+            block = workspace.update_block(parts[1], body)
+            return (endpoint, 200, block) if block else not_found()
+
+        if parts[:1] == ["users"]:
+            if len(parts) == 1 and method == "GET":
+                users = [workspace.get_user(index) for index in range(workspace.user_count)]
+                return endpoint, 200, self.__paginate(users, params)
+            if len(parts) == 2 and method == "GET":
+                kind, index = parse_id(parts[1]) if ID_PATTERN.fullmatch(parts[1]) else (None, None)
+                if kind == USER_KIND and index < workspace.user_count:
+                    return endpoint, 200, workspace.get_user(index)
+
+        return not_found()
+
+    def __make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; without this, delayed ACKs add ~40ms per request
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def __send(self, status: int, document: Dict, headers: Dict = None) -> int:
+                payload = json.dumps(document).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+                return len(payload)
+
+            def __serve(self, method: str):
+                url = urlparse(self.path)
+                raw_body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                body = json.loads(raw_body) if raw_body else {}
+
+                if url.path == "/__stats":
+                    self.__send(200, server.get_stats())
+                    return
+                if url.path == "/__reset":
+                    server.workspace.reset()
+                    server.reset_stats()
+                    self.__send(200, {"ok": True})
+                    return
+                if url.path == "/__config":
+                    for name in ("latency", "rate_limit_probability", "retry_after"):
+                        if name in body:
+                            setattr(server, name, float(body[name]))
+                    self.__send(200, {"ok": True})
+                    return
+
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.rate_limit_probability and server.random.random() < server.rate_limit_probability:
+                    endpoint = f"{method} {re.sub(ID_PATTERN, '{id}', url.path)}"
+                    sent = self.__send(429, {"object": "error", "status": 429, "code": "rate_limited",
+                                             "message": "Rate limited"}, {"Retry-After": str(server.retry_after)})
+                    with server.stats_lock:
+                        server.rate_limited += 1
+                    server.record(endpoint, 429, len(raw_body), sent)
+                    return
+
+                endpoint, status, document = server.handle(method, url.path, parse_qs(url.query), body)
+                sent = self.__send(status, document)
+                server.record(endpoint, status, len(raw_body), sent)
+
+            def do_GET(self):
+                self.__serve("GET")
+
+            def do_POST(self):
+                self.__serve("POST")
+
+            def do_PATCH(self):
+                self.__serve("PATCH")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--extra-properties", type=int, default=0, help="unread columns on every project")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0)
+    args = parser.parse_args()
+
+    workspace = SyntheticWorkspace(pages=args.pages, seed=args.seed, users=args.users,
+                                   extra_properties=args.extra_properties)
+    server = FakeNotionServer(workspace, args.host, args.port, args.latency_ms / 1000, args.rate_limit_probability)
+    print(json.dumps({"url": server.url, "database_id": workspace.database_id}), flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Cold-start benchmark for the `main.py` entry points, run offline against the fake Notion server.
+
+Each entry point runs several times in a fresh process against a small synthetic workspace. The
+benchmark reports the median time to import `main` and which heavy dependencies (see
+`HEAVY_MODULES`) the entry point ended up loading. With `--check`, the run fails when the import
+takes longer than `--max-import-seconds` or an entry point loads a dependency it does not use.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --check --max-import-seconds 0.5
+    python benchmarks/import_time.py --slowest 15
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+from run_benchmarks import ENTRY_POINTS, REPO_DIR, run_benchmarks
+
+# Heavy dependencies each entry point is expected to load; anything else it loads is a regression.
+# Offline runs read secrets from the environment and workspaces from a file, so the Google clients
+# are never needed here.
+ALLOWED_HEAVY_MODULES = {
+    "run_automations": {"anthropic"},
+    "hello_http": {"anthropic"},
+}
+
+
+def get_slowest_imports(count: int) -> List[str]:
+    """The modules with the highest cumulative import time for `import main`, from `-X importtime`."""
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                           cwd=REPO_DIR, capture_output=True, text=True)
+    timings = []
+    for line in child.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        timings.append((int(cumulative), module.strip()))
+    timings.sort(reverse=True)
+    return [f"{microseconds / 1000:8.1f} ms  {module}" for microseconds, module in timings[:count]]
+
+
+def measure_cold_starts(args) -> Dict[str, Dict]:
+    runs: Dict[str, List[Dict]] = {name: [] for name in args.entry_points}
+    for _ in range(args.repeat):
+        for name, result in run_benchmarks(args).items():
+            runs[name].append(result)
+
+    report = {}
+    for name, results in runs.items():
+        report[name] = {
+            "import_seconds": round(statistics.median(result["import_seconds"] for result in results), 3),
+            "first_call_seconds": round(statistics.median(result["wall_seconds"] for result in results), 3),
+            "heavy_modules": sorted(set().union(*(result["heavy_modules"] for result in results))),
+        }
+    return report
+
+
+def find_cold_start_regressions(report: Dict[str, Dict], max_import_seconds: float) -> List[str]:
+    regressions = []
+    for name, result in report.items():
+        if max_import_seconds and result["import_seconds"] > max_import_seconds:
+            regressions.append(f"{name}: importing main took {result['import_seconds']}s, "
+                               f"budget {max_import_seconds}s")
+        unexpected = set(result["heavy_modules"]) - ALLOWED_HEAVY_MODULES.get(name, set())
+        if unexpected:
+            regressions.append(f"{name}: loaded {', '.join(sorted(unexpected))}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per entry point")
+    parser.add_argument("--entry-points", nargs="+", default=ENTRY_POINTS, choices=ENTRY_POINTS)
+    parser.add_argument("--slowest", type=int, default=0, help="also list the N slowest imports of main")
+    parser.add_argument("--check", action="store_true", help="fail on slow imports or unexpected heavy modules")
+    parser.add_argument("--max-import-seconds", type=float, default=0.0, help="import budget for --check; 0 disables it")
+    args = parser.parse_args()
+    # The rest of the settings `run_benchmarks` expects, for a plain sequential run
+    args.seed, args.extra_properties, args.concurrency, args.incremental = 0, 0, 1, False
+    args.latency_ms, args.rate_limit_probability, args.requests_per_second = 0.0, 0.0, 100000
+
+    report = measure_cold_starts(args)
+    print()
+    for name, result in report.items():
+        print(f"{name}: import {result['import_seconds']}s, first call {result['first_call_seconds']}s, "
+              f"heavy modules: {', '.join(result['heavy_modules']) or 'none'}")
+
+    if args.slowest:
+        print("\nSlowest imports of main (cumulative):")
+        print("\n".join(get_slowest_imports(args.slowest)))
+
+    if args.check:
+        regressions = find_cold_start_regressions(report, args.max_import_seconds)
+        for regression in regressions:
+            print(f"COLD START REGRESSION ==> {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
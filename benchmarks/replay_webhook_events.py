@@ -0,0 +1,147 @@
+"""
+Replays the recorded Notion webhook events in `benchmarks/webhook_events/` through the
+`handle_notion_webhook` entry point, offline against the fake Notion server.
+
+Each fixture's events are delivered one request at a time, signed like Notion signs them, and the
+buffer is flushed once the debounce window has passed. The pages processed and the pages each
+rule ran on are printed with the Notion calls made. With `--check`, the run fails when they differ
+from the fixture's `expected_pages` and `expected_rules`.
+
+    python benchmarks/replay_webhook_events.py --check
+    python benchmarks/replay_webhook_events.py --fixtures title_typing_burst --debounce-seconds 2
+"""
+import argparse
+import contextlib
+import glob
+import hashlib
+import hmac
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, "webhook_events")
+VERIFICATION_TOKEN = "secret_replay_verification_token"
+
+sys.path.insert(0, REPO_DIR)
+from fake_notion_server import FakeNotionServer, SyntheticWorkspace  # noqa: E402
+
+
+class WebhookRequest:
+    """The parts of a Flask request the webhook entry point reads."""
+
+    def __init__(self, body: bytes = b"", headers: Dict = None):
+        self.args = {}
+        self.body = body
+        self.headers = headers or {}
+
+    def get_data(self) -> bytes:
+        return self.body
+
+    def get_json(self, silent: bool = False):
+        return json.loads(self.body) if self.body else None
+
+
+def sign(body: bytes) -> str:
+    return "sha256=" + hmac.new(VERIFICATION_TOKEN.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def load_fixtures(names: List[str] = None) -> Dict[str, Dict]:
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.json"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if not names or name in names:
+            with open(path) as file:
+                fixtures[name] = json.load(file)
+    return fixtures
+
+
+def replay(main, fixture: Dict, debounce_seconds: float, interval: float, verbose: bool) -> Dict:
+    """Deliver a fixture's events, wait out the debounce window, flush, and sum up what ran."""
+    responses = []
+    output = io.StringIO()
+    with contextlib.redirect_stdout(sys.stdout if verbose else output):
+        for event in fixture["events"]:
+            body = json.dumps(event).encode("utf-8")
+            responses.append(main.handle_notion_webhook(WebhookRequest(body, {"X-Notion-Signature": sign(body)})))
+            time.sleep(interval)
+        time.sleep(debounce_seconds)
+        responses.append(main.handle_notion_webhook(WebhookRequest()))
+
+    rules: Dict[str, int] = {}
+    for report, _ in responses:
+        for name, stats in report.get("rules", {}).items():
+            if stats["pages"]:
+                rules[name] = rules.get(name, 0) + stats["pages"]
+    return {
+        "statuses": [status for _, status in responses],
+        "pages": sum((report.get("changed_pages") or {}).get("pages", 0) for report, _ in responses),
+        "rules": rules,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fixtures", nargs="+", help="fixture names; all of them by default")
+    parser.add_argument("--pages", type=int, default=200, help="size of the synthetic workspace")
+    parser.add_argument("--debounce-seconds", type=float, default=0.5)
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between two deliveries")
+    parser.add_argument("--verbose", action="store_true", help="show what the entry point prints")
+    parser.add_argument("--check", action="store_true", help="fail when a fixture's expectations are not met")
+    args = parser.parse_args()
+
+    workspace = SyntheticWorkspace(pages=args.pages)
+    server = FakeNotionServer(workspace)
+    server.start()
+    store_dir = tempfile.mkdtemp()
+    workspaces_file = os.path.join(store_dir, "workspaces_api_keys.json")
+    with open(workspaces_file, "w") as file:
+        json.dump({"notion": {"workspaces": [
+            {"name": "replay", "token": "secret_replay", "database_id": workspace.database_id}
+        ]}}, file)
+    os.environ.update(
+        NOTION_BASE_URL=server.url,
+        ANTHROPIC_BASE_URL=server.url,
+        ANTHROPIC_API_KEY="replay",
+        NOTION_WEBHOOK_VERIFICATION_TOKEN=VERIFICATION_TOKEN,
+        WORKSPACES_FILE=workspaces_file,
+        NOTION_REQUESTS_PER_SECOND="100000",
+        WEBHOOK_DEBOUNCE_SECONDS=str(args.debounce_seconds),
+        WEBHOOK_BUFFER_PATH=os.path.join(store_dir, "webhook_events.sqlite3"),
+        BLOCK_SCAN_DIR=os.path.join(store_dir, "block_scans"),
+        NUDGE_LEDGER_DIR=os.path.join(store_dir, "nudge_ledgers"),
+        AUDIT_DIR=os.path.join(store_dir, "audit"),
+        VERDICT_CACHE_DIR=os.path.join(store_dir, "verdict_caches"),
+    )
+    import main as entry_points
+
+    failures = []
+    for name, fixture in load_fixtures(args.fixtures).items():
+        workspace.reset()
+        server.reset_stats()
+        result = replay(entry_points, fixture, args.debounce_seconds, args.interval, args.verbose)
+        calls = server.get_stats()["calls"]
+        print(f"{name}: {len(fixture['events'])} events, {result['pages']} pages, rules {result['rules']}, "
+              f"{sum(calls.values())} Notion calls {dict(calls)}")
+
+        if any(status != 200 for status in result["statuses"]):
+            failures.append(f"{name}: statuses {result['statuses']}")
+        if result["pages"] != fixture["expected_pages"]:
+            failures.append(f"{name}: {result['pages']} pages processed, expected {fixture['expected_pages']}")
+        if result["rules"] != fixture["expected_rules"]:
+            failures.append(f"{name}: rules ran {result['rules']}, expected {fixture['expected_rules']}")
+
+    server.stop()
+    if args.check:
+        for failure in failures:
+            print(f"WEBHOOK REPLAY MISMATCH ==> {failure}")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Scale benchmarks for the `main.py` entry points, run offline against the fake Notion server.
+
+Each entry point runs in its own process against a freshly reset synthetic workspace, and the
+benchmark reports wall time, API calls per endpoint, bytes transferred and peak memory. With
+`--check`, the call counts are compared to `benchmarks/baseline.json` and the run fails when an
+endpoint is called more often than in the baseline, so regressions in call counts are caught.
+
+    python benchmarks/run_benchmarks.py --pages 10000
+    python benchmarks/run_benchmarks.py --pages 10000 --check
+    python benchmarks/run_benchmarks.py --pages 10000 --update-baseline
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "baseline.json")
+ENTRY_POINTS = [
+    "run_automations",
+    "hello_http",
+    "check_and_update_assignees",
+    "check_and_nudge_assignees_or_project_owner",
+    "check_for_kpi_or_checklist_item",
+    "update_page_content_with_a_full_stop",
+]
+# Dependencies with a noticeable import cost, which entry points should only load when they use them
+HEAVY_MODULES = ["anthropic", "google.cloud.secretmanager", "google.cloud.storage", "dotenv"]
+
+
+class BenchmarkRequest:
+    """The parts of a Flask request the entry points read."""
+    args: Dict = {}
+
+    def get_json(self, silent: bool = False):
+        return None
+
+
+def run_entry_point(name: str):
+    """Child process: import the entry points, run one and print its timings as JSON."""
+    sys.path.insert(0, REPO_DIR)
+    started_at = time.perf_counter()
+    import main
+    imported_at = time.perf_counter()
+    report, status = getattr(main, name)(BenchmarkRequest())
+    finished_at = time.perf_counter()
+    print(json.dumps({
+        "status": status,
+        "message": report.get("message"),
+        "rules": report.get("rules"),
+        "shards": report.get("shards"),
+        "import_seconds": round(imported_at - started_at, 3),
+        "wall_seconds": round(finished_at - imported_at, 3),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_memory_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "heavy_modules": [module for module in HEAVY_MODULES if module in sys.modules],
+    }))
+
+
+def __call_server(url: str, path: str, body: Dict = None) -> Dict:
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(url + path, data=data, method="POST" if data is not None else "GET")
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def __start_server(args) -> (subprocess.Popen, Dict):
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(BENCHMARKS_DIR, "fake_notion_server.py"), "--port", "0",
+         "--pages", str(args.pages), "--seed", str(args.seed), "--extra-properties", str(args.extra_properties),
+         "--latency-ms", str(args.latency_ms), "--rate-limit-probability", str(args.rate_limit_probability)],
+        stdout=subprocess.PIPE, text=True
+    )
+    return server, json.loads(server.stdout.readline())
+
+
+def __get_environment(args, server_info: Dict, store_dir: str) -> Dict:
+    workspaces_file = os.path.join(store_dir, "workspaces_api_keys.json")
+    workspace = {"name": "benchmark", "token": "secret_benchmark", "database_id": server_info["database_id"]}
+    if args.concurrency > 1:
+        workspace["concurrency"] = args.concurrency
+    if args.incremental:
+        workspace["incremental"] = True
+    with open(workspaces_file, "w") as file:
+        json.dump({"notion": {"workspaces": [workspace]}}, file)
+
+    return dict(
+        os.environ,
+        NOTION_BASE_URL=server_info["url"],
+        ANTHROPIC_BASE_URL=server_info["url"],
+        ANTHROPIC_API_KEY="benchmark",
+        WORKSPACES_FILE=workspaces_file,
+        NOTION_REQUESTS_PER_SECOND=str(args.requests_per_second),
+        WATERMARK_DIR=os.path.join(store_dir, "watermarks"),
+        BLOCK_SCAN_DIR=os.path.join(store_dir, "block_scans"),
+        NUDGE_LEDGER_DIR=os.path.join(store_dir, "nudge_ledgers"),
+        AUDIT_DIR=os.path.join(store_dir, "audit"),
+        VERDICT_CACHE_DIR=os.path.join(store_dir, "verdict_caches"),
+    )
+
+
+def run_benchmarks(args) -> Dict[str, Dict]:
+    server, server_info = __start_server(args)
+    report = {}
+    try:
+        for name in args.entry_points:
+            __call_server(server_info["url"], "/__reset", {})
+            with tempfile.TemporaryDirectory() as store_dir:
+                environment = __get_environment(args, server_info, store_dir)
+                child = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--run-entry-point", name],
+                    env=environment, cwd=REPO_DIR, capture_output=True, text=True
+                )
+            if child.returncode != 0:
+                print(child.stderr, file=sys.stderr)
+                raise RuntimeError(f"{name} exited with {child.returncode}")
+            timings = json.loads(child.stdout.strip().splitlines()[-1])
+            report[name] = dict(timings, **__call_server(server_info["url"], "/__stats"))
+            print(f"{name}: {timings['wall_seconds']}s, {report[name]['requests']} requests, "
+                  f"{timings['peak_memory_mb']} MB peak", flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+    return report
+
+
+def get_baseline_key(args) -> str:
+    return f"pages={args.pages},seed={args.seed},concurrency={args.concurrency},incremental={args.incremental}"
+
+
+def find_call_regressions(report: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Endpoints called more often than in the baseline, beyond the tolerance."""
+    regressions = []
+    for name, result in report.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for endpoint, calls in result["calls"].items():
+            allowed = expected.get(endpoint, 0) * (1 + tolerance)
+            if calls > allowed:
+                regressions.append(f"{name}: {endpoint} called {calls} times, baseline {expected.get(endpoint, 0)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--extra-properties", type=int, default=0,
+                        help="columns the rules never read, added to every synthetic project")
+    parser.add_argument("--concurrency", type=int, default=1, help="workspace concurrency; > 1 uses the async engine")
+    parser.add_argument("--incremental", action="store_true", help="run workspaces with incremental sync")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0)
+    parser.add_argument("--requests-per-second", type=float, default=100000,
+                        help="client-side pacing; the real API allows about 3")
+    parser.add_argument("--entry-points", nargs="+", default=ENTRY_POINTS, choices=ENTRY_POINTS)
+    parser.add_argument("--output", help="write the full report to this JSON file")
+    parser.add_argument("--check", action="store_true", help="fail when call counts exceed the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="allowed relative increase in calls")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--run-entry-point", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_entry_point:
+        run_entry_point(args.run_entry_point)
+        return
+
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as file:
+            baselines = json.load(file)
+    key = get_baseline_key(args)
+
+    if args.update_baseline:
+        baselines[key] = {name: result["calls"] for name, result in report.items()}
+        with open(BASELINE_PATH, "w") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f"Baseline updated for {key}")
+
+    if args.check:
+        if key not in baselines:
+            print(f"No baseline for {key}; run with --update-baseline first")
+            sys.exit(1)
+        regressions = find_call_regressions(report, baselines[key], args.tolerance)
+        for regression in regressions:
+            print(f"CALL COUNT REGRESSION ==> {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Benchmarks the sharded fan-out (`dispatch_automations` + `run_automation_shards`) offline against
+the fake Notion server, for several numbers of workers.
+
+A run is dispatched, then workers are started as separate processes sharing the SQLite work queue,
+as many at a time as allowed and only while shards are waiting, like Cloud Tasks would push them.
+The benchmark reports wall time, worker invocations and Notion calls per worker count. With
+`--check`, the run fails when a rule saw a different number of pages than in one unsharded
+`run_automations` run (a page processed twice or skipped), or when the most workers are not at
+least `--min-speedup` times faster than one.
+
+    python benchmarks/run_shard_benchmarks.py --check
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+RUN_BENCHMARKS = os.path.join(BENCHMARKS_DIR, "run_benchmarks.py")
+
+sys.path.insert(0, BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+import run_benchmarks  # noqa: E402
+from work_queue import SQLiteWorkQueue  # noqa: E402
+
+
+class EntryPointProcess:
+    """An entry point run in a child process. Its output goes to temporary files, as the rules print a lot."""
+
+    def __init__(self, name: str, environment: Dict):
+        self.name = name
+        self.stdout = tempfile.TemporaryFile(mode="w+")
+        self.stderr = tempfile.TemporaryFile(mode="w+")
+        self.process = subprocess.Popen([sys.executable, RUN_BENCHMARKS, "--run-entry-point", name], env=environment,
+                                        cwd=REPO_DIR, stdout=self.stdout, stderr=self.stderr, text=True)
+
+    def is_running(self) -> bool:
+        return self.process.poll() is None
+
+    def get_result(self) -> Dict:
+        """Wait for the process and return the timings and report it printed last."""
+        self.process.wait()
+        self.stdout.seek(0)
+        self.stderr.seek(0)
+        output, errors = self.stdout.read(), self.stderr.read()
+        self.stdout.close()
+        self.stderr.close()
+        if self.process.returncode != 0:
+            print(errors, file=sys.stderr)
+            raise RuntimeError(f"{self.name} exited with {self.process.returncode}")
+        return json.loads(output.strip().splitlines()[-1])
+
+
+def __count_rule_pages(results: List[Dict]) -> Dict[str, int]:
+    pages: Dict[str, int] = {}
+    for result in results:
+        for name, stats in (result.get("rules") or {}).items():
+            pages[name] = pages.get(name, 0) + stats["pages"]
+    return pages
+
+
+def run_reference(args, server_info: Dict) -> Dict[str, int]:
+    """Pages each rule saw in one unsharded `run_automations` run."""
+    run_benchmarks.__call_server(server_info["url"], "/__reset", {})
+    with tempfile.TemporaryDirectory() as store_dir:
+        environment = run_benchmarks.__get_environment(args, server_info, store_dir)
+        result = EntryPointProcess("run_automations", environment).get_result()
+    return __count_rule_pages([result])
+
+
+def run_sharded(args, server_info: Dict, workers: int) -> Dict:
+    """Dispatch a run and keep up to `workers` worker processes busy until the queue is drained."""
+    run_benchmarks.__call_server(server_info["url"], "/__reset", {})
+    with tempfile.TemporaryDirectory() as store_dir:
+        environment = dict(
+            run_benchmarks.__get_environment(args, server_info, store_dir),
+            WORK_QUEUE="sqlite",
+            WORK_QUEUE_PATH=os.path.join(store_dir, "work_queue.sqlite3"),
+            SHARD_RESPONSES=str(args.shard_responses),
+        )
+        queue = SQLiteWorkQueue(environment["WORK_QUEUE_PATH"])
+        started_at = time.perf_counter()
+        EntryPointProcess("dispatch_automations", environment).get_result()
+
+        running: List[EntryPointProcess] = []
+        results = []
+        invocations = 0
+        while True:
+            for worker in [worker for worker in running if not worker.is_running()]:
+                running.remove(worker)
+                results.append(worker.get_result())
+            waiting = queue.get_counts().get("queued", 0)
+            if not waiting and not running:
+                break
+            for _ in range(min(waiting, workers - len(running))):
+                running.append(EntryPointProcess("run_automation_shards", environment))
+                invocations += 1
+            time.sleep(0.05)
+        wall_seconds = time.perf_counter() - started_at
+        left = queue.get_counts()
+
+    stats = run_benchmarks.__call_server(server_info["url"], "/__stats")
+    return {
+        "workers": workers,
+        "wall_seconds": round(wall_seconds, 3),
+        "invocations": invocations,
+        "shards": sum((result.get("shards") or {}).get("processed", 0) for result in results),
+        "failed": sum((result.get("shards") or {}).get("failed", 0) for result in results),
+        "statuses": sorted({result["status"] for result in results}),
+        "left_in_queue": left,
+        "rule_pages": __count_rule_pages(results),
+        "requests": stats["requests"],
+        "calls": stats["calls"],
+    }
+
+
+def find_shard_mismatches(reference: Dict[str, int], report: List[Dict], min_speedup: float) -> List[str]:
+    mismatches = []
+    for result in report:
+        if result["rule_pages"] != reference:
+            mismatches.append(f"{result['workers']} workers: rules saw {result['rule_pages']} pages, "
+                              f"unsharded {reference}")
+        if result["failed"] or result["left_in_queue"] or result["statuses"] != [200]:
+            mismatches.append(f"{result['workers']} workers: {result['failed']} shards failed, "
+                              f"statuses {result['statuses']}, left in queue {result['left_in_queue']}")
+    if min_speedup and len(report) > 1:
+        speedup = report[0]["wall_seconds"] / report[-1]["wall_seconds"]
+        if speedup < min_speedup:
+            mismatches.append(f"{report[-1]['workers']} workers only {speedup:.2f}x faster than "
+                              f"{report[0]['workers']}, expected {min_speedup}x")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=800)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--extra-properties", type=int, default=0)
+    # Latency has to dominate the fake server's own work, which does not scale with workers
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0)
+    parser.add_argument("--requests-per-second", type=float, default=100000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4], help="worker counts to compare")
+    parser.add_argument("--shard-responses", type=int, default=2, help="query responses of 100 pages per shard")
+    parser.add_argument("--output", help="write the full report to this JSON file")
+    parser.add_argument("--check", action="store_true",
+                        help="fail when pages are processed twice or skipped, or the speedup is too low")
+    parser.add_argument("--min-speedup", type=float, default=1.5,
+                        help="with --check, how much faster the most workers must be than the fewest; 0 disables it")
+    args = parser.parse_args()
+    # The rest of the settings `run_benchmarks` expects, for a plain sequential run
+    args.concurrency, args.incremental = 1, False
+
+    server, server_info = run_benchmarks.__start_server(args)
+    try:
+        reference = run_reference(args, server_info)
+        print(f"unsharded run_automations: rules saw {reference} pages", flush=True)
+        report = []
+        for workers in sorted(args.workers):
+            result = run_sharded(args, server_info, workers)
+            report.append(result)
+            print(f"{workers} workers: {result['wall_seconds']}s, {result['invocations']} invocations, "
+                  f"{result['shards']} shards, {result['requests']} requests", flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"reference": reference, "runs": report}, file, indent=2)
+
+    if args.check:
+        mismatches = find_shard_mismatches(reference, report, args.min_speedup)
+        for mismatch in mismatches:
+            print(f"SHARDED RUN MISMATCH ==> {mismatch}")
+        sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
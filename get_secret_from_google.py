@@ -1,15 +1,45 @@
-from google.cloud import secretmanager
+import os
+import threading
+from instrumentation import track_call
+from ttl_cache import StaleWhileRevalidateCache
+
+SECRET_CACHE_TTL_SECONDS = float(os.getenv("SECRET_CACHE_TTL_SECONDS", 3600))
+
+__client = None
+__client_lock = threading.Lock()
+
+
+def __get_client():
+    """One Secret Manager client per process, reused across warm invocations."""
+    global __client
+    with __client_lock:
+        if __client is None:
+            # The gRPC-based client is imported on first use, not on every cold start
+            from google.cloud import secretmanager
+            __client = secretmanager.SecretManagerServiceClient()
+        return __client
+
+
+def __access_secret(key, previous=None) -> str:
+    secret_name, version_id = key
+    # Define the resource name of the secret
+    secret_path = f"projects/837622523261/secrets/{secret_name}/versions/{version_id}"
+    # Access the secret version
+    with track_call("secret_manager", "access_secret_version") as call:
+        response = __get_client().access_secret_version(name=secret_path)
+        call.bytes_received = len(response.payload.data)
+    # Return the decoded payload (secret value)
+    return response.payload.data.decode("UTF-8")
+
+
+__secrets = StaleWhileRevalidateCache(__access_secret, SECRET_CACHE_TTL_SECONDS)
 
 
 def get_secret(secret_name, version_id='latest'):
+    # A secret set in the environment (e.g. from a local .env file) wins, for local and offline runs
+    if os.getenv(secret_name):
+        return os.getenv(secret_name)
     try:
-        client = secretmanager.SecretManagerServiceClient()
-        # Define the resource name of the secret
-
-        secret_path = f"projects/837622523261/secrets/{secret_name}/versions/{version_id}"
-        # Access the secret version
-        response = client.access_secret_version(name=secret_path)
-        # Return the decoded payload (secret value)
-        return response.payload.data.decode("UTF-8")
+        return __secrets.get((secret_name, version_id))
     except Exception as err:
         print("ERROR FETCHING SECRETS: ", err)
@@ -1,29 +1,62 @@
-from google.cloud import storage
-from get_secret_from_google import get_secret
+import os
+import threading
+from instrumentation import track_call
+from ttl_cache import StaleWhileRevalidateCache
 import json
 
+CONFIG_CACHE_TTL_SECONDS = float(os.getenv("CONFIG_CACHE_TTL_SECONDS", 300))
+# A local copy of workspaces_api_keys.json to use instead of the bucket, for local and offline runs
+WORKSPACES_FILE = os.getenv("WORKSPACES_FILE")
 
-def __fetch_file_from_bucket(bucket_name, file_name):
+__client = None
+__client_lock = threading.Lock()
+
+
+def get_storage_client():
+    """One Cloud Storage client per process, reused across warm invocations and by the audit log."""
+    global __client
+    with __client_lock:
+        if __client is None:
+            # Imported on first use so runs with WORKSPACES_FILE never load the Google clients
+            from google.cloud import storage
+            __client = storage.Client()
+        return __client
+
+
+def __fetch_file_from_bucket(key, previous=None):
+    """
+    Download and decode a JSON file, skipping the download when its generation has not changed.
+
+    :return: (data, generation)
+    """
+    from google.api_core.exceptions import NotModified
+    bucket_name, file_name = key
+    blob = get_storage_client().bucket(bucket_name).blob(file_name)
     try:
-        # Initialize the Google Cloud Storage client
-        client = storage.Client()
-        bucket = client.get_bucket(bucket_name)
-        blob = bucket.blob(file_name)
-
-        # Download and decode the JSON file
-        data = json.loads(blob.download_as_text())
-        return data
-    except Exception as err:
-        print("ERROR FETCHING FILE FROM BUCKETS ==> ", err)
-        return {}
+        with track_call("gcs", "download") as call:
+            if previous is not None:
+                text = blob.download_as_text(if_generation_not_match=previous[1])
+            else:
+                text = blob.download_as_text()
+            call.bytes_received = len(text)
+    except NotModified:
+        return previous
+    return json.loads(text), blob.generation
+
+
+__files = StaleWhileRevalidateCache(__fetch_file_from_bucket, CONFIG_CACHE_TTL_SECONDS)
 
 
 def get_workspaces_api_keys() -> dict:
+    if WORKSPACES_FILE:
+        with open(WORKSPACES_FILE) as file:
+            return json.load(file)
+
     bucket_name = "notion-workspaces-project-bucket"
     file_name = 'workspaces_api_keys.json'
 
     try:
-        json_data = __fetch_file_from_bucket(bucket_name, file_name)
+        json_data, _ = __files.get((bucket_name, file_name))
 
         return json_data
 
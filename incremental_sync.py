@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from json_store import JSONStore
+from notion_filters import restrict_to_edited_since
+
+
+class IncrementalSync:
+    """
+    Tracks what a rule scan has already processed so the next run only queries edited pages.
+
+    The watermark holds the highest `last_edited_time` seen and the ids of the pages handled at
+    exactly that time (Notion timestamps are minute-granular, so the next query must include it).
+    Time-based rules also keep a due-date index of the pages they may need to revisit, which lets
+    stale and overdue pages be found without rescanning the database.
+    """
+
+    def __init__(self, store: JSONStore, workspace: Dict, rules: List):
+        self.store = store
+        # The watermark depends on which rules ran, since each selection scans a different subset
+        self.key = f"{workspace['database_id']}:{'+'.join(sorted(rule.name for rule in rules))}"
+        self.time_based_rules = [rule for rule in rules if rule.time_based]
+
+        watermark = store.load(self.key)
+        self.last_edited_time: Optional[str] = watermark.get('last_edited_time')
+        self.handled_page_ids = set(watermark.get('handled_page_ids', []))
+        self.due_index: Dict[str, Dict] = watermark.get('due_index', {})
+
+        self.new_last_edited_time = self.last_edited_time
+        self.new_handled_page_ids = set(self.handled_page_ids)
+        self.seen_page_ids = set()
+
+    def get_query_filter(self, scan_filter: Optional[Dict]) -> Optional[Dict]:
+        if not self.last_edited_time:
+            return scan_filter
+        return restrict_to_edited_since(scan_filter, self.last_edited_time)
+
+    def get_query_sorts(self) -> List[Dict]:
+        # Oldest edits first, so a scan cut short never moves the watermark past unseen pages
+        return [{"timestamp": "last_edited_time", "direction": "ascending"}]
+
+    def is_handled(self, page: Dict) -> bool:
+        """Whether the page was already processed by a previous run and has not changed since."""
+        return (page.get('last_edited_time') == self.last_edited_time
+                and page['id'].replace('-', '') in self.handled_page_ids)
+
+    def record(self, page_handler, advance_watermark: bool = True):
+        """Remember a processed page: move the watermark forward and refresh its due-date index entry."""
+        page_id = page_handler.page_id
+        self.seen_page_ids.add(page_id)
+
+        last_edited_time = page_handler.page.last_edited_time
+        if advance_watermark and last_edited_time:
+            if not self.new_last_edited_time or last_edited_time > self.new_last_edited_time:
+                self.new_last_edited_time = last_edited_time
+                self.new_handled_page_ids = {page_id}
+            elif last_edited_time == self.new_last_edited_time:
+                self.new_handled_page_ids.add(page_id)
+
+        entries = {}
+        for rule in self.time_based_rules:
+            entry = rule.get_due_index_entry(page_handler)
+            if entry:
+                entries[rule.name] = entry
+        if entries:
+            self.due_index[page_id] = entries
+        else:
+            self.forget(page_id)
+
+    def forget(self, page_id: str):
+        self.due_index.pop(page_id, None)
+
+    def get_recheck_page_ids(self, now: datetime = None) -> List[str]:
+        """Pages not seen in this run that a time-based rule should look at again."""
+        now = now or datetime.now(timezone.utc)
+        page_ids = []
+        for page_id, entries in self.due_index.items():
+            if page_id in self.seen_page_ids:
+                continue
+            if any(rule.name in entries and rule.is_due_for_recheck(entries[rule.name], now)
+                   for rule in self.time_based_rules):
+                page_ids.append(page_id)
+        return page_ids
+
+    def save(self):
+        try:
+            self.store.save(self.key, {
+                'last_edited_time': self.new_last_edited_time,
+                'handled_page_ids': sorted(self.new_handled_page_ids),
+                'due_index': self.due_index,
+            })
+        except Exception as err:
+            print("ERROR SAVING WATERMARK ==> ", err)
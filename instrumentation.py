@@ -0,0 +1,290 @@
+"""
+Per-invocation instrumentation of outbound calls (Notion, Anthropic, Cloud Storage, Secret Manager)
+and of the time spent per rule, collected into a JSON-serializable run report.
+
+A report is active for the duration of `start_run`; calls made outside of one are not recorded.
+The workspace being processed is tracked with a context variable, so calls and rule timings are
+attributed to it from async tasks and from worker threads started with `copy_context`.
+"""
+import bisect
+import contextvars
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+ID_PATTERN = re.compile(r'[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}')
+
+current_workspace = contextvars.ContextVar('current_workspace', default=None)
+__report: Optional['RunReport'] = None
+
+
+class Histogram:
+    """Latency histogram over fixed buckets, with count, sum and max."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def get_percentile(self, percentile: float) -> Optional[float]:
+        """Upper bound of the bucket holding the percentile; the max for the overflow bucket."""
+        if not self.count:
+            return None
+        rank = percentile * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def to_dict(self) -> Dict:
+        labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 1) if self.count else None,
+            'p50_ms': self.get_percentile(0.5),
+            'p95_ms': self.get_percentile(0.95),
+            'max_ms': round(self.max_ms, 1),
+            'buckets': {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+
+class CallStats:
+    def __init__(self):
+        self.count = 0
+        self.statuses: Dict[str, int] = {}
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = Histogram()
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'statuses': dict(self.statuses),
+            'retries': self.retries,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'latency': self.latency.to_dict(),
+        }
+
+
+class RuleStats:
+    def __init__(self):
+        self.pages = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def to_dict(self) -> Dict:
+        return {'pages': self.pages, 'errors': self.errors, 'seconds': round(self.seconds, 3)}
+
+
+class Section:
+    """Calls and rule timings of the whole run, or of one workspace."""
+
+    def __init__(self):
+        self.calls: Dict[str, CallStats] = {}
+        self.rules: Dict[str, RuleStats] = {}
+
+    def get_call(self, key: str) -> CallStats:
+        stats = self.calls.get(key)
+        if stats is None:
+            stats = self.calls[key] = CallStats()
+        return stats
+
+    def get_rule(self, name: str) -> RuleStats:
+        stats = self.rules.get(name)
+        if stats is None:
+            stats = self.rules[name] = RuleStats()
+        return stats
+
+    def to_dict(self) -> Dict:
+        return {
+            'calls': {key: stats.to_dict() for key, stats in sorted(self.calls.items())},
+            'rules': {name: stats.to_dict() for name, stats in self.rules.items()},
+        }
+
+
+class RunReport:
+    """Everything recorded during one entry point invocation."""
+
+    def __init__(self, entry_point: str):
+        self.entry_point = entry_point
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.monotonic()
+        self.finished = None
+        self.error: Optional[str] = None
+        self.total = Section()
+        self.workspaces: Dict[str, Section] = {}
+        self.workspace_details: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def __sections(self) -> List[Section]:
+        workspace = current_workspace.get()
+        if workspace is None:
+            return [self.total]
+        return [self.total, self.workspaces.setdefault(workspace, Section())]
+
+    def record_call(self, key: str, status: str, ms: float, bytes_sent: int, bytes_received: int):
+        with self.lock:
+            for section in self.__sections():
+                stats = section.get_call(key)
+                stats.count += 1
+                stats.statuses[status] = stats.statuses.get(status, 0) + 1
+                stats.bytes_sent += bytes_sent
+                stats.bytes_received += bytes_received
+                stats.latency.record(ms)
+
+    def record_retry(self, key: str):
+        with self.lock:
+            for section in self.__sections():
+                section.get_call(key).retries += 1
+
+    def record_rule(self, name: str, seconds: float, ok: bool = True, pages: int = 1):
+        with self.lock:
+            for section in self.__sections():
+                stats = section.get_rule(name)
+                stats.pages += pages
+                stats.seconds += seconds
+                stats.errors += 0 if ok else 1
+
+    def set_workspace_details(self, **details):
+        """Attach extra fields (duration, errors, mutation results, ...) to the current workspace's report."""
+        workspace = current_workspace.get()
+        if workspace is None:
+            return
+        with self.lock:
+            self.workspace_details.setdefault(workspace, {}).update(details)
+
+    def add_workspace_errors(self, errors: Dict[str, Optional[str]]):
+        """
+        Mark the workspaces that failed, e.g. as returned by `run_workspaces`, so the run is not ok.
+        An error already recorded for a workspace is kept.
+        """
+        with self.lock:
+            for name, error in errors.items():
+                if error:
+                    self.workspace_details.setdefault(name, {}).setdefault('error', error)
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            finished = self.finished if self.finished is not None else time.monotonic()
+            workspaces = []
+            for name in sorted(set(self.workspaces) | set(self.workspace_details)):
+                section = self.workspaces.get(name) or Section()
+                workspaces.append({'name': name, **self.workspace_details.get(name, {}), **section.to_dict()})
+            return {
+                'entry_point': self.entry_point,
+                'started_at': self.started_at.isoformat(),
+                'duration_seconds': round(finished - self.started, 3),
+                'ok': self.error is None and not any(w.get('error') for w in workspaces),
+                'error': self.error,
+                **self.total.to_dict(),
+                'workspaces': workspaces,
+            }
+
+
+def get_run_report() -> Optional[RunReport]:
+    return __report
+
+
+@contextmanager
+def start_run(entry_point: str):
+    """
+    Record every instrumented call made until the block exits, then emit the report as one
+    structured JSON log line. An exception escaping the block is recorded, not raised.
+    """
+    global __report
+    report = __report = RunReport(entry_point)
+    try:
+        yield report
+    except Exception as err:
+        report.error = f"{type(err).__name__}: {err}"
+    finally:
+        report.finished = time.monotonic()
+        __report = None
+        print(json.dumps({'severity': 'INFO' if report.error is None else 'ERROR',
+                          'message': f'run report {entry_point}', 'run_report': report.to_dict()}))
+
+
+@contextmanager
+def track_workspace(name: str):
+    """Attribute the calls and rule timings made in this block (and in tasks it starts) to a workspace."""
+    token = current_workspace.set(name)
+    started = time.monotonic()
+    try:
+        yield
+    except Exception as err:
+        record_workspace_details(error=f"{type(err).__name__}: {err}")
+        raise
+    finally:
+        record_workspace_details(duration_seconds=round(time.monotonic() - started, 3))
+        current_workspace.reset(token)
+
+
+def record_workspace_details(**details):
+    if __report is not None:
+        __report.set_workspace_details(**details)
+
+
+def record_workspace_errors(errors: Dict[str, Optional[str]]):
+    if __report is not None:
+        __report.add_workspace_errors(errors)
+
+
+class TrackedCall:
+    """Filled in by the caller of `track_call`: the status and the sizes of what was sent and came back."""
+
+    def __init__(self, bytes_sent: int = 0):
+        self.status = 'ok'
+        self.bytes_sent = bytes_sent
+        self.bytes_received = 0
+
+
+@contextmanager
+def track_call(service: str, endpoint: str, bytes_sent: int = 0):
+    """
+    Time an outbound call. Errors are recorded with their HTTP status when they carry one
+    (`status` or `code` attribute), otherwise with their type name, and re-raised.
+    """
+    call = TrackedCall(bytes_sent)
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception as err:
+        status = getattr(err, 'status', None) or getattr(err, 'status_code', None) or getattr(err, 'code', None)
+        call.status = str(status) if isinstance(status, int) else type(err).__name__
+        raise
+    finally:
+        if __report is not None:
+            __report.record_call(f"{service} {endpoint}", call.status, (time.perf_counter() - started) * 1000,
+                                 call.bytes_sent, call.bytes_received)
+
+
+def record_retry(service: str, endpoint: str):
+    if __report is not None:
+        __report.record_retry(f"{service} {endpoint}")
+
+
+def record_rule(name: str, seconds: float, ok: bool = True, pages: int = 1):
+    if __report is not None:
+        __report.record_rule(name, seconds, ok, pages)
+
+
+def get_endpoint(method: str, path: str) -> str:
+    """"PATCH pages/{id}" for "PATCH pages/0c1d...": ids are dropped so calls group by endpoint."""
+    return f"{method} {ID_PATTERN.sub('{id}', path.split('?')[0])}"
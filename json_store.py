@@ -0,0 +1,90 @@
+import json
+import os
+import re
+import threading
+from typing import Dict
+from instrumentation import track_call
+
+
+class JSONStore:
+    """Durable storage for small JSON documents (watermarks, caches, ledgers), keyed by an opaque string."""
+
+    def load(self, key: str) -> Dict:
+        raise NotImplementedError
+
+    def save(self, key: str, document: Dict):
+        raise NotImplementedError
+
+    @staticmethod
+    def _get_file_name(key: str) -> str:
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', key) + '.json'
+
+
+class FileJSONStore(JSONStore):
+    """Keeps each document as a JSON file in a local directory. Meant for tests and local runs."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def load(self, key: str) -> Dict:
+        path = os.path.join(self.directory, self._get_file_name(key))
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except Exception as err:
+            print(f"ERROR LOADING {key} ==> ", err)
+            return {}
+
+    def save(self, key: str, document: Dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self._get_file_name(key))
+        # Write to a temporary file first so a crash never leaves a truncated document behind
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(document, file)
+        os.replace(tmp_path, path)
+
+
+class GCSJSONStore(JSONStore):
+    """Keeps each document as a JSON object in a Google Cloud Storage bucket."""
+
+    def __init__(self, bucket_name: str, prefix: str):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        from google.cloud import storage
+        self.client = storage.Client()
+
+    def __get_blob(self, key: str):
+        return self.client.bucket(self.bucket_name).blob(self.prefix + self._get_file_name(key))
+
+    def load(self, key: str) -> Dict:
+        try:
+            blob = self.__get_blob(key)
+            with track_call("gcs", "download") as call:
+                if not blob.exists():
+                    call.status = "not_found"
+                    return {}
+                text = blob.download_as_text()
+                call.bytes_received = len(text)
+            return json.loads(text)
+        except Exception as err:
+            print(f"ERROR LOADING {key} ==> ", err)
+            return {}
+
+    def save(self, key: str, document: Dict):
+        payload = json.dumps(document)
+        with track_call("gcs", "upload", len(payload)):
+            self.__get_blob(key).upload_from_string(payload, content_type='application/json')
+
+
+def get_json_store(name: str) -> JSONStore:
+    """
+    Build the store configured for `name` (e.g. "watermark"): GCS when {NAME}_STORE=gcs, with the
+    bucket from {NAME}_BUCKET, otherwise JSON files under {NAME}_DIR.
+    """
+    prefix = name.upper()
+    if os.getenv(f'{prefix}_STORE', 'file') == 'gcs':
+        return GCSJSONStore(os.getenv(f'{prefix}_BUCKET', 'notion-workspaces-project-bucket'), f'{name}s/')
+    return FileJSONStore(os.getenv(f'{prefix}_DIR', f'/tmp/notion-{name}s'))
@@ -0,0 +1,13 @@
+"""
+Loads a local `.env` file for local runs. Deployed functions have no `.env`, so they skip
+importing python-dotenv altogether.
+"""
+import os
+
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+
+
+def load_local_env():
+    if os.path.exists(ENV_FILE):
+        from dotenv import load_dotenv
+        load_dotenv(ENV_FILE)
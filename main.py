@@ -1,176 +1,185 @@
 import functions_framework
-from notion_project_handler import NotionProjectHandler
-from notion_page_handler import NotionPageHandler
 from get_workspaces_api_keys import get_workspaces_api_keys
+from get_secret_from_google import get_secret
+from rule_engine import run_workspace_rules, select_rules
+from automation_rules import RULES
+from instrumentation import start_run, record_workspace_errors
+from audit_log import start_audit
+from shard_runner import ShardWorker, dispatch_shards
+from work_queue import Shard, get_work_queue
+from webhook_events import get_page_event_buffer, is_valid_signature, parse_webhook_events, run_ready_page_events
+from workspace_runner import run_workspaces
+
+
+def __get_notion_workspaces() -> list:
+    workspaces = get_workspaces_api_keys()
+    return workspaces['notion'].get('workspaces')
+
+
+def __get_requested_rules(request) -> list:
+    """Rule names from `?rules=naming,nudge` or a JSON body {"rules": [...]}; empty means all rules."""
+    rules = request.args.get('rules') if getattr(request, 'args', None) else None
+    if rules:
+        return [name.strip() for name in rules.split(',') if name.strip()]
+    body = request.get_json(silent=True) if hasattr(request, 'get_json') else None
+    if isinstance(body, dict) and body.get('rules'):
+        return list(body['rules'])
+    return []
+
+
+def __run_entry_point(entry_point: str, rule_names: list, success_message: str):
+    """
+    Run the rules on every workspace, several at once (see `workspace_runner`), and return the run
+    report as JSON, with a 500 status when a workspace failed. A failing workspace does not stop the others.
+    """
+    message = success_message
+    audit_log = None
+    with start_run(entry_point) as run_report, start_audit(entry_point) as audit_log:
+        notion_workspaces = __get_notion_workspaces()
+        if not notion_workspaces:
+            message = 'No notion workspace available'
+
+        record_workspace_errors(
+            run_workspaces(notion_workspaces or [], lambda workspace: run_workspace_rules(workspace, rule_names))
+        )
+
+    report = run_report.to_dict()
+    report['audit'] = audit_log.get_stats() if audit_log else None
+    report['message'] = message if report['ok'] else 'An error occurred'
+    return report, 200 if report['ok'] else 500
 
 
 @functions_framework.http
-def hello_http(request):
-    """Entry point for Google Cloud Function"""
+def run_automations(request):
+    """Entry point for Google Cloud Function. Scans each database once and runs every selected rule."""
     try:
-        # List of Notion workspaces with their tokens and root page IDs
-        workspaces = get_workspaces_api_keys()
-        notion_workspaces = workspaces['notion'].get('workspaces')
-        if not notion_workspaces:
-            return 'No notion workspace available'
+        rule_names = __get_requested_rules(request)
+        select_rules(rule_names)
+    except ValueError as err:
+        return {'message': str(err)}, 400
+    return __run_entry_point('run_automations', rule_names, 'Automations ran successfully')
+
 
-        for workspace in notion_workspaces:
-            notion_project_handler = NotionProjectHandler(workspace)
-            notion_project_handler.check_projects_for_proper_naming()
-        return 'Project names checked successfully'
-    except Exception as err:
-        return "An error occurred"
+@functions_framework.http
+def hello_http(request):
+    """Entry point for Google Cloud Function"""
+    return __run_entry_point('hello_http', ['naming'], 'Project names checked successfully')
 
 
 @functions_framework.http
 def check_and_update_assignees(request):
     """Entry point for Google Cloud Function"""
-    try:
-        workspaces = get_workspaces_api_keys()
-        notion_workspaces = workspaces['notion'].get('workspaces')
-        if not notion_workspaces:
-            return 'No notion workspace available'
-
-        for workspace in notion_workspaces:
-            notion_project_handler = NotionProjectHandler(workspace)
-            pages = notion_project_handler.get_all_pages_in_database()
-            for page in pages:
-                page['id'] = page['id'].replace('-', '')
-                notion_page_handler = NotionPageHandler(page['id'], workspace['token'])
-                status = notion_page_handler.get_page_status()
-                if status and (status != 'in-progress'):
-                    continue
-                assignee_data = notion_page_handler.get_page_assignees()
-                if len(assignee_data) > 0:
-                    continue
-                print("SETTING ASSIGNEE")
-                last_editor_id = notion_page_handler.get_page_last_editor_id()
-                notion_page_handler.assign_user_to_page(last_editor_id)
-    except Exception as err:
-        return "An error occurred"
+    return __run_entry_point('check_and_update_assignees', ['assignee'], 'Assignees checked successfully')
+
 
 @functions_framework.http
 def check_and_nudge_assignees_or_project_owner(request):
     """Entry point for Google Cloud Function"""
-    try:
-        workspaces = get_workspaces_api_keys()
-        notion_workspaces = workspaces['notion'].get('workspaces')
-        if not notion_workspaces:
-            return 'No notion workspace available'
-
-        for workspace in notion_workspaces:
-            notion_project_handler = NotionProjectHandler(workspace)
-            pages = notion_project_handler.get_all_pages_in_database()
-            for page in pages:
-                page['id'] = page['id'].replace('-', '')
-                notion_page_handler = NotionPageHandler(page['id'], workspace['token'])
-                status = notion_page_handler.get_page_status()
-                if status and (status != 'Not started'):
-                    continue
-                stale_period = notion_page_handler.get_days_since_last_edit()
-                is_due = notion_page_handler.check_if_task_is_due()
-
-                if stale_period > 14 or is_due:
-                    assignee_data = notion_page_handler.get_page_assignees()
-                    if len(assignee_data) > 0:
-                        print("NUDGING ASSIGNEE")
-                        comment = """
-                                    This project is overdue / is stale. 
-                                    You should consider removing yourself from it, prioritizing it, or delegating it.
-                                """
-                        notion_page_handler.nudge_page_assignee(comment)
-                    else:
-                        print("NUDGING PROJECT OWNER")
-                        comment = """
-                                    This project is overdue / stale. 
-                                    You should consider doing, deleting, or delegating it. 
-                                """
-                        notion_page_handler.nudge_page_owner(comment)
-                else:
-                    continue
-
-    except Exception as err:
-        return "An error occurred"
+    return __run_entry_point('check_and_nudge_assignees_or_project_owner', ['nudge'], 'Stale tasks checked successfully')
+
 
 @functions_framework.http
 def check_for_kpi_or_checklist_item(request):
-    try:
-        workspaces = get_workspaces_api_keys()
-        notion_workspaces = workspaces['notion'].get('workspaces')
-        if not notion_workspaces:
-            return 'No notion workspace available'
-
-        for workspace in notion_workspaces:
-            notion_project_handler = NotionProjectHandler(workspace)
-            pages = notion_project_handler.get_all_pages_in_database()
-            for page in pages:
-                if 'Accountability' in page['properties']:
-                    notion_page_handler = NotionPageHandler(page['id'], workspace['token'])
-                    checklist_or_kpi_attached = notion_page_handler.check_for_checklist_or_kpi()
-
-                    if checklist_or_kpi_attached:
-                        continue
-
-                    role_relations = notion_page_handler.page_data.get('properties', {}).get('Roles', {}).get('relation', [])
-                    if not role_relations:
-                        continue
-
-                    for relation in role_relations:
-                        relation_id = relation['id']
-                        relation_page_handler = NotionPageHandler(relation_id, workspace['token'])
-                        assigned_to = relation_page_handler.get_page_assigned_to()
-                        if assigned_to:
-                            for assignee in assigned_to:
-                                print('TAGGING THE ASSIGNEE AND COMMENTING...')
-                                comment = ' No KPI or Checklist attached to this accountability. Kindly attach one or more.'
-                                notion_page_handler.mention_and_comment(assignee['id'], comment)
-
-    except Exception as err:
-        return "An error occurred"
+    return __run_entry_point('check_for_kpi_or_checklist_item', ['kpi'], 'KPIs and checklists checked successfully')
+
 
 @functions_framework.http
 def update_page_content_with_a_full_stop(page_id):
-    try:
-        workspaces = get_workspaces_api_keys()
-        notion_workspaces = workspaces['notion'].get('workspaces')
-        if not notion_workspaces:
-            return 'No notion workspace available'
+    return __run_entry_point('update_page_content_with_a_full_stop', ['full_stop'], 'Full stops added successfully')
 
-        for workspace in notion_workspaces:
-            notion_project_handler = NotionProjectHandler(workspace)
-            pages = notion_project_handler.get_all_pages_in_database()
-            for page in pages:
-                page['id'] = page['id'].replace('-', '')
-                notion_page_handler = NotionPageHandler(page['id'], workspace['token'])
-                blocks = notion_page_handler.get_page_blocks()
 
-                if not blocks:
-                    continue
-
-                last_block = blocks[-1]
-                block_id = last_block.get("id")
-                block_type = last_block.get("type")
+@functions_framework.http
+def dispatch_automations(request):
+    """
+    Entry point for Google Cloud Function. Queues the run as shards on the work queue instead of
+    running it, for `run_automation_shards` workers; takes the same rule selection as `run_automations`.
+    """
+    try:
+        rule_names = __get_requested_rules(request)
+        select_rules(rule_names)
+    except ValueError as err:
+        return {'message': str(err)}, 400
 
-                if block_type in ["paragraph", "heading_1", "heading_2", "heading_3", "bulleted_list_item",
-                                  "numbered_list_item"]:
-                    text_content = last_block[block_type].get("rich_text", [])
+    shards = []
+    with start_run('dispatch_automations') as run_report:
+        shards = dispatch_shards(__get_notion_workspaces() or [], rule_names, get_work_queue())
 
-                    if not text_content:
-                        updated_text = "."
-                        notion_page_handler.update_block_text(block_id, block_type, updated_text)
+    report = run_report.to_dict()
+    report['shards'] = len(shards)
+    report['message'] = f'{len(shards)} shards queued' if report['ok'] else 'An error occurred'
+    return report, 200 if report['ok'] else 500
 
-                    if text_content:
-                        last_text = text_content[-1]["text"]["content"]
-                        updated_text = f"{last_text}."
-                        notion_page_handler.update_block_text(block_id, block_type, updated_text)
 
-                else:
-                    notion_page_handler.add_new_text_block(".")
-                    print(f"Added a new text block below the last block ID: {block_id}")
+@functions_framework.http
+def run_automation_shards(request):
+    """
+    Entry point for Google Cloud Function. Runs the shard pushed in the body ({"shard": {...}}, as
+    Cloud Tasks sends it), or else pulls shards from the work queue until the time budget runs out.
+    """
+    body = request.get_json(silent=True) if hasattr(request, 'get_json') else None
+    worker = None
+    audit_log = None
+    with start_run('run_automation_shards') as run_report, start_audit('run_automation_shards') as audit_log:
+        worker = ShardWorker(get_work_queue(), __get_notion_workspaces() or [])
+        if isinstance(body, dict) and body.get('shard'):
+            worker.run_shard(Shard.from_dict(body['shard']))
+        else:
+            worker.run_queued_shards()
+
+    report = run_report.to_dict()
+    report['shards'] = worker.get_report() if worker else None
+    report['audit'] = audit_log.get_stats() if audit_log else None
+    # A 500 makes Cloud Tasks retry a pushed shard
+    report['message'] = 'Shards ran successfully' if report['ok'] else 'An error occurred'
+    return report, 200 if report['ok'] else 500
 
-    except Exception as err:
-        return "An error occurred"
 
+@functions_framework.http
+def handle_notion_webhook(request):
+    """
+    Entry point for Notion webhooks. Change events are buffered per page, and each page gets the
+    rules its changes can trigger once its events have settled (see `webhook_events`). A call
+    without events, e.g. from Cloud Scheduler every minute, processes the pages that are ready.
+    """
+    body = request.get_json(silent=True) if hasattr(request, 'get_json') else None
+    if isinstance(body, dict) and body.get('verification_token'):
+        # Sent once when the subscription is created; the token has to be entered in Notion to verify it
+        print("NOTION WEBHOOK VERIFICATION TOKEN ==> ", body['verification_token'])
+        return {'message': 'Verification token received'}, 200
+
+    if body:
+        verification_token = get_secret("NOTION_WEBHOOK_VERIFICATION_TOKEN")
+        if not verification_token or not is_valid_signature(
+                request.get_data(), request.headers.get('X-Notion-Signature'), verification_token):
+            return {'message': 'Invalid signature'}, 401
 
+    try:
+        rule_names = __get_requested_rules(request)
+        select_rules(rule_names)
+    except ValueError as err:
+        return {'message': str(err)}, 400
+
+    events = parse_webhook_events(body)
+    processed = {}
+    audit_log = None
+    with start_run('handle_notion_webhook') as run_report, start_audit('handle_notion_webhook') as audit_log:
+        buffer = get_page_event_buffer()
+        buffer.add(events)
+        processed = run_ready_page_events(buffer, __get_notion_workspaces() or [], rule_names)
+
+    report = run_report.to_dict()
+    report['events'] = len(events)
+    report['changed_pages'] = processed
+    report['audit'] = audit_log.get_stats() if audit_log else None
+    report['message'] = 'Webhook events handled' if report['ok'] else 'An error occurred'
+    return report, 200 if report['ok'] else 500
 
 
+@functions_framework.http
+def run_reconciliation_sweep(request):
+    """
+    Entry point for Google Cloud Function. Low-frequency sweep running the time-based rules (e.g.
+    stale task nudges) on every page, since pages nobody edits send no webhook events.
+    """
+    rule_names = [name for name, rule in RULES.items() if rule.time_based]
+    return __run_entry_point('run_reconciliation_sweep', rule_names, 'Reconciliation sweep ran successfully')
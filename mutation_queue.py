@@ -0,0 +1,267 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+MUTATION_WORKERS = int(os.getenv("MUTATION_WORKERS", 4))
+# Pending pages are written out once this many are buffered, to keep memory bounded; the page
+# being written is kept, so its comments are still merged
+MAX_PENDING_PAGES = int(os.getenv("MUTATION_MAX_PENDING_PAGES", 200))
+# Notion accepts at most 100 rich text items per comment
+MAX_MENTIONS_PER_COMMENT = 40
+
+
+class MutationResult(NamedTuple):
+    page_id: str
+    kind: str  # "update" or "comment"
+    merged: int  # number of buffered mutations sent in this request
+    ok: bool
+    error: Optional[str] = None
+
+
+class MutationBuffer:
+    """
+    Collects the writes made to each page so they can be sent as few requests as possible.
+
+    Property updates to a page are merged into a single `pages.update`. Comments whose text is
+    the same are merged into one comment mentioning every recipient. A comment's `on_sent`
+    callback is called with whether the request carrying it succeeded.
+    """
+
+    def __init__(self, max_pending_pages: int = MAX_PENDING_PAGES):
+        self.max_pending_pages = max_pending_pages
+        self.pending: "OrderedDict[str, Dict]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __get_page(self, page_id: str) -> Dict:
+        page = self.pending.get(page_id)
+        if page is None:
+            page = self.pending[page_id] = {"properties": {}, "updates": 0, "comments": OrderedDict()}
+        return page
+
+    def _buffer_update(self, page_id: str, properties: dict) -> bool:
+        """Buffer a properties update; returns True when enough pages are pending to flush."""
+        with self.lock:
+            page = self.__get_page(page_id)
+            page["properties"].update(properties)
+            page["updates"] += 1
+            return len(self.pending) >= self.max_pending_pages
+
+    def _buffer_comment(self, page_id: str, rich_text: list, on_sent: Callable[[bool], None] = None) -> bool:
+        """Buffer a comment; returns True when enough pages are pending to flush."""
+        mentions = [item for item in rich_text if "mention" in item]
+        text = [item for item in rich_text if "mention" not in item]
+        with self.lock:
+            comments = self.__get_page(page_id)["comments"]
+            comment = comments.setdefault(json.dumps(text, sort_keys=True),
+                                          {"text": text, "mentions": [], "count": 0, "callbacks": []})
+            if on_sent is not None:
+                # Called with the result of the request carrying the comment's first mention
+                comment["callbacks"].append((mentions[0]["mention"]["user"]["id"] if mentions else None, on_sent))
+            known_ids = {mention["mention"]["user"]["id"] for mention in comment["mentions"]}
+            for mention in mentions:
+                if mention["mention"]["user"]["id"] not in known_ids:
+                    comment["mentions"].append(mention)
+                    known_ids.add(mention["mention"]["user"]["id"])
+            comment["count"] += 1
+            return len(self.pending) >= self.max_pending_pages
+
+    def _take_requests(self, page_id: str = None, keep: str = None) -> List[Tuple[str, str, dict, int, tuple]]:
+        """
+        Remove one page (or every page but `keep`) from the buffer and return its (page_id, kind,
+        payload, merged, callbacks) requests.
+        """
+        with self.lock:
+            if page_id is None:
+                pages = [(pending_id, page) for pending_id, page in self.pending.items() if pending_id != keep]
+                for pending_id, _ in pages:
+                    del self.pending[pending_id]
+            else:
+                page = self.pending.pop(page_id, None)
+                pages = [(page_id, page)] if page else []
+
+        requests = []
+        for page_id, page in pages:
+            if page["properties"]:
+                requests.append((page_id, "update", page["properties"], page["updates"], ()))
+            for comment in page["comments"].values():
+                mentions = comment["mentions"]
+                if not mentions:
+                    callbacks = tuple(callback for _, callback in comment["callbacks"])
+                    requests.append((page_id, "comment", comment["text"], comment["count"], callbacks))
+                    continue
+                for start in range(0, len(mentions), MAX_MENTIONS_PER_COMMENT):
+                    chunk = mentions[start:start + MAX_MENTIONS_PER_COMMENT]
+                    rich_text = []
+                    for mention in chunk:
+                        if rich_text:
+                            rich_text.append({"text": {"content": " "}})
+                        rich_text.append(mention)
+                    merged = comment["count"] if start == 0 else 0
+                    chunk_ids = {mention["mention"]["user"]["id"] for mention in chunk}
+                    callbacks = tuple(callback for user_id, callback in comment["callbacks"]
+                                      if user_id in chunk_ids or (user_id is None and start == 0))
+                    requests.append((page_id, "comment", rich_text + comment["text"], merged, callbacks))
+        return requests
+
+    @staticmethod
+    def _notify_sent(result: 'MutationResult', callbacks: tuple) -> 'MutationResult':
+        for callback in callbacks:
+            try:
+                callback(result.ok)
+            except Exception as err:
+                print(f"MUTATION CALLBACK ON PAGE {result.page_id} ERR ==> ", err)
+        return result
+
+
+class MutationQueue(MutationBuffer):
+    """Write-behind queue for the sync handlers; requests are sent by a bounded thread pool."""
+
+    def __init__(self, notion_client, max_workers: int = MUTATION_WORKERS, max_pending_pages: int = MAX_PENDING_PAGES):
+        super().__init__(max_pending_pages)
+        self.notion_client = notion_client
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Bounds the requests waiting on the pool, so the scan blocks instead of piling up writes
+        self.in_flight = threading.BoundedSemaphore(max_workers * 4)
+        self.futures = set()
+        self.results: List[MutationResult] = []
+
+    def update_properties(self, page_id: str, properties: dict):
+        if self._buffer_update(page_id, properties):
+            self.__submit(self._take_requests(keep=page_id))
+
+    def add_comment(self, page_id: str, rich_text: list, on_sent: Callable[[bool], None] = None):
+        if self._buffer_comment(page_id, rich_text, on_sent):
+            self.__submit(self._take_requests(keep=page_id))
+
+    def flush_page(self, page_id: str):
+        """Send everything buffered for a page."""
+        self.__submit(self._take_requests(page_id))
+
+    def flush(self):
+        """Send everything buffered."""
+        self.__submit(self._take_requests())
+
+    def wait(self):
+        """Send everything buffered and wait until every request sent so far is done."""
+        self.flush()
+        with self.lock:
+            futures = list(self.futures)
+        concurrent.futures.wait(futures)
+
+    def __submit(self, requests):
+        for request in requests:
+            self.in_flight.acquire()
+            # The copied context keeps the writes attributed to the workspace in the run report
+            future = self.executor.submit(contextvars.copy_context().run, self.__send, *request)
+            with self.lock:
+                self.futures.add(future)
+            future.add_done_callback(self.__collect)
+
+    def __collect(self, future):
+        # Only the result is kept, so finished requests don't pile up for the whole run
+        with self.lock:
+            self.futures.discard(future)
+            self.results.append(future.result())
+        self.in_flight.release()
+
+    def __send(self, page_id: str, kind: str, payload, merged: int, callbacks: tuple) -> MutationResult:
+        try:
+            if kind == "update":
+                self.notion_client.pages.update(page_id, properties=payload)
+            else:
+                self.notion_client.comments.create(parent={"page_id": page_id}, rich_text=payload)
+            result = MutationResult(page_id, kind, merged, True)
+        except Exception as err:
+            result = MutationResult(page_id, kind, merged, False, str(err))
+        # Before the future completes, so `wait` returns only once the callbacks ran
+        return self._notify_sent(result, callbacks)
+
+    def close(self) -> List[MutationResult]:
+        """Send what is left, wait for every request and return their results."""
+        self.flush()
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            results, self.results = self.results, []
+        return results
+
+
+class AsyncMutationQueue(MutationBuffer):
+    """Write-behind queue for the async handlers; at most `max_workers` requests are in flight."""
+
+    def __init__(self, notion_client, max_workers: int = MUTATION_WORKERS, max_pending_pages: int = MAX_PENDING_PAGES):
+        super().__init__(max_pending_pages)
+        self.notion_client = notion_client
+        self.semaphore = asyncio.Semaphore(max_workers)
+        self.tasks = set()
+        self.results: List[MutationResult] = []
+
+    def update_properties(self, page_id: str, properties: dict):
+        if self._buffer_update(page_id, properties):
+            self.__submit(self._take_requests(keep=page_id))
+
+    def add_comment(self, page_id: str, rich_text: list, on_sent: Callable[[bool], None] = None):
+        if self._buffer_comment(page_id, rich_text, on_sent):
+            self.__submit(self._take_requests(keep=page_id))
+
+    def flush_page(self, page_id: str):
+        self.__submit(self._take_requests(page_id))
+
+    def flush(self):
+        self.__submit(self._take_requests())
+
+    async def wait(self):
+        """Send everything buffered and wait until every request sent so far is done."""
+        self.flush()
+        await asyncio.gather(*self.tasks)
+
+    def __submit(self, requests):
+        for request in requests:
+            task = asyncio.ensure_future(self.__send(*request))
+            self.tasks.add(task)
+            task.add_done_callback(self.__collect)
+
+    def __collect(self, task):
+        self.tasks.discard(task)
+        self.results.append(task.result())
+
+    async def __send(self, page_id: str, kind: str, payload, merged: int, callbacks: tuple) -> MutationResult:
+        async with self.semaphore:
+            try:
+                if kind == "update":
+                    await self.notion_client.pages.update(page_id, properties=payload)
+                else:
+                    await self.notion_client.comments.create(parent={"page_id": page_id}, rich_text=payload)
+                result = MutationResult(page_id, kind, merged, True)
+            except Exception as err:
+                result = MutationResult(page_id, kind, merged, False, str(err))
+            return self._notify_sent(result, callbacks)
+
+    async def close(self) -> List[MutationResult]:
+        self.flush()
+        await asyncio.gather(*self.tasks)
+        results, self.results = self.results, []
+        return results
+
+
+def summarize_mutation_results(results: List[MutationResult], max_failures: int = 20) -> Dict:
+    failed = [result for result in results if not result.ok]
+    return {
+        'sent': len(results),
+        'merged': sum(result.merged for result in results),
+        'failed': len(failed),
+        'failures': [result._asdict() for result in failed[:max_failures]],
+    }
+
+
+def print_mutation_results(results: List[MutationResult], label: str):
+    failed = [result for result in results if not result.ok]
+    merged = sum(result.merged for result in results)
+    print(f"{label}: {len(results)} WRITES SENT FOR {merged} MUTATIONS, {len(failed)} FAILED")
+    for result in failed:
+        print(f"    {result.kind.upper()} ON PAGE {result.page_id} FAILED ==> {result.error}")
@@ -0,0 +1,105 @@
+"""Rule tier of the project-name check: settles clear-cut names locally so only the others reach Claude."""
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Present perfect or present tense constructions, as required by the naming convention
+VALID_NAME_PATTERNS = [
+    re.compile(r'.+\s+is\s+.+'),  # "drawer is stocked"
+    re.compile(r'.+\s+has\s+been\s+.+'),  # "drawer has been stocked"
+    re.compile(r'.+\s+are\s+.+'),  # "supplies are organized"
+    re.compile(r'.+\s+have\s+been\s+.+'),  # "supplies have been organized"
+]
+# Past participles that always describe a completed outcome; adjectives ("red", "open") are left to Claude
+PAST_PARTICIPLES = (
+    "added", "approved", "archived", "booked", "bought", "built", "closed", "completed", "confirmed", "created",
+    "delivered", "deployed", "designed", "documented", "done", "drafted", "filed", "finished", "fixed", "hired",
+    "implemented", "installed", "launched", "made", "merged", "migrated", "ordered", "organised", "organized", "paid",
+    "planned", "prepared", "published", "released", "removed", "resolved", "reviewed", "scheduled", "sent", "set up",
+    "shipped", "signed", "sold", "stocked", "submitted", "tested", "updated", "uploaded", "verified", "written",
+)
+__PARTICIPLE = r'(?:fully\s+|now\s+|all\s+)?(?:' + '|'.join(p.replace(' ', r'\s+') for p in PAST_PARTICIPLES) + r')\b'
+# A subject, then "has/have been" or "is/are", then a participle: "drawer has been stocked", "docs are written"
+OUTCOME_NAME_PATTERN = re.compile(r'^\S.*\s(?:(?:has|have)\s+been|is|are)\s+' + __PARTICIPLE)
+
+# Verbs that open a task rather than name an outcome and are hardly ever nouns; "plan", "book",
+# "review" or "update" also open noun phrases ("Book club"), so names starting with them go to Claude
+IMPERATIVE_VERBS = ("fix", "write", "prepare", "organize", "organise", "send", "finish", "complete", "create",
+                    "implement", "install", "migrate", "refactor", "submit", "deploy", "hire", "remove", "buy")
+TASK_NAME_PATTERN = re.compile(r'^(?:' + '|'.join(IMPERATIVE_VERBS) + r')\s+\w')
+STATE_VERB_PATTERN = re.compile(r'\b(?:is|are|has|have|was|were|been|being)\b')
+
+
+def is_valid_project_name(name: str) -> bool:
+    """Check if project name follows GTD outcome-focused naming convention"""
+    name = name.lower()
+    return any(pattern.match(name) for pattern in VALID_NAME_PATTERNS)
+
+
+def classify_project_name(name: str) -> Optional[Tuple[bool, Optional[str]]]:
+    """
+    Settle a name with the local rules when the verdict is clear-cut. A name opening with an
+    unambiguous imperative verb is invalid, but no new title is written here: only Claude's
+    suggestions rename a page.
+
+    :return: (True, name) for a valid name, (False, None) for an invalid one, or None when the
+        name needs Claude.
+    """
+    name = name.strip()
+    lowered = name.lower()
+    if OUTCOME_NAME_PATTERN.match(lowered):
+        return True, name
+    if TASK_NAME_PATTERN.match(lowered) and not STATE_VERB_PATTERN.search(lowered):
+        return False, None
+    return None
+
+
+def classify_project_names(names: List[str]) -> List[Optional[Tuple[bool, Optional[str]]]]:
+    return [classify_project_name(name) for name in names]
+
+
+class NameCheckStats:
+    """
+    Process-wide counters of how project names were settled: by the rules, the verdict cache,
+    Claude, or the regex fallback when Claude fails. Claude's time is tracked too, so the time
+    the other tiers save can be estimated.
+    """
+    TIERS = ('rules', 'cache', 'llm', 'fallback')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits: Dict[str, int] = {tier: 0 for tier in self.TIERS}
+        self.llm_requests = 0
+        self.llm_seconds = 0.0
+
+    def record(self, tier: str, count: int = 1):
+        with self.lock:
+            self.hits[tier] += count
+
+    def record_llm_request(self, started_at: float):
+        with self.lock:
+            self.llm_requests += 1
+            self.llm_seconds += time.monotonic() - started_at
+
+    def get_report(self) -> Dict:
+        with self.lock:
+            total = sum(self.hits.values())
+            llm_seconds_per_name = self.llm_seconds / self.hits['llm'] if self.hits['llm'] else 0.0
+            return {
+                'names': total,
+                'hits': dict(self.hits),
+                'hit_rates': {tier: hits / total if total else 0.0 for tier, hits in self.hits.items()},
+                'llm_requests': self.llm_requests,
+                'llm_seconds': round(self.llm_seconds, 3),
+                'estimated_llm_seconds_saved': round((self.hits['rules'] + self.hits['cache']) * llm_seconds_per_name, 3),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.hits = {tier: 0 for tier in self.TIERS}
+            self.llm_requests = 0
+            self.llm_seconds = 0.0
+
+
+name_check_stats = NameCheckStats()
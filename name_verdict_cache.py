@@ -0,0 +1,126 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from json_store import JSONStore, get_json_store
+
+VERDICT_CACHE_TTL_SECONDS = float(os.getenv("VERDICT_CACHE_TTL_DAYS", 30)) * 24 * 3600
+VERDICT_CACHE_MEMORY_SIZE = int(os.getenv("VERDICT_CACHE_MEMORY_SIZE", 5000))
+VERDICT_CACHE_DURABLE_SIZE = int(os.getenv("VERDICT_CACHE_DURABLE_SIZE", 50000))
+DOCUMENT_KEY = 'name_verdicts'
+
+
+def normalize_project_name(name: str) -> str:
+    """Case, surrounding punctuation and repeated whitespace do not change a name's verdict."""
+    return re.sub(r'\s+', ' ', name).strip().strip('.!?,;:').strip().casefold()
+
+
+def get_prompt_version(*parts: str) -> str:
+    """Hash of the prompts and model behind the verdicts; changing any of them invalidates the cache."""
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+class NameVerdictCache:
+    """
+    Content-addressed cache of project-name verdicts from Claude.
+
+    Entries are keyed on the normalized name and the prompt version. Lookups hit an in-memory
+    LRU first and fall back to the durable tier, a JSON document loaded once per process and
+    written back after new verdicts are added. A durable document written for another prompt
+    version is discarded on load.
+    """
+
+    def __init__(self, store: JSONStore, prompt_version: str, ttl: float = VERDICT_CACHE_TTL_SECONDS,
+                 memory_size: int = VERDICT_CACHE_MEMORY_SIZE, durable_size: int = VERDICT_CACHE_DURABLE_SIZE):
+        self.store = store
+        self.prompt_version = prompt_version
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.durable_size = durable_size
+        self.memory: OrderedDict = OrderedDict()
+        self.durable: Optional[Dict[str, Dict]] = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def __get_key(self, name: str) -> str:
+        content = f"{self.prompt_version}\0{normalize_project_name(name)}"
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def __load_durable(self) -> Dict[str, Dict]:
+        if self.durable is None:
+            document = self.store.load(DOCUMENT_KEY)
+            if document.get('prompt_version') == self.prompt_version:
+                self.durable = document.get('entries', {})
+            else:
+                self.durable = {}
+                self.dirty = bool(document)
+        return self.durable
+
+    def __is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry['cached_at'] < self.ttl
+
+    def get(self, name: str) -> Optional[Tuple[bool, str]]:
+        key = self.__get_key(name)
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None:
+                entry = self.__load_durable().get(key)
+            if entry is None or not self.__is_fresh(entry):
+                return None
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            if len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+            return entry['is_valid'], entry['suggestion']
+
+    def put(self, name: str, is_valid: bool, suggestion: str):
+        key = self.__get_key(name)
+        entry = {'is_valid': is_valid, 'suggestion': suggestion, 'cached_at': time.time()}
+        with self.lock:
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            if len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+            self.__load_durable()[key] = entry
+            self.dirty = True
+
+    def save(self):
+        """Write new verdicts to the durable tier, dropping expired and the oldest entries past its size."""
+        with self.lock:
+            if not self.dirty:
+                return
+            entries = {key: entry for key, entry in self.__load_durable().items() if self.__is_fresh(entry)}
+            if len(entries) > self.durable_size:
+                newest = sorted(entries.items(), key=lambda item: item[1]['cached_at'])[-self.durable_size:]
+                entries = dict(newest)
+            self.durable = entries
+            document = {'prompt_version': self.prompt_version, 'entries': entries}
+            self.dirty = False
+        try:
+            self.store.save(DOCUMENT_KEY, document)
+        except Exception as err:
+            print("ERROR SAVING NAME VERDICT CACHE ==> ", err)
+
+    def clear(self):
+        """Forget every verdict, in memory and in the durable tier."""
+        with self.lock:
+            self.memory.clear()
+            self.durable = {}
+            self.dirty = True
+        self.save()
+
+
+__cache: Optional[NameVerdictCache] = None
+__cache_lock = threading.Lock()
+
+
+def get_name_verdict_cache(prompt_version: str) -> NameVerdictCache:
+    """Process-wide cache, kept across warm invocations; rebuilt when the prompt version changes."""
+    global __cache
+    with __cache_lock:
+        if __cache is None or __cache.prompt_version != prompt_version:
+            __cache = NameVerdictCache(get_json_store('verdict_cache'), prompt_version)
+        return __cache
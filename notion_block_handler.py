@@ -1,15 +1,15 @@
 import os
 import re
-from notion_client import Client
-from dotenv import load_dotenv
+from notion_client_registry import get_notion_client
+from local_env import load_local_env
 from datetime import datetime, timezone
-load_dotenv()
+load_local_env()
 
 
 class NotionBlockHandler:
     def __init__(self, page_id, token: str):
         self.block_id = page_id
-        self.notion_client = Client(auth=token)
+        self.notion_client = get_notion_client(token)
         self.page_data: dict = self.__get_page_data()
 
     def __get_page_data(self):
@@ -0,0 +1,91 @@
+import atexit
+import os
+import threading
+from typing import Dict
+
+import httpx
+from notion_client import Client, AsyncClient
+from notion_rate_limiter import RateLimitedClient, AsyncRateLimitedClient
+
+# Pool limits can be tuned per deployment through environment variables
+POOL_LIMITS = {
+    "max_connections": int(os.getenv("NOTION_MAX_CONNECTIONS", 20)),
+    "max_keepalive_connections": int(os.getenv("NOTION_MAX_KEEPALIVE_CONNECTIONS", 10)),
+    "keepalive_expiry": float(os.getenv("NOTION_KEEPALIVE_EXPIRY", 60)),
+}
+
+# Points the clients at another server, e.g. the fake Notion API used by the benchmarks
+NOTION_BASE_URL = os.getenv("NOTION_BASE_URL", "https://api.notion.com")
+
+__clients: Dict[str, Client] = {}
+__lock = threading.Lock()
+
+
+def configure_pool_limits(**limits):
+    """
+    Override the connection pool limits used for clients created from now on.
+
+    :param limits: Any of max_connections, max_keepalive_connections and keepalive_expiry.
+    """
+    unknown = set(limits) - set(POOL_LIMITS)
+    if unknown:
+        raise ValueError(f"Unknown pool limits: {', '.join(sorted(unknown))}")
+    POOL_LIMITS.update(limits)
+
+
+def get_notion_client(token: str) -> Client:
+    """
+    Return the shared Notion client for a token, creating it on first use.
+
+    The client lives for the whole process, so its keep-alive connections are reused across
+    handlers, sweeps and warm Cloud Function invocations. Its requests are paced and retried by
+    the shared rate limiter.
+    """
+    client = __clients.get(token)
+    if client is not None:
+        return client
+
+    with __lock:
+        client = __clients.get(token)
+        if client is None:
+            http_client = httpx.Client(limits=httpx.Limits(**POOL_LIMITS))
+            client = RateLimitedClient(auth=token, client=http_client, base_url=NOTION_BASE_URL)
+            __clients[token] = client
+        return client
+
+
+def create_async_notion_client(token: str) -> AsyncClient:
+    """
+    Create an AsyncClient for a token using the configured pool limits.
+
+    Async clients are bound to the event loop they are used on, so they are not shared through
+    the registry; the caller must `await client.aclose()` when the run is done.
+    """
+    http_client = httpx.AsyncClient(limits=httpx.Limits(**POOL_LIMITS))
+    return AsyncRateLimitedClient(auth=token, client=http_client, base_url=NOTION_BASE_URL)
+
+
+def close_notion_client(token: str):
+    """Close and forget the shared client for a token."""
+    with __lock:
+        client = __clients.pop(token, None)
+    if client is not None:
+        try:
+            client.close()
+        except Exception as err:
+            print("CLOSING NOTION CLIENT ERR ==> ", err)
+
+
+def close_all_notion_clients():
+    """Close every shared client. Registered to run on interpreter shutdown."""
+    with __lock:
+        clients = list(__clients.values())
+        __clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as err:
+            print("CLOSING NOTION CLIENT ERR ==> ", err)
+
+
+atexit.register(close_all_notion_clients)
@@ -0,0 +1,90 @@
+"""Builders for Notion database query filter objects used by the sweeps."""
+from typing import Dict, Iterable, List, Optional
+
+
+def has_property(properties: Dict, name: str, property_type: str) -> bool:
+    """Check a database schema (as returned by `databases.retrieve`) for a property of the given type."""
+    return properties.get(name, {}).get("type") == property_type
+
+
+def get_property_ids(properties: Dict, names: Iterable[str]) -> List[str]:
+    """
+    Ids of the named properties, for `filter_properties`, in schema order. Works on a database
+    schema and on a page's properties alike; names missing from them are left out.
+    """
+    names = set(names)
+    return [value['id'] for name, value in properties.items() if name in names and value.get('id')]
+
+
+def get_title_property_name(properties: Dict) -> Optional[str]:
+    return next((name for name, value in properties.items() if value.get('type') == 'title'), None)
+
+
+def status_equals(name: str, property_name: str = "Status") -> Dict:
+    return {"property": property_name, "status": {"equals": name}}
+
+
+def status_is_empty(property_name: str = "Status") -> Dict:
+    return {"property": property_name, "status": {"is_empty": True}}
+
+
+def checkbox_equals(property_name: str, value: bool) -> Dict:
+    return {"property": property_name, "checkbox": {"equals": value}}
+
+
+def relation_is_empty(property_name: str) -> Dict:
+    return {"property": property_name, "relation": {"is_empty": True}}
+
+
+def any_of(*filters: Optional[Dict]) -> Optional[Dict]:
+    """Combine filters with "or", dropping missing ones and flattening nested "or"s."""
+    return __combine("or", filters)
+
+
+def all_of(*filters: Optional[Dict]) -> Optional[Dict]:
+    """Combine filters with "and", dropping missing ones and flattening nested "and"s."""
+    return __combine("and", filters)
+
+
+def __combine(operator: str, filters) -> Optional[Dict]:
+    # Notion only accepts two levels of compound filters, so same-operator nesting is flattened
+    flattened = []
+    for f in filters:
+        if not f:
+            continue
+        flattened.extend(f[operator] if operator in f else [f])
+    if not flattened:
+        return None
+    return flattened[0] if len(flattened) == 1 else {operator: flattened}
+
+
+def last_edited_on_or_after(timestamp: str) -> Dict:
+    return {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": timestamp}}
+
+
+def restrict_to_edited_since(filter: Optional[Dict], timestamp: str) -> Dict:
+    """
+    Restrict a filter to pages edited at or after `timestamp`.
+
+    The time condition is distributed over a top-level "or" so the result stays within
+    Notion's two levels of nesting.
+    """
+    time_filter = last_edited_on_or_after(timestamp)
+    if filter and "or" in filter:
+        return {"or": [all_of(time_filter, f) for f in filter["or"]]}
+    return all_of(time_filter, filter)
+
+
+def status_or_empty_filter(properties: Dict, status_name: str) -> Optional[Dict]:
+    """Status equals `status_name` or is unset; None when the database has no Status property."""
+    if not has_property(properties, "Status", "status"):
+        return None
+    return any_of(status_equals(status_name), status_is_empty())
+
+
+def missing_kpi_and_checklist_filter(properties: Dict) -> Optional[Dict]:
+    """Both the KPI and Checklist relations are empty, for whichever of them the database has."""
+    return all_of(
+        relation_is_empty("KPI") if has_property(properties, "KPI", "relation") else None,
+        relation_is_empty("Checklist") if has_property(properties, "Checklist", "relation") else None
+    )
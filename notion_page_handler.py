@@ -1,98 +1,130 @@
 import os
 import re
-from notion_client import Client
-from dotenv import load_dotenv
+from collections import deque
+from typing import Iterator
+from notion_client_registry import get_notion_client
+from page_snapshot import PageSnapshot, as_snapshot, parse_due_date, parse_timestamp
+from audit_log import audit
+from local_env import load_local_env
 from datetime import datetime, timezone
-load_dotenv()
+load_local_env()
+
+TEXT_BLOCK_TYPES = ["paragraph", "heading_1", "heading_2", "heading_3", "bulleted_list_item", "numbered_list_item"]
+
+STALE_ASSIGNEE_COMMENT = """
+                                    This project is overdue / is stale. 
+                                    You should consider removing yourself from it, prioritizing it, or delegating it.
+                                """
+STALE_OWNER_COMMENT = """
+                                    This project is overdue / stale. 
+                                    You should consider doing, deleting, or delegating it. 
+                                """
+MISSING_KPI_COMMENT = ' No KPI or Checklist attached to this accountability. Kindly attach one or more.'
+TASK_NAME_COMMENT = 'Invalid Name detected. Name the project after its outcome, e.g. "Drawer has been stocked".'
 
 
 class NotionPageHandler:
-    def __init__(self, page_id, token: str):
+    def __init__(self, page_id, token: str, page=None, mutation_queue=None, filter_properties: list = None,
+                 user_directory=None):
+        """
+        :param page_id: The ID of the Notion page.
+        :param token: The Notion integration token.
+        :param page: A page object already returned by `databases.query`, or its PageSnapshot. When
+            given, the page is not retrieved again; call `refresh_page_data` if fresh data is needed.
+        :param mutation_queue: A MutationQueue to buffer property updates and comments in, so they
+            are coalesced and sent later; without one they are sent right away.
+        :param filter_properties: Ids of the only properties to retrieve; all of them when omitted.
+        :param user_directory: The workspace's UserDirectory; mentions and assignments of users who
+            aren't in it as people are skipped. Without one, every user id is written as is.
+        """
         self.page_id = page_id
-        self.notion_client = Client(auth=token)
-        self.page_data: dict = self.__get_page_data()
-
-    def __get_page_data(self):
-        page_data = self.notion_client.pages.retrieve(page_id=self.page_id)
-        return page_data
+        self.notion_client = get_notion_client(token)
+        self.mutation_queue = mutation_queue
+        self.filter_properties = filter_properties
+        self.user_directory = user_directory
+        # Only the fields the rules read are kept, not the page JSON
+        self.page: PageSnapshot = as_snapshot(page) if page is not None else self.__get_page_data()
+
+    @classmethod
+    def from_page(cls, page, token: str, mutation_queue=None, user_directory=None):
+        """Build a handler from a page object (or snapshot) returned by a database query without refetching it."""
+        page = as_snapshot(page)
+        return cls(page.id.replace('-', ''), token, page=page, mutation_queue=mutation_queue,
+                   user_directory=user_directory)
+
+    def __get_page_data(self) -> PageSnapshot:
+        return PageSnapshot.from_page(retrieve_page(self.notion_client, self.page_id, self.filter_properties))
+
+    def refresh_page_data(self) -> PageSnapshot:
+        """Retrieve the page again and replace the cached snapshot."""
+        self.page = self.__get_page_data()
+        return self.page
+
+    def _update_properties(self, properties: dict):
+        if self.mutation_queue is not None:
+            self.mutation_queue.update_properties(self.page_id, properties)
+            return
+        self.notion_client.pages.update(page_id=self.page_id, properties=properties)
+
+    def _create_comment(self, rich_text: list, on_sent=None):
+        """
+        :param on_sent: Called with whether the comment was sent, once it is (it may be buffered)
+        """
+        if self.mutation_queue is not None:
+            self.mutation_queue.add_comment(self.page_id, rich_text, on_sent)
+            return
+        try:
+            self.notion_client.comments.create(parent={"page_id": self.page_id}, rich_text=rich_text)
+        except Exception:
+            if on_sent is not None:
+                on_sent(False)
+            raise
+        if on_sent is not None:
+            on_sent(True)
+
+    def flush_writes(self):
+        """Send the writes buffered for this page, for rules that write after the engine flushed it."""
+        if self.mutation_queue is not None:
+            self.mutation_queue.flush_page(self.page_id)
+
+    def is_valid_user(self, user_id) -> bool:
+        """Whether a user can be mentioned or assigned; any user can when there is no directory."""
+        return self.user_directory is None or self.user_directory.is_valid_target(user_id)
 
     def update_page_name(self, new_name: str):
         try:
-            properties = {
-                "title": {
-                    "title": [
-                        {
-                            "text": {
-                                "content": new_name
-                            },
-                            "annotations": {
-                                "bold": False,
-                                "italic": False,
-                                "strikethrough": False,
-                                "underline": False,
-                                "code": False,
-                                "color": "default"
-                            },
-                            "plain_text": new_name
-                        }
-                    ]
-                },
-                "title checked": {
-                    "checkbox": True  # Set the checkbox to True
-                }
-            }
-
-            self.notion_client.pages.update(self.page_id, properties=properties)
+            self._update_properties(build_page_name_properties(new_name))
         except Exception as err:
             print("UPDATING PAGE NAME ERR ==> ", err)
 
     def add_comment(self, comment: str = 'Invalid Name detected'):
         try:
-            parent = {"page_id": self.page_id}
-            rich_text = [{"text": {"content": comment}}]
-
-            self.notion_client.comments.create(
-                parent=parent,
-                rich_text=rich_text
-            )
+            self._create_comment([{"text": {"content": comment}}])
         except Exception as err:
             print("ADDING COMMENTS ERR ==> ", err)
 
-    def mention_and_comment(self, user_id: str, comment: str):
+    def mention_and_comment(self, user_id: str, comment: str, on_sent=None):
+        if not self.is_valid_user(user_id):
+            print(f"SKIPPING COMMENT MENTIONING {user_id}: NOT A WORKSPACE MEMBER")
+            audit('target_skipped', page_id=self.page_id, user_id=user_id, action='comment')
+            if on_sent is not None:
+                on_sent(False)
+            return
         try:
-            parent = {"page_id": self.page_id}
-            mention = {
-                "mention": {
-                    "type": "user",
-                    "user": {
-                        "object": "user",
-                        "id": user_id
-                    }
-                }
-            }
-            rich_text = [mention, {"text": {"content": comment}}]
-
-            self.notion_client.comments.create(
-                parent=parent,
-                rich_text=rich_text
-            )
+            self._create_comment(build_mention_rich_text(user_id, comment), on_sent)
         except Exception as err:
             print("ADDING COMMENTS ERR ==> ", err)
+
     def mark_page_as_checked(self):
         try:
-            properties = {
-                "title checked": {
-                    "checkbox": True  # Set the checkbox to True
-                }
-            }
-            self.notion_client.pages.update(self.page_id, properties=properties)
+            self._update_properties(build_title_checked_properties())
         except Exception as err:
             print("COULDN'T MARK PAGE AS CHECKED ==> ", err)
 
     def get_page_last_editor_id(self):
         """Retrieves the last editor of a specified Notion page and assigns it to the page."""
         try:
-            last_editor_id = self.page_data.get("last_edited_by", {}).get("id")
+            last_editor_id = self.page.last_edited_by_id
             if not last_editor_id:
                 return "Last editor information not available for this page."
             print("Last editor ID:", last_editor_id)
@@ -101,52 +133,43 @@ class NotionPageHandler:
             print("Error fetching or updating page details:", e)
 
     def assign_user_to_page(self, user_id):
+        if not self.is_valid_user(user_id):
+            print(f"SKIPPING ASSIGNMENT OF {user_id}: NOT A WORKSPACE MEMBER")
+            audit('target_skipped', page_id=self.page_id, user_id=user_id, action='assign')
+            return
         try:
-            user_id = user_id.replace('-', '')
             # Update the page to assign it to the last editor
-            update_data = {
-                "properties": {
-                    "Assignee": {
-                        "people": [{"object": "user", "id": user_id}]
-                    }
-                }
-            }
-            self.notion_client.pages.update(page_id=self.page_id, **update_data)
+            self._update_properties(build_assignee_properties(user_id))
             print("Page assigned successfully to the last editor")
         except Exception as err:
             print("ASSIGN USER TO PAGE ERR: ", err)
 
     def get_page_status(self) -> str:
-        status_id = self.page_data.get('properties', {}).get('Status', {}).get('status', {}).get('id')
-        return status_id
+        return self.page.status_id
 
     def get_page_assignees(self) -> list:
         """
         :return: [{"object": "user", "id": user_id}, ...]
         """
-        assignee_data = self.page_data.get('Assignee', {}).get('people', [])
-        return assignee_data
+        return build_users(self.page.assignee_ids)
 
     def get_page_owner(self):
-        page_owner = self.page_data.get('created_by', {})
+        if not self.page.created_by_id:
+            return {}
+        return {"object": "user", "id": self.page.created_by_id}
 
-        return page_owner
+    def get_days_since_last_edit(self, now: datetime = None) -> int:
+        now = now or datetime.now(timezone.utc)
+        return (now - self.page.last_edited_at).days
 
-    def get_days_since_last_edit(self) -> int:
-        last_edited_dt = datetime.fromisoformat(self.page_data["last_edited_time"].replace("Z", "+00:00"))
-        now = datetime.now(timezone.utc)
-        day_difference = (now - last_edited_dt).days
+    def get_page_due_date(self):
+        """:return: The end of the `Created Date` range as an ISO string, or None."""
+        return self.page.due_date
 
-        return day_difference
-
-    def check_if_task_is_due(self) -> bool:
-        end_date_str = self.page_data.get('properties', {}).get('Created Date', {}).get('date', {}).get('end')
-        if not end_date_str:
+    def check_if_task_is_due(self, now: datetime = None) -> bool:
+        if self.page.due_at is None:
             return False
-
-        end_date = datetime.fromisoformat(end_date_str).replace(tzinfo=timezone.utc)
-        now = datetime.now(timezone.utc)
-        return now > end_date
+        return (now or datetime.now(timezone.utc)) > self.page.due_at
 
     def nudge_page_assignee(self, comment: str):
         page_assignees = self.get_page_assignees()
@@ -168,20 +191,16 @@ class NotionPageHandler:
             print("ERROR NUDGING PROJECT OWNER: ", err)
 
     def check_for_checklist_or_kpi(self):
-        kpi_relations = self.page_data.get('properties', {}).get('KPI', {}).get('relation', [])
-        checklist_relations = self.page_data.get('properties', {}).get('Checklist', {}).get('relation', [])
-
-        return len(kpi_relations) > 0 or len(checklist_relations) > 0
+        return len(self.page.kpi_ids) > 0 or len(self.page.checklist_ids) > 0
 
     def get_page_assigned_to(self) -> list:
         """
         :return: [{"object": "user", "id": user_id}, ...]
         """
-        assignee_data = self.page_data.get('properties', {}).get('Assigned To', {}).get('people', [])
-        return assignee_data
+        return build_users(self.page.assigned_to_ids)
 
-    def get_page_blocks(self) -> list:
-        all_blocks = []
+    def iter_page_blocks(self) -> Iterator[dict]:
+        """Yield the page's child blocks one response at a time instead of collecting them all."""
         next_cursor = None
 
         while True:
@@ -190,14 +209,18 @@ class NotionPageHandler:
                 page_size=100,
                 start_cursor=next_cursor
             )
-            blocks = response.get("results", [])
-            all_blocks.extend(blocks)
+            yield from response.get("results", [])
 
             next_cursor = response.get("next_cursor")
             if not next_cursor:
                 break
 
-        return all_blocks
+    def get_page_blocks(self) -> list:
+        return list(self.iter_page_blocks())
+
+    def get_last_page_blocks(self, count: int = 1) -> list:
+        """The last `count` child blocks; only that many are kept in memory while paging through the rest."""
+        return list(deque(self.iter_page_blocks(), maxlen=count))
 
     def update_block_text(self, block_id, block_type, updated_text):
         """
@@ -211,16 +234,7 @@ class NotionPageHandler:
         try:
             self.notion_client.blocks.update(
                 block_id=block_id,
-                **{
-                    block_type: {
-                        "rich_text": [
-                            {
-                                "type": "text",
-                                "text": {"content": updated_text}
-                            }
-                        ]
-                    }
-                }
+                **build_block_text(block_type, updated_text)
             )
         except Exception as e:
             print(f"Error updating block {block_id} text: {e}")
@@ -230,19 +244,139 @@ class NotionPageHandler:
         page_id = self.page_id
         self.notion_client.blocks.children.append(
             block_id=page_id,
-            children=[
+            children=[build_paragraph_block(content)]
+        )
+
+
+def retrieve_page(notion_client, page_id: str, filter_properties: list = None):
+    """`pages.retrieve`, returning only the properties in `filter_properties` when given. Awaitable with an AsyncClient."""
+    if filter_properties:
+        return notion_client.pages.retrieve(page_id=page_id, filter_properties=filter_properties)
+    return notion_client.pages.retrieve(page_id=page_id)
+
+
+def build_page_name_properties(new_name: str) -> dict:
+    """Properties payload that renames a page and marks its title as checked."""
+    return {
+        "title": {
+            "title": [
                 {
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {
-                        "rich_text": [{"type": "text", "text": {"content": content}}]
-                    }
+                    "text": {
+                        "content": new_name
+                    },
+                    "annotations": {
+                        "bold": False,
+                        "italic": False,
+                        "strikethrough": False,
+                        "underline": False,
+                        "code": False,
+                        "color": "default"
+                    },
+                    "plain_text": new_name
                 }
             ]
-        )
+        },
+        **build_title_checked_properties()
+    }
+
+
+def build_title_checked_properties() -> dict:
+    return {
+        "title checked": {
+            "checkbox": True  # Set the checkbox to True
+        }
+    }
+
+
+def build_assignee_properties(user_id: str) -> dict:
+    user_id = user_id.replace('-', '')
+    return {
+        "Assignee": {
+            "people": [{"object": "user", "id": user_id}]
+        }
+    }
+
+
+def build_users(user_ids) -> list:
+    return [{"object": "user", "id": user_id} for user_id in user_ids]
+
+
+def build_mention_rich_text(user_id: str, comment: str) -> list:
+    mention = {
+        "mention": {
+            "type": "user",
+            "user": {
+                "object": "user",
+                "id": user_id
+            }
+        }
+    }
+    return [mention, {"text": {"content": comment}}]
+
+
+def build_block_text(block_type: str, text: str) -> dict:
+    return {
+        block_type: {
+            "rich_text": [
+                {
+                    "type": "text",
+                    "text": {"content": text}
+                }
+            ]
+        }
+    }
+
+
+def build_paragraph_block(content: str) -> dict:
+    return {
+        "object": "block",
+        "type": "paragraph",
+        "paragraph": {
+            "rich_text": [{"type": "text", "text": {"content": content}}]
+        }
+    }
+
+
+def get_days_since(timestamp: str, now: datetime = None) -> int:
+    """Whole days elapsed since a Notion timestamp such as `last_edited_time`."""
+    last_edited_dt = parse_timestamp(timestamp)
+    now = now or datetime.now(timezone.utc)
+    return (now - last_edited_dt).days
+
+
+def is_past_due(end_date_str, now: datetime = None) -> bool:
+    if not end_date_str:
+        return False
+
+    end_date = parse_due_date(end_date_str)
+    now = now or datetime.now(timezone.utc)
+    return now > end_date
+
 
+def ends_with_full_stop(block: dict) -> bool:
+    """Whether a text block's content already ends with a full stop."""
+    block_type = block.get("type")
+    if block_type not in TEXT_BLOCK_TYPES:
+        return False
+    text_content = block[block_type].get("rich_text", [])
+    if not text_content:
+        return False
+    return text_content[-1]["text"]["content"].rstrip().endswith(".")
 
 
+def get_block_text_with_full_stop(block: dict):
+    """
+    Return the text a block should hold once a full stop is appended to it.
 
+    :return: The updated text, or None when the block is not a text block.
+    """
+    block_type = block.get("type")
+    if block_type not in TEXT_BLOCK_TYPES:
+        return None
 
+    text_content = block[block_type].get("rich_text", [])
+    if not text_content:
+        return "."
 
+    last_text = text_content[-1]["text"]["content"]
+    return f"{last_text}."
@@ -1,33 +1,45 @@
 import os
-import re
-from notion_client import Client
-from typing import List, Dict, Tuple
-from dotenv import load_dotenv
-from prompts import NAMING_CONVENTION_PROMPT
-from anthropic import Anthropic
+import json
+import time
+from notion_client_registry import get_notion_client
+from typing import List, Dict, Tuple, Iterator, Optional
+from local_env import load_local_env
+from prompts import NAMING_CONVENTION_PROMPT, BATCH_NAMING_CONVENTION_PROMPT
 from get_secret_from_google import get_secret
-from notion_page_handler import NotionPageHandler
+from notion_page_handler import NotionPageHandler, TASK_NAME_COMMENT
+from page_snapshot import PageSnapshot, as_snapshot
+from notion_filters import checkbox_equals
+from name_classifier import classify_project_names, is_valid_project_name, name_check_stats
+from instrumentation import track_call
+from audit_log import audit
+from name_verdict_cache import get_name_verdict_cache, get_prompt_version, normalize_project_name
 
-load_dotenv()
+load_local_env()
+
+CLAUDE_MODEL = "claude-3-sonnet-20240229"
+# Number of project names sent to Claude in a single request
+NAME_BATCH_SIZE = int(os.getenv("NAME_BATCH_SIZE", 25))
+PROMPT_VERSION = get_prompt_version(NAMING_CONVENTION_PROMPT, BATCH_NAMING_CONVENTION_PROMPT, CLAUDE_MODEL)
+
+
+def create_anthropic_client():
+    # Imported here so entry points that never check names don't load the SDK on cold start
+    from anthropic import Anthropic
+    return Anthropic(api_key=get_secret("ANTHROPIC_API_KEY"))
 
 
 class NotionProjectHandler:
     def __init__(self, workspace: Dict):
-        self.notion_client = Client(auth=workspace["token"])
+        self.notion_client = get_notion_client(workspace["token"])
         self.database_id = workspace["database_id"]
         self.workspace = workspace
-
-    def __is_valid_project_name(self, name: str) -> bool:
-        """Check if project name follows GTD outcome-focused naming convention"""
-        # Look for present perfect ("has been") or present tense ("is") constructions
-        patterns = [
-            r'.+\s+is\s+.+',  # "drawer is stocked"
-            r'.+\s+has\s+been\s+.+',  # "drawer has been stocked"
-            r'.+\s+are\s+.+',  # "supplies are organized"
-            r'.+\s+have\s+been\s+.+'  # "supplies have been organized"
-        ]
-
-        return any(re.match(pattern, name.lower()) for pattern in patterns)
+        # Set by the rule engine so name fixes are buffered with the run's other writes
+        self.mutation_queue = None
+        # Set by the rule engine when a rule mentions or assigns people
+        self.user_directory = None
+        # The schema last retrieved with `get_database_properties`; None until then
+        self.database_properties: Optional[Dict] = None
+        self.pending_name_checks: List[Tuple[PageSnapshot, str]] = []
 
     def __suggest_project_name(self, name: str) -> str:
         """Generate a suggestion for better project name"""
@@ -36,36 +48,92 @@ class NotionProjectHandler:
         # Basic suggestion by adding "is" after first word
         return f"{words[0]} is {' '.join(words[1:])}"
 
-    def analyze_project_name_with_ai(self, name: str) -> Tuple[bool, str]:
-        """Use Claude to check project name validity and get suggestions"""
-        try:
-            anthropic = Anthropic(api_key=get_secret("ANTHROPIC_API_KEY"))
-
-            message = anthropic.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=100,
-                messages=[{
-                    "role": "user",
-                    "content": NAMING_CONVENTION_PROMPT.format(name=name)
-                }]
-            )
+    def __analyze_project_name_with_regex(self, name: str) -> Tuple[bool, str]:
+        is_valid = is_valid_project_name(name)
+        project_name_suggestion = name if is_valid else self.__suggest_project_name(name)
+
+        return is_valid, project_name_suggestion
+
+    def analyze_project_names_with_ai(self, names: List[str]) -> List[Tuple[bool, Optional[str]]]:
+        """
+        Check many project names, settling the clear-cut ones with the local rules and sending the
+        ambiguous ones to Claude in one request.
+
+        :return: A (is_valid, suggestion) pair per name, in the same order. Names the local rules
+            found invalid have no suggestion. Names whose verdict is missing or malformed in
+            Claude's answer fall back to the regex check.
+        """
+        if not names:
+            return []
+
+        # Repeat names are answered from the cache, and the rest are sent once per normalized name
+        verdict_cache = get_name_verdict_cache(PROMPT_VERSION)
+        verdicts = {}
+        uncached_names = {}
+        for name, rule_verdict in zip(names, classify_project_names(names)):
+            key = normalize_project_name(name)
+            if rule_verdict:
+                name_check_stats.record('rules')
+                verdicts[key] = rule_verdict
+                continue
+            cached_verdict = verdict_cache.get(name)
+            if cached_verdict:
+                name_check_stats.record('cache')
+                verdicts[key] = cached_verdict
+            elif key not in verdicts:
+                uncached_names.setdefault(key, name)
 
-            response = message.content[0].split('\n')
-            is_valid = response[0].strip().lower() == "valid"
-            suggestion = response[1].strip()
+        llm_verdicts = {}
+        if uncached_names:
+            llm_verdicts = self.__request_batch_verdicts(list(uncached_names.values()), verdict_cache)
 
-            return is_valid, suggestion
+        results = []
+        for name in names:
+            key = normalize_project_name(name)
+            if key in uncached_names:
+                name_check_stats.record('llm' if key in llm_verdicts else 'fallback')
+            verdict = verdicts.get(key) or llm_verdicts.get(key)
+            results.append(verdict if verdict else self.__analyze_project_name_with_regex(name))
+        return results
+
+    def __request_batch_verdicts(self, names: List[str], verdict_cache) -> Dict[str, Tuple[bool, str]]:
+        """Ask Claude about `names` in one request and cache every well-formed verdict."""
+        try:
+            anthropic = create_anthropic_client()
+
+            started_at = time.monotonic()
+            prompt = BATCH_NAMING_CONVENTION_PROMPT.format(names=json.dumps(names, ensure_ascii=False))
+            with track_call("anthropic", "messages.create", len(prompt)) as call:
+                message = anthropic.messages.create(
+                    model=CLAUDE_MODEL,
+                    max_tokens=100 + 60 * len(names),
+                    messages=[{
+                        "role": "user",
+                        "content": prompt
+                    }]
+                )
+                call.bytes_received = len(message.content[0].text)
+            name_check_stats.record_llm_request(started_at)
+            parsed = parse_batch_naming_response(message.content[0].text, len(names))
 
         except Exception as e:
             print(f"Error using Claude API: {str(e)}")
+            return {}
 
-            # Fall back to basic validation if Claude fails
-            is_valid_project_name = self.__is_valid_project_name(name)
-            project_name_suggestion = name if is_valid_project_name else self.__suggest_project_name(name)
+        verdicts = {}
+        for index, (is_valid, suggestion) in parsed.items():
+            name = names[index]
+            verdicts[normalize_project_name(name)] = (is_valid, suggestion)
+            verdict_cache.put(name, is_valid, suggestion)
+        return verdicts
 
-            return is_valid_project_name, project_name_suggestion
+    def has_title_checkbox(self) -> bool:
+        """Whether the retrieved schema already has the `title checked` property; False when it is unknown."""
+        return 'title checked' in (self.database_properties or {})
 
     def add_title_checkbox_to_database_schema(self):
+        if self.has_title_checkbox():
+            return
         try:
             self.notion_client.databases.update(
                 self.database_id,
@@ -78,45 +146,165 @@ class NotionProjectHandler:
         except Exception as err:
             print("add_title_checkbox_to_database_schema ERR ==> ", err)
 
+    @staticmethod
+    def get_unchecked_project_name(page: PageSnapshot) -> Optional[str]:
+        """Return the page's project name when it still has to be checked, otherwise None."""
+        if page.title_checked:
+            return None
+        return page.project_name
+
+    def queue_project_name_check(self, page):
+        """Queue a page (object or snapshot) for the next batched name check, flushing once a full batch is pending."""
+        page = as_snapshot(page)
+        project_name = self.get_unchecked_project_name(page)
+        if project_name is None:
+            return
+        self.pending_name_checks.append((page, project_name))
+        if len(self.pending_name_checks) >= NAME_BATCH_SIZE:
+            self.flush_project_name_checks()
+
+    @staticmethod
+    def save_name_verdicts():
+        """Write the verdicts cached during the run to the durable tier; once per run, as it rewrites the whole document."""
+        get_name_verdict_cache(PROMPT_VERSION).save()
+
+    def flush_project_name_checks(self):
+        """Check every queued project name with one Claude request and fix the invalid ones."""
+        pending, self.pending_name_checks = self.pending_name_checks, []
+        if not pending:
+            return
+        verdicts = self.analyze_project_names_with_ai([project_name for _, project_name in pending])
+        for (page, project_name), (is_valid, suggestion) in zip(pending, verdicts):
+            try:
+                self.__apply_name_verdict(page, project_name, is_valid, suggestion)
+            except Exception as err:
+                print(f"ERROR APPLYING NAME CHECK TO PAGE {page.id} ==> ", err)
+
+    def __apply_name_verdict(self, page: PageSnapshot, project_name: str, is_valid: bool,
+                             suggestion: Optional[str]):
+        notion_page_handler = NotionPageHandler.from_page(page, self.workspace['token'], self.mutation_queue)
+        audit('name_checked', page_id=page.id, name=project_name, valid=is_valid,
+              suggestion=None if is_valid else suggestion)
+        if is_valid:
+            notion_page_handler.mark_page_as_checked()
+            return
+        if not suggestion:
+            # Found invalid by the local rules, which never rename a page
+            notion_page_handler.add_comment(TASK_NAME_COMMENT)
+            notion_page_handler.mark_page_as_checked()
+            return
+
+        notion_page_handler.add_comment()
+        notion_page_handler.update_page_name(suggestion)  # marks page as checked as well
+
+        print(f"""
+                    Workspace: {self.workspace['name']}
+                    Invalid project name: {project_name}
+                    Suggested name: {suggestion}
+                """)
+
     def check_projects_for_proper_naming(self):
         """Check projects in a workspace for proper naming"""
         try:
             self.add_title_checkbox_to_database_schema()
-            pages = self.get_all_pages_in_database()
+            pages = self.get_all_pages_in_database(filter=checkbox_equals("title checked", False))
             for page in pages:
-                notion_page_handler = NotionPageHandler(page['id'], self.workspace['token'])
-                page_properties = page.get('properties')
-                if not page_properties or not page_properties.get('Project name'):
-                    continue
-                if page_properties.get('title checked') and page_properties['title checked'].get('Checkbox'):
-                    continue
-                project_name = page_properties["Project name"]["title"][0]["text"]["content"]
-                is_valid, suggestion = self.analyze_project_name_with_ai(project_name)
-
-                if is_valid:
-                    notion_page_handler.mark_page_as_checked()
-                    continue
-
-                notion_page_handler.add_comment()
-                notion_page_handler.update_page_name(suggestion)  # marks page as checked as well
-
-                print(f"""
-                    Workspace: {self.workspace['name']}
-                    Invalid project name: {project_name}
-                    Suggested name: {suggestion}
-                """)
+                self.queue_project_name_check(page)
+            self.flush_project_name_checks()
 
         except Exception as e:
             print(f"Error processing workspace {self.workspace['name']}: {str(e)}")
 
-    def get_all_pages_in_database(self):
+    def get_database_properties(self) -> Dict:
+        """Return the property schema of the database, keyed by property name."""
         try:
-            response = self.notion_client.databases.query(
-                database_id=self.database_id
-            )
-            return response["results"]
-        except:
-            return []
+            database = self.notion_client.databases.retrieve(database_id=self.database_id)
+            self.database_properties = database.get("properties", {})
+            return self.database_properties
+        except Exception as err:
+            print("get_database_properties ERR ==> ", err)
+            return {}
+
+    def get_all_pages_in_database(self, filter: Dict = None, sorts: List[Dict] = None,
+                                  page_size: int = 100, filter_properties: List[str] = None) -> Iterator[Dict]:
+        """
+        Yield the pages of the database as they arrive, following `next_cursor` until the end.
+
+        :param filter: A Notion filter object, applied server-side.
+        :param sorts: A list of Notion sort objects.
+        :param page_size: Number of pages requested per call (max 100).
+        :param filter_properties: Ids of the only properties to return on each page; all of them when omitted.
+        """
+        for response in self.get_database_query_responses(filter=filter, sorts=sorts, page_size=page_size,
+                                                          filter_properties=filter_properties):
+            yield from response.get("results", [])
+
+    def get_database_query_responses(self, filter: Dict = None, sorts: List[Dict] = None, page_size: int = 100,
+                                     start_cursor: str = None, filter_properties: List[str] = None,
+                                     raise_errors: bool = False) -> Iterator[Dict]:
+        """
+        Yield the raw query responses, so callers can see the cursor of each one.
+
+        :param start_cursor: The `next_cursor` of an earlier response, to resume the query from.
+        :param raise_errors: Raise a failed query instead of printing it and ending the iteration,
+            for callers that must not mistake a failure for the end of the database.
+        """
+        query = {"database_id": self.database_id, "page_size": page_size}
+        if filter:
+            query["filter"] = filter
+        if sorts:
+            query["sorts"] = sorts
+        if start_cursor:
+            query["start_cursor"] = start_cursor
+        if filter_properties:
+            query["filter_properties"] = filter_properties
+
+        while True:
+            try:
+                response = self.notion_client.databases.query(**query)
+            except Exception as err:
+                print("get_all_pages_in_database ERR ==> ", err)
+                if raise_errors:
+                    raise
+                return
+
+            yield response
+
+            next_cursor = response.get("next_cursor")
+            if not response.get("has_more") or not next_cursor:
+                return
+            query["start_cursor"] = next_cursor
+
+
+def parse_batch_naming_response(text: str, count: int) -> Dict[int, Tuple[bool, str]]:
+    """
+    Parse Claude's answer to BATCH_NAMING_CONVENTION_PROMPT.
+
+    :return: {position in the batch: (is_valid, suggestion)} for every well-formed verdict.
+    """
+    start, end = text.find('['), text.rfind(']')
+    if start == -1 or end <= start:
+        return {}
+    try:
+        items = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+
+    verdicts = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        index, verdict, suggestion = item.get('index'), item.get('verdict'), item.get('suggestion')
+        if not isinstance(index, int) or not 1 <= index <= count:
+            continue
+        if not isinstance(verdict, str) or verdict.strip().lower() not in ('valid', 'invalid'):
+            continue
+        is_valid = verdict.strip().lower() == 'valid'
+        # A valid name keeps its title, so only invalid verdicts need a usable suggestion
+        if not is_valid and (not isinstance(suggestion, str) or not suggestion.strip()):
+            continue
+        verdicts[index - 1] = (is_valid, suggestion.strip() if isinstance(suggestion, str) else '')
+    return verdicts
 
 
 def main():
@@ -124,8 +312,7 @@ def main():
     notion_project_handler = NotionProjectHandler(workspace)
     pages = notion_project_handler.get_all_pages_in_database()
     for page in pages:
-        page['id'] = page['id'].replace('-', '')
-        notion_page_handler = NotionPageHandler(page['id'], workspace['token'])
+        notion_page_handler = NotionPageHandler.from_page(page, workspace['token'])
         status = notion_page_handler.get_page_status()
         if status and status != 'in-progress':
             continue
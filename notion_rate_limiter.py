@@ -0,0 +1,262 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from notion_client import Client, AsyncClient
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+from instrumentation import track_call, record_retry, get_endpoint
+
+# Notion allows an average of about 3 requests per second per integration
+DEFAULT_REQUESTS_PER_SECOND = float(os.getenv("NOTION_REQUESTS_PER_SECOND", 3))
+DEFAULT_MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", 5))
+# 429 and 409 mean the request was not applied, so they are safe to retry for any request
+ALWAYS_RETRYABLE_STATUSES = {409, 429}
+# Server errors and timeouts may hide an applied write, so they are only retried for idempotent requests
+IDEMPOTENT_RETRYABLE_STATUSES = {500, 502, 503, 504}
+
+# The call being sent on this thread or task, whose sizes the httpx event hooks fill in
+_current_call = contextvars.ContextVar('current_notion_call', default=None)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket whose refill rate adapts to the 429s Notion returns.
+
+    The rate is halved on every 429 (down to `min_rate`) and creeps back up by `increase_step`
+    on every success (up to `max_rate`), so throughput settles just under the real limit.
+    """
+
+    def __init__(self, rate: float = DEFAULT_REQUESTS_PER_SECOND, capacity: float = None,
+                 min_rate: float = 0.5, max_rate: float = None, increase_step: float = 0.05):
+        self.max_rate = max_rate or rate
+        self.min_rate = min(min_rate, self.max_rate)
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.increase_step = increase_step
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token and return how many seconds the caller must wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+class RequestScheduler:
+    """
+    Central pacing and retry policy for Notion calls, with one token bucket per integration token.
+
+    Requests wait for a token before being sent. Rate-limited (429), conflicting (409) and
+    transient server errors are retried with jittered exponential backoff, honoring
+    `Retry-After` when Notion sends it.
+    """
+
+    def __init__(self, requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                 max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, token: str) -> TokenBucket:
+        bucket = self.buckets.get(token)
+        if bucket is None:
+            with self.lock:
+                bucket = self.buckets.setdefault(token, TokenBucket(self.requests_per_second))
+        return bucket
+
+    def __get_retry_delay(self, err: Exception, attempt: int, idempotent: bool) -> Optional[float]:
+        """Seconds to wait before retrying after `err`, or None when it should not be retried."""
+        if attempt >= self.max_retries:
+            return None
+        if isinstance(err, (RequestTimeoutError, httpx.TransportError)) and idempotent:
+            retry_after = None
+        elif isinstance(err, HTTPResponseError) and (
+                err.status in ALWAYS_RETRYABLE_STATUSES
+                or (idempotent and err.status in IDEMPOTENT_RETRYABLE_STATUSES)):
+            retry_after = parse_retry_after(err.headers.get("retry-after"))
+        else:
+            return None
+
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return retry_after + random.uniform(0, self.base_delay) if retry_after else backoff
+
+    def __record_failure(self, bucket: TokenBucket, err: Exception, delay: float):
+        if isinstance(err, HTTPResponseError) and err.status == 429:
+            bucket.on_rate_limited(delay)
+
+    def execute(self, token: str, send, *args, idempotent: bool = True, endpoint: str = None, **kwargs) -> Any:
+        """
+        Send a request through the token's bucket, retrying it when it is safe to do so.
+
+        :param idempotent: Whether the request can be repeated safely after a timeout or a server error.
+        :param endpoint: Name the retries are recorded under in the run report.
+        """
+        bucket = self.get_bucket(token)
+        attempt = 0
+        while True:
+            wait = bucket.reserve()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                result = send(*args, **kwargs)
+                bucket.on_success()
+                return result
+            except Exception as err:
+                delay = self.__get_retry_delay(err, attempt, idempotent)
+                if delay is None:
+                    raise
+                self.__record_failure(bucket, err, delay)
+                record_retry("notion", endpoint)
+                print(f"NOTION REQUEST RETRY {attempt + 1}/{self.max_retries} IN {delay:.2f}s ==> ", err)
+                time.sleep(delay)
+                attempt += 1
+
+    async def execute_async(self, token: str, send, *args, idempotent: bool = True, endpoint: str = None,
+                            **kwargs) -> Any:
+        """Async version of `execute`; waiting never blocks the event loop."""
+        bucket = self.get_bucket(token)
+        attempt = 0
+        while True:
+            wait = bucket.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result = await send(*args, **kwargs)
+                bucket.on_success()
+                return result
+            except Exception as err:
+                delay = self.__get_retry_delay(err, attempt, idempotent)
+                if delay is None:
+                    raise
+                self.__record_failure(bucket, err, delay)
+                record_retry("notion", endpoint)
+                print(f"NOTION REQUEST RETRY {attempt + 1}/{self.max_retries} IN {delay:.2f}s ==> ", err)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+def is_idempotent_request(path: str, method: str) -> bool:
+    """Reads, database queries and property/block updates can be repeated; creating comments or appending blocks cannot."""
+    if method == "GET" or path.endswith("/query"):
+        return True
+    return method == "PATCH" and not path.endswith("/children")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a `Retry-After` header given in seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+scheduler = RequestScheduler()
+
+
+def record_request_size(request: httpx.Request):
+    """httpx request hook: the size of the body as encoded on the wire."""
+    call = _current_call.get()
+    if call is not None:
+        call.bytes_sent = len(request.content)
+
+
+def record_response_size(response: httpx.Response):
+    """httpx response hook: the bytes downloaded for the body, before decompression."""
+    call = _current_call.get()
+    if call is not None:
+        response.read()
+        call.bytes_received = response.num_bytes_downloaded
+
+
+async def record_async_request_size(request: httpx.Request):
+    record_request_size(request)
+
+
+async def record_async_response_size(response: httpx.Response):
+    call = _current_call.get()
+    if call is not None:
+        await response.aread()
+        call.bytes_received = response.num_bytes_downloaded
+
+
+def add_size_hooks(http_client, request_hook, response_hook):
+    hooks = http_client.event_hooks
+    http_client.event_hooks = {
+        'request': hooks.get('request', []) + [request_hook],
+        'response': hooks.get('response', []) + [response_hook],
+    }
+
+
+class RateLimitedClient(Client):
+    """notion_client.Client whose requests all go through the shared scheduler and are instrumented."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        add_size_hooks(self.client, record_request_size, record_response_size)
+
+    def request(self, path: str, method: str, query: Optional[Dict[Any, Any]] = None,
+                body: Optional[Dict[Any, Any]] = None, auth: Optional[str] = None) -> Any:
+        endpoint = get_endpoint(method, path)
+        return scheduler.execute(
+            auth or self.options.auth, self.__send, endpoint, path, method, query, body, auth,
+            idempotent=is_idempotent_request(path, method), endpoint=endpoint
+        )
+
+    def __send(self, endpoint: str, path: str, method: str, query, body, auth) -> Any:
+        with track_call("notion", endpoint) as call:
+            reset_token = _current_call.set(call)
+            try:
+                return super().request(path, method, query, body, auth)
+            finally:
+                _current_call.reset(reset_token)
+
+
+class AsyncRateLimitedClient(AsyncClient):
+    """notion_client.AsyncClient whose requests all go through the shared scheduler and are instrumented."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        add_size_hooks(self.client, record_async_request_size, record_async_response_size)
+
+    async def request(self, path: str, method: str, query: Optional[Dict[Any, Any]] = None,
+                      body: Optional[Dict[Any, Any]] = None, auth: Optional[str] = None) -> Any:
+        endpoint = get_endpoint(method, path)
+        return await scheduler.execute_async(
+            auth or self.options.auth, self.__send, endpoint, path, method, query, body, auth,
+            idempotent=is_idempotent_request(path, method), endpoint=endpoint
+        )
+
+    async def __send(self, endpoint: str, path: str, method: str, query, body, auth) -> Any:
+        with track_call("notion", endpoint) as call:
+            reset_token = _current_call.set(call)
+            try:
+                return await super().request(path, method, query, body, auth)
+            finally:
+                _current_call.reset(reset_token)
@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from typing import Dict, Iterable, List
+from json_store import JSONStore, get_json_store
+
+# Days to wait before nudging someone again after their 1st, 2nd, ... nudge on a page; the last one repeats
+NUDGE_SCHEDULE_DAYS = [float(days) for days in os.getenv("NUDGE_SCHEDULE_DAYS", "3,7,14").split(",")]
+# Entries not renewed for this long are dropped, e.g. pages that left the scan once done
+NUDGE_LEDGER_TTL_SECONDS = float(os.getenv("NUDGE_LEDGER_TTL_DAYS", 90)) * 24 * 3600
+
+
+class NudgeLedger:
+    """
+    Who was nudged about which page, when, and how many times, for one rule on one database.
+
+    The document is loaded once per run and every check is answered from memory, so no comments
+    are read back from Notion. Entries are {page id: {recipient id: [nudges, last nudged at]}}. A
+    recipient is due again once the cooldown for their number of nudges has passed; a page that no
+    longer needs nudging is forgotten, so the next time it does its people are nudged right away.
+    A nudge is only recorded once its comment was sent (`confirm`).
+    """
+
+    def __init__(self, store: JSONStore, key: str, schedule_days: List[float] = None,
+                 ttl: float = NUDGE_LEDGER_TTL_SECONDS):
+        self.store = store
+        self.key = key
+        self.schedule = [days * 24 * 3600 for days in schedule_days or NUDGE_SCHEDULE_DAYS]
+        self.ttl = ttl
+        self.entries: Dict[str, Dict[str, list]] = store.load(key).get('entries', {})
+        self.changed_pages = set()
+        # Nudges taken but whose comment was not sent yet, {(page id, recipient id): taken at}
+        self.pending: Dict[tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def __get_cooldown(self, nudges: int) -> float:
+        return self.schedule[min(nudges, len(self.schedule)) - 1]
+
+    def is_due(self, page_id: str, recipient_id: str, now: float = None) -> bool:
+        if (page_id, recipient_id) in self.pending:
+            return False
+        entry = self.entries.get(page_id, {}).get(recipient_id)
+        if entry is None:
+            return True
+        nudges, last_nudged_at = entry
+        return (now or time.time()) - last_nudged_at >= self.__get_cooldown(nudges)
+
+    def take_due(self, page_id: str, recipient_ids: Iterable[str], now: float = None) -> List[str]:
+        """
+        Return the recipients due a nudge about the page. They are not due again until their nudge is
+        confirmed, and only then recorded.
+        """
+        now = now or time.time()
+        due = []
+        with self.lock:
+            for recipient_id in recipient_ids:
+                if recipient_id in due or not self.is_due(page_id, recipient_id, now):
+                    continue
+                self.pending[(page_id, recipient_id)] = now
+                due.append(recipient_id)
+        return due
+
+    def confirm(self, page_id: str, recipient_id: str, sent: bool):
+        """Record a nudge taken with `take_due` as of when it was taken, if its comment was sent."""
+        with self.lock:
+            nudged_at = self.pending.pop((page_id, recipient_id), None)
+            if nudged_at is None or not sent:
+                return
+            nudges = self.entries.get(page_id, {}).get(recipient_id, [0])[0]
+            self.entries.setdefault(page_id, {})[recipient_id] = [nudges + 1, nudged_at]
+            self.changed_pages.add(page_id)
+
+    def forget(self, page_id: str):
+        """The page needs no nudge anymore; start over the next time it does."""
+        with self.lock:
+            if self.entries.pop(page_id, None) is not None:
+                self.changed_pages.add(page_id)
+
+    def save(self, now: float = None):
+        """
+        Write the pages changed in this run over the stored document, which other shards of the run
+        may have updated meanwhile, and drop entries older than the TTL.
+        """
+        now = now or time.time()
+        with self.lock:
+            if not self.changed_pages:
+                return
+            stored = self.store.load(self.key).get('entries', {})
+            for page_id in self.changed_pages:
+                if page_id in self.entries:
+                    stored[page_id] = self.entries[page_id]
+                else:
+                    stored.pop(page_id, None)
+            entries = {}
+            for page_id, recipients in stored.items():
+                recipients = {recipient_id: entry for recipient_id, entry in recipients.items()
+                              if now - entry[1] < self.ttl}
+                if recipients:
+                    entries[page_id] = recipients
+            self.entries = entries
+            self.changed_pages = set()
+        try:
+            self.store.save(self.key, {'entries': entries})
+        except Exception as err:
+            print("ERROR SAVING NUDGE LEDGER ==> ", err)
+
+
+def load_nudge_ledger(database_id: str, rule_name: str) -> NudgeLedger:
+    """The ledger of a rule on a database from the configured store (NUDGE_LEDGER_STORE, _BUCKET, _DIR)."""
+    return NudgeLedger(get_json_store('nudge_ledger'), f"{database_id}:{rule_name}")
@@ -0,0 +1,107 @@
+"""
+Compact view of a Notion page holding only what the rules read, parsed once from the page JSON.
+
+A raw page object carries every property with its full rich text and metadata; a snapshot keeps
+ids, the status id, people and relation ids and parsed timestamps in slots, and shares repeated
+strings (user and status ids) between pages.
+"""
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+EMPTY: Tuple[str, ...] = ()
+
+
+def parse_timestamp(timestamp: Optional[str]) -> Optional[datetime]:
+    """Parse a Notion timestamp such as `last_edited_time` ("2024-05-01T10:00:00.000Z")."""
+    if not timestamp:
+        return None
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+
+def parse_due_date(date: Optional[str]) -> Optional[datetime]:
+    """Parse a date property value; it is compared in UTC whatever offset it was given with."""
+    if not date:
+        return None
+    return datetime.fromisoformat(date).replace(tzinfo=timezone.utc)
+
+
+def _get_ids(items) -> Tuple[str, ...]:
+    if not items:
+        return EMPTY
+    return tuple(sys.intern(item['id']) for item in items if item.get('id'))
+
+
+def _get_id(item) -> Optional[str]:
+    item_id = (item or {}).get('id')
+    return sys.intern(item_id) if item_id else None
+
+
+def _get_title(title) -> Optional[str]:
+    if not title:
+        return None
+    text = title[0].get('text')
+    return text.get('content') if text else title[0].get('plain_text')
+
+
+class PageSnapshot:
+    __slots__ = (
+        'id', 'last_edited_time', 'last_edited_at', 'created_by_id', 'last_edited_by_id', 'status_id',
+        'assignee_ids', 'assigned_to_ids', 'kpi_ids', 'checklist_ids', 'role_ids', 'due_date', 'due_at',
+        'project_name', 'title_checked', 'has_accountability',
+    )
+
+    def __init__(self, id: str, last_edited_time: Optional[str] = None, created_by_id: Optional[str] = None,
+                 last_edited_by_id: Optional[str] = None, status_id: Optional[str] = None,
+                 assignee_ids: Tuple[str, ...] = EMPTY, assigned_to_ids: Tuple[str, ...] = EMPTY,
+                 kpi_ids: Tuple[str, ...] = EMPTY, checklist_ids: Tuple[str, ...] = EMPTY,
+                 role_ids: Tuple[str, ...] = EMPTY, due_date: Optional[str] = None,
+                 project_name: Optional[str] = None, title_checked: bool = False, has_accountability: bool = False):
+        self.id = id
+        # The raw timestamp is kept for watermarks and stores, which compare and save it as is
+        self.last_edited_time = last_edited_time
+        self.last_edited_at = parse_timestamp(last_edited_time)
+        self.created_by_id = created_by_id
+        self.last_edited_by_id = last_edited_by_id
+        self.status_id = status_id
+        self.assignee_ids = assignee_ids
+        self.assigned_to_ids = assigned_to_ids
+        self.kpi_ids = kpi_ids
+        self.checklist_ids = checklist_ids
+        self.role_ids = role_ids
+        # End of the `Created Date` range, raw for the due-date index and parsed for the checks
+        self.due_date = due_date
+        self.due_at = parse_due_date(due_date)
+        self.project_name = project_name
+        self.title_checked = title_checked
+        self.has_accountability = has_accountability
+
+    @classmethod
+    def from_page(cls, page: Dict) -> 'PageSnapshot':
+        """Extract a snapshot from a page object returned by `databases.query` or `pages.retrieve`."""
+        properties = page.get('properties') or {}
+        project_name = properties.get('Project name')
+        return cls(
+            id=page['id'],
+            last_edited_time=page.get('last_edited_time'),
+            created_by_id=_get_id(page.get('created_by')),
+            last_edited_by_id=_get_id(page.get('last_edited_by')),
+            status_id=_get_id((properties.get('Status') or {}).get('status')),
+            assignee_ids=_get_ids((properties.get('Assignee') or {}).get('people')),
+            assigned_to_ids=_get_ids((properties.get('Assigned To') or {}).get('people')),
+            kpi_ids=_get_ids((properties.get('KPI') or {}).get('relation')),
+            checklist_ids=_get_ids((properties.get('Checklist') or {}).get('relation')),
+            role_ids=_get_ids((properties.get('Roles') or {}).get('relation')),
+            due_date=((properties.get('Created Date') or {}).get('date') or {}).get('end'),
+            project_name=_get_title(project_name.get('title')) if project_name else None,
+            title_checked=bool((properties.get('title checked') or {}).get('checkbox')),
+            has_accountability='Accountability' in properties,
+        )
+
+    def __repr__(self):
+        return f"PageSnapshot(id={self.id!r}, last_edited_time={self.last_edited_time!r})"
+
+
+def as_snapshot(page) -> PageSnapshot:
+    """The snapshot of a page object, or the snapshot itself."""
+    return page if isinstance(page, PageSnapshot) else PageSnapshot.from_page(page)
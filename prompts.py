@@ -12,3 +12,20 @@ NAMING_CONVENTION_PROMPT = """
     Line 1: "valid" or "invalid"
     Line 2: If invalid, suggest better name. If valid, return original name
 """
+
+BATCH_NAMING_CONVENTION_PROMPT = """
+    Analyze if each of these project names follows GTD outcome-focused naming convention.
+
+    Rules:
+    1. Name should use present perfect ("has been") or present tense ("is"/"are") constructions
+    2. Name should describe a completed state
+    3. Name should be clear and specific
+
+    If a name is invalid, suggest a better name following these rules.
+
+    Project names, as a JSON array numbered from 1:
+    {names}
+
+    Return only a JSON array with exactly one object per project name, in the same order:
+    [{{"index": 1, "verdict": "valid" or "invalid", "suggestion": "better name if invalid, otherwise the original name"}}]
+"""
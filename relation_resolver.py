@@ -0,0 +1,95 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from notion_client import AsyncClient
+from notion_client_registry import get_notion_client
+from notion_filters import get_property_ids
+from notion_page_handler import NotionPageHandler, retrieve_page
+from async_notion_page_handler import AsyncNotionPageHandler
+
+RELATION_FETCH_WORKERS = int(os.getenv("RELATION_FETCH_WORKERS", 8))
+# The only properties read on related pages
+RELATED_PAGE_PROPERTIES = ('Assigned To',)
+
+
+def get_related_page_property_ids(page: Dict) -> Optional[List[str]]:
+    return get_property_ids(page.get('properties') or {}, RELATED_PAGE_PROPERTIES) or None
+
+
+class RelationResolver:
+    """
+    Per-run memo of the `Assigned To` people of related pages (e.g. roles).
+
+    Each unique related page is retrieved once per run, however many pages link to it, and
+    `prefetch` retrieves a whole set of them concurrently. Related pages live in another database,
+    so the ids of their properties are taken from the first one retrieved, and the others are
+    retrieved with only those properties.
+    """
+
+    def __init__(self, token: str, max_workers: int = RELATION_FETCH_WORKERS):
+        self.token = token
+        self.max_workers = max_workers
+        self.assigned_to: Dict[str, List[dict]] = {}
+        self.filter_properties: Optional[List[str]] = None
+
+    def __fetch_assigned_to(self, relation_id: str) -> List[dict]:
+        try:
+            page = retrieve_page(get_notion_client(self.token), relation_id, self.filter_properties)
+            if self.filter_properties is None:
+                self.filter_properties = get_related_page_property_ids(page)
+            return NotionPageHandler(relation_id, self.token, page=page).get_page_assigned_to()
+        except Exception as err:
+            print(f"ERROR RETRIEVING RELATED PAGE {relation_id} ==> ", err)
+            return []
+
+    def prefetch(self, relation_ids: Iterable[str]):
+        """Retrieve every related page not resolved yet, concurrently."""
+        missing = list({relation_id.replace('-', '') for relation_id in relation_ids} - set(self.assigned_to))
+        if missing and self.filter_properties is None:
+            # Retrieved alone, so the rest can be projected on its property ids
+            first = missing.pop()
+            self.assigned_to[first] = self.__fetch_assigned_to(first)
+        if not missing:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, self.__fetch_assigned_to, relation_id)
+                       for relation_id in missing]
+            for relation_id, future in zip(missing, futures):
+                self.assigned_to[relation_id] = future.result()
+
+    def get_assigned_to(self, relation_id: str) -> List[dict]:
+        """:return: [{"object": "user", "id": user_id}, ...]"""
+        relation_id = relation_id.replace('-', '')
+        if relation_id not in self.assigned_to:
+            self.prefetch([relation_id])
+        return self.assigned_to[relation_id]
+
+
+class AsyncRelationResolver:
+    """Async version of RelationResolver; concurrent lookups of the same page share one request."""
+
+    def __init__(self, notion_client: AsyncClient):
+        self.notion_client = notion_client
+        self.lookups: Dict[str, asyncio.Future] = {}
+        self.filter_properties: Optional[List[str]] = None
+
+    async def __fetch_assigned_to(self, relation_id: str) -> List[dict]:
+        try:
+            page = await retrieve_page(self.notion_client, relation_id, self.filter_properties)
+            if self.filter_properties is None:
+                self.filter_properties = get_related_page_property_ids(page)
+            return AsyncNotionPageHandler(relation_id, self.notion_client, page=page).get_page_assigned_to()
+        except Exception as err:
+            print(f"ERROR RETRIEVING RELATED PAGE {relation_id} ==> ", err)
+            return []
+
+    async def get_assigned_to(self, relation_id: str) -> List[dict]:
+        """:return: [{"object": "user", "id": user_id}, ...]"""
+        relation_id = relation_id.replace('-', '')
+        lookup = self.lookups.get(relation_id)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self.__fetch_assigned_to(relation_id))
+            self.lookups[relation_id] = lookup
+        return await lookup
@@ -0,0 +1,440 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+from notion_project_handler import NotionProjectHandler
+from notion_page_handler import NotionPageHandler
+from async_notion_project_handler import AsyncNotionProjectHandler
+from async_notion_page_handler import AsyncNotionPageHandler
+from async_pipeline import run_pipeline, get_workspace_concurrency
+from automation_rules import RULES, Rule
+from notion_client_registry import create_async_notion_client
+from notion_filters import any_of, get_property_ids, get_title_property_name
+from incremental_sync import IncrementalSync
+from json_store import get_json_store
+from mutation_queue import (
+    MutationQueue, AsyncMutationQueue, MutationResult, print_mutation_results, summarize_mutation_results
+)
+from instrumentation import record_rule, record_workspace_details, track_workspace
+from work_queue import Shard
+from user_directory import get_user_directory
+
+
+def select_rules(rule_names: Optional[List[str]] = None) -> List[Rule]:
+    """Build fresh instances of the rules to run, in registry order; all of them when no names are given."""
+    unknown = set(rule_names or []) - set(RULES)
+    if unknown:
+        raise ValueError(f"Unknown rules: {', '.join(sorted(unknown))}")
+    return [rule() for name, rule in RULES.items() if not rule_names or name in rule_names]
+
+
+def get_scan_filter(rules: List[Rule], properties: Dict) -> Optional[Dict]:
+    """Union of the rules' query filters; no filter as soon as one rule needs every page."""
+    filters = [rule.get_query_filter(properties) for rule in rules]
+    if not filters or any(f is None for f in filters):
+        return None
+    return any_of(*filters)
+
+
+def get_scan_properties(rules: List[Rule], properties: Dict) -> Optional[List[str]]:
+    """
+    Ids of the properties the rules read, for `filter_properties`; None (every property) as soon as
+    one rule reads them all, or when the schema could not be retrieved.
+    """
+    if not properties or any(rule.read_properties is None for rule in rules):
+        return None
+    property_ids = get_property_ids(properties, {name for rule in rules for name in rule.read_properties})
+    if property_ids:
+        return property_ids
+    # An empty projection returns every property, so ask for the title alone instead
+    return get_property_ids(properties, [get_title_property_name(properties)]) or None
+
+
+def load_user_directory(workspace: Dict, rules: List[Rule], notion_project_handler):
+    """Give the project handler the workspace's user directory when a rule mentions or assigns people."""
+    if any(rule.targets_users for rule in rules):
+        notion_project_handler.user_directory = get_user_directory(workspace['token'])
+
+
+def get_incremental_sync(workspace: Dict, rules: List[Rule]) -> Optional[IncrementalSync]:
+    """Workspaces with `"incremental": true` only scan pages edited since the last run."""
+    if not workspace.get('incremental'):
+        return None
+    return IncrementalSync(get_json_store('watermark'), workspace, rules)
+
+
+def __prepare_rules(rules: List[Rule], notion_project_handler):
+    for rule in rules:
+        started = time.perf_counter()
+        rule.prepare(notion_project_handler)
+        record_rule(rule.name, time.perf_counter() - started, pages=0)
+
+
+def __finish_rules(rules: List[Rule], notion_project_handler):
+    for rule in rules:
+        started = time.perf_counter()
+        rule.finish(notion_project_handler)
+        # Batching rules do most of their work here, so it counts towards the rule's time
+        record_rule(rule.name, time.perf_counter() - started, pages=0)
+
+
+async def __prepare_rules_async(rules: List[Rule], notion_project_handler):
+    for rule in rules:
+        started = time.perf_counter()
+        await rule.prepare_async(notion_project_handler)
+        record_rule(rule.name, time.perf_counter() - started, pages=0)
+
+
+async def __finish_rules_async(rules: List[Rule], notion_project_handler):
+    for rule in rules:
+        started = time.perf_counter()
+        await rule.finish_async(notion_project_handler)
+        record_rule(rule.name, time.perf_counter() - started, pages=0)
+
+
+def __apply_rules(rules: List[Rule], notion_page_handler, notion_project_handler):
+    for rule in rules:
+        started = time.perf_counter()
+        try:
+            rule.apply(notion_page_handler, notion_project_handler)
+            record_rule(rule.name, time.perf_counter() - started)
+        except Exception as err:
+            record_rule(rule.name, time.perf_counter() - started, ok=False)
+            print(f"RULE {rule.name} ERR ON PAGE {notion_page_handler.page_id} ==> ", err)
+
+
+async def __apply_rules_async(rules: List[Rule], notion_page_handler, notion_project_handler):
+    for rule in rules:
+        started = time.perf_counter()
+        try:
+            await rule.apply_async(notion_page_handler, notion_project_handler)
+            record_rule(rule.name, time.perf_counter() - started)
+        except Exception as err:
+            record_rule(rule.name, time.perf_counter() - started, ok=False)
+            print(f"RULE {rule.name} ERR ON PAGE {notion_page_handler.page_id} ==> ", err)
+
+
+def run_rules(workspace: Dict, rules: List[Rule]) -> List[MutationResult]:
+    """
+    Scan the workspace database once and run every rule against each page.
+
+    Property updates and comments are buffered in a write-behind queue and sent once per page,
+    after every rule has run on it; batching rules send theirs when the run finishes.
+
+    :return: The result of every write sent.
+    """
+    notion_project_handler = NotionProjectHandler(workspace)
+    properties = notion_project_handler.get_database_properties()
+    rules = [rule for rule in rules if rule.applies_to_database(properties)]
+    if not rules:
+        return []
+
+    mutation_queue = MutationQueue(notion_project_handler.notion_client)
+    try:
+        __run_rules(workspace, rules, properties, notion_project_handler, mutation_queue)
+    finally:
+        results = mutation_queue.close()
+        print_mutation_results(results, f"WORKSPACE {workspace.get('name')}")
+    return results
+
+
+def __run_rules(workspace: Dict, rules: List[Rule], properties: Dict, notion_project_handler, mutation_queue):
+    notion_project_handler.mutation_queue = mutation_queue
+    load_user_directory(workspace, rules, notion_project_handler)
+    __prepare_rules(rules, notion_project_handler)
+
+    incremental_sync = get_incremental_sync(workspace, rules)
+    scan_filter = get_scan_filter(rules, properties)
+    scan_properties = get_scan_properties(rules, properties)
+    scan_sorts = None
+    if incremental_sync:
+        scan_filter = incremental_sync.get_query_filter(scan_filter)
+        scan_sorts = incremental_sync.get_query_sorts()
+
+    pages = notion_project_handler.get_all_pages_in_database(filter=scan_filter, sorts=scan_sorts,
+                                                             filter_properties=scan_properties)
+    for page in pages:
+        if incremental_sync and incremental_sync.is_handled(page):
+            continue
+        notion_page_handler = NotionPageHandler.from_page(page, workspace['token'], mutation_queue,
+                                                          notion_project_handler.user_directory)
+        __apply_rules(rules, notion_page_handler, notion_project_handler)
+        mutation_queue.flush_page(notion_page_handler.page_id)
+        if incremental_sync:
+            incremental_sync.record(notion_page_handler)
+
+    if incremental_sync:
+        __recheck_due_pages(workspace, incremental_sync, scan_properties, notion_project_handler, mutation_queue)
+
+    __finish_rules(rules, notion_project_handler)
+
+    if incremental_sync:
+        incremental_sync.save()
+
+
+def __recheck_due_pages(workspace: Dict, incremental_sync: IncrementalSync, scan_properties: Optional[List[str]],
+                        notion_project_handler, mutation_queue):
+    # Unchanged pages can still become stale or overdue; the due-date index finds them without a rescan
+    for page_id in incremental_sync.get_recheck_page_ids():
+        try:
+            notion_page_handler = NotionPageHandler(page_id, workspace['token'], mutation_queue=mutation_queue,
+                                                    filter_properties=scan_properties,
+                                                    user_directory=notion_project_handler.user_directory)
+        except Exception as err:
+            print(f"COULDN'T RETRIEVE PAGE {page_id} FOR RECHECK ==> ", err)
+            incremental_sync.forget(page_id)
+            continue
+        __apply_rules(incremental_sync.time_based_rules, notion_page_handler, notion_project_handler)
+        mutation_queue.flush_page(page_id)
+        incremental_sync.record(notion_page_handler, advance_watermark=False)
+
+
+async def run_rules_async(workspace: Dict, rules: List[Rule], concurrency: int) -> List[MutationResult]:
+    """Async version of `run_rules`, processing up to `concurrency` pages at a time."""
+    notion_client = create_async_notion_client(workspace['token'])
+    try:
+        notion_project_handler = AsyncNotionProjectHandler(workspace, notion_client)
+        properties = await notion_project_handler.get_database_properties()
+        rules = [rule for rule in rules if rule.applies_to_database(properties)]
+        if not rules:
+            return []
+
+        mutation_queue = AsyncMutationQueue(notion_client, max_workers=concurrency)
+        try:
+            await __run_rules_async(workspace, rules, concurrency, properties, notion_project_handler, mutation_queue)
+        finally:
+            results = await mutation_queue.close()
+            print_mutation_results(results, f"WORKSPACE {workspace.get('name')}")
+        return results
+    finally:
+        await notion_client.aclose()
+
+
+async def __run_rules_async(workspace: Dict, rules: List[Rule], concurrency: int, properties: Dict,
+                            notion_project_handler, mutation_queue):
+    notion_client = notion_project_handler.notion_client
+    notion_project_handler.mutation_queue = mutation_queue
+    # Listed with the shared sync client, so the directory is cached across runs like in sync ones
+    await asyncio.to_thread(load_user_directory, workspace, rules, notion_project_handler)
+    await __prepare_rules_async(rules, notion_project_handler)
+
+    incremental_sync = get_incremental_sync(workspace, rules)
+    scan_filter = get_scan_filter(rules, properties)
+    scan_properties = get_scan_properties(rules, properties)
+    scan_sorts = None
+    if incremental_sync:
+        scan_filter = incremental_sync.get_query_filter(scan_filter)
+        scan_sorts = incremental_sync.get_query_sorts()
+
+    async def process(page):
+        if incremental_sync and incremental_sync.is_handled(page):
+            return
+        notion_page_handler = AsyncNotionPageHandler.from_page(page, notion_client, mutation_queue,
+                                                               notion_project_handler.user_directory)
+        await __apply_rules_async(rules, notion_page_handler, notion_project_handler)
+        mutation_queue.flush_page(notion_page_handler.page_id)
+        if incremental_sync:
+            incremental_sync.record(notion_page_handler)
+
+    pages = notion_project_handler.get_all_pages_in_database(filter=scan_filter, sorts=scan_sorts,
+                                                             filter_properties=scan_properties)
+    await run_pipeline(pages, process, concurrency)
+
+    if incremental_sync:
+        await __recheck_due_pages_async(incremental_sync, concurrency, scan_properties, notion_project_handler,
+                                        mutation_queue)
+
+    await __finish_rules_async(rules, notion_project_handler)
+
+    if incremental_sync:
+        incremental_sync.save()
+
+
+async def __recheck_due_pages_async(incremental_sync: IncrementalSync, concurrency: int,
+                                    scan_properties: Optional[List[str]], notion_project_handler, mutation_queue):
+    notion_client = notion_project_handler.notion_client
+
+    async def recheck(page_id):
+        try:
+            notion_page_handler = await AsyncNotionPageHandler.retrieve(page_id, notion_client, mutation_queue,
+                                                                        scan_properties,
+                                                                        notion_project_handler.user_directory)
+        except Exception as err:
+            print(f"COULDN'T RETRIEVE PAGE {page_id} FOR RECHECK ==> ", err)
+            incremental_sync.forget(page_id)
+            return
+        await __apply_rules_async(incremental_sync.time_based_rules, notion_page_handler, notion_project_handler)
+        mutation_queue.flush_page(page_id)
+        incremental_sync.record(notion_page_handler, advance_watermark=False)
+
+    await run_pipeline(__iterate_async(incremental_sync.get_recheck_page_ids()), recheck, concurrency)
+
+
+async def __iterate_async(items):
+    for item in items:
+        yield item
+
+
+def run_workspace_rules(workspace: Dict, rule_names: Optional[List[str]] = None) -> List[MutationResult]:
+    """Run the selected rules on a workspace, through the async pipeline when it sets a concurrency."""
+    rules = select_rules(rule_names)
+    concurrency = get_workspace_concurrency(workspace)
+    with track_workspace(workspace.get('name') or workspace['database_id']):
+        record_workspace_details(rules=[rule.name for rule in rules], concurrency=concurrency)
+        if concurrency > 1:
+            results = asyncio.run(run_rules_async(workspace, rules, concurrency))
+        else:
+            results = run_rules(workspace, rules)
+        record_workspace_details(mutations=summarize_mutation_results(results))
+    return results
+
+
+def run_shard_rules(workspace: Dict, shard: Shard, deadline: float, hand_off: Callable[[Shard], None],
+                    checkpoint: Callable[[Shard], None] = None) -> List[MutationResult]:
+    """
+    Run the shard's rules on its slice of the workspace database, like `run_rules` does on all of it.
+
+    The shard's query responses are fetched first and the rest of the database is handed off as a
+    new shard right away, so another worker starts on it while this one runs the rules. When `deadline` (a `time.monotonic()` value)
+    is reached first, the unprocessed part of the slice is handed off instead. Incremental sync is
+    not used: shards finish out of order, so there is no single watermark to advance.
+
+    :param hand_off: Queues a shard.
+    :param checkpoint: Records the shard's progress after each query response, if given.
+    :return: The result of every write sent.
+    """
+    notion_project_handler = NotionProjectHandler(workspace)
+    properties = notion_project_handler.get_database_properties()
+    rules = [rule for rule in select_rules(shard.rules) if rule.applies_to_database(properties)]
+    if not rules:
+        return []
+
+    mutation_queue = MutationQueue(notion_project_handler.notion_client)
+    notion_project_handler.mutation_queue = mutation_queue
+    load_user_directory(workspace, rules, notion_project_handler)
+    try:
+        __prepare_rules(rules, notion_project_handler)
+
+        __scan_shard(workspace, shard, rules, get_scan_filter(rules, properties), get_scan_properties(rules, properties),
+                     notion_project_handler, mutation_queue, deadline, hand_off, checkpoint)
+
+        __finish_rules(rules, notion_project_handler)
+    finally:
+        results = mutation_queue.close()
+        print_mutation_results(results, f"WORKSPACE {workspace.get('name')} SHARD {shard.cursor or 'start'}")
+    return results
+
+
+def __scan_shard(workspace: Dict, shard: Shard, rules: List[Rule], scan_filter: Optional[Dict],
+                 scan_properties: Optional[List[str]], notion_project_handler, mutation_queue, deadline: float,
+                 hand_off, checkpoint):
+    # Page through the whole slice first, so the rest of the database is handed off before any rule runs.
+    # A failed query raises, so the queue retries the shard rather than it ending early as if complete.
+    slice_responses = []
+    responses = notion_project_handler.get_database_query_responses(filter=scan_filter, start_cursor=shard.cursor,
+                                                                    filter_properties=scan_properties,
+                                                                    raise_errors=True)
+    cursor = shard.cursor
+    for response in responses:
+        next_cursor = response.get('next_cursor') if response.get('has_more') else None
+        slice_responses.append((cursor, response))
+        if len(slice_responses) >= shard.responses or not next_cursor:
+            break
+        cursor = next_cursor
+    else:
+        next_cursor = None
+
+    hands_off_rest = shard.hands_off_rest
+    if next_cursor and hands_off_rest:
+        hand_off(Shard(shard.database_id, shard.rules, next_cursor, run_id=shard.run_id))
+        hands_off_rest = False
+        # A worker resuming this shard must not queue the rest a second time
+        if checkpoint:
+            checkpoint(shard._replace(hands_off_rest=False))
+
+    skip = shard.skip
+    for count, (cursor, response) in enumerate(slice_responses, start=1):
+        pages = response.get('results', [])
+        for index in range(skip, len(pages)):
+            if time.monotonic() >= deadline:
+                hand_off(shard._replace(cursor=cursor, skip=index, responses=shard.responses - count + 1,
+                                        hands_off_rest=hands_off_rest))
+                return
+            notion_page_handler = NotionPageHandler.from_page(pages[index], workspace['token'], mutation_queue,
+                                                              notion_project_handler.user_directory)
+            __apply_rules(rules, notion_page_handler, notion_project_handler)
+            mutation_queue.flush_page(notion_page_handler.page_id)
+        skip = 0
+
+        if checkpoint and count < len(slice_responses):
+            checkpoint(shard._replace(cursor=slice_responses[count][0], skip=0, responses=shard.responses - count,
+                                      hands_off_rest=hands_off_rest))
+
+
+def run_workspace_shard(workspace: Dict, shard: Shard, deadline: float, hand_off: Callable[[Shard], None],
+                        checkpoint: Callable[[Shard], None] = None) -> List[MutationResult]:
+    """`run_workspace_rules` for one shard of the workspace."""
+    with track_workspace(workspace.get('name') or workspace['database_id']):
+        record_workspace_details(rules=shard.rules)
+        results = run_shard_rules(workspace, shard, deadline, hand_off, checkpoint)
+        record_workspace_details(mutations=summarize_mutation_results(results))
+    return results
+
+
+def run_changed_page_rules(workspace: Dict, events: List, rules: List[Rule]) -> List[MutationResult]:
+    """
+    Run on each changed page only the rules its change events can trigger, instead of scanning the database.
+
+    :param events: PageEvents of pages in the workspace database, one per page.
+    :return: The result of every write sent.
+    """
+    notion_project_handler = NotionProjectHandler(workspace)
+    properties = notion_project_handler.get_database_properties()
+    rules = [rule for rule in rules if rule.applies_to_database(properties)]
+    # Webhooks name updated properties by id; names are accepted as well
+    names_by_id = {schema.get('id'): name for name, schema in properties.items()}
+
+    triggered_rules = []
+    for event in events:
+        property_names = None if event.properties is None else {
+            names_by_id.get(property_id, property_id) for property_id in event.properties
+        }
+        page_rules = [rule for rule in rules if rule.is_triggered_by(event.types, property_names)]
+        if page_rules:
+            triggered_rules.append((event.page_id, page_rules))
+    rules = [rule for rule in rules if any(rule in page_rules for _, page_rules in triggered_rules)]
+    if not rules:
+        return []
+
+    scan_properties = get_scan_properties(rules, properties)
+    mutation_queue = MutationQueue(notion_project_handler.notion_client)
+    notion_project_handler.mutation_queue = mutation_queue
+    load_user_directory(workspace, rules, notion_project_handler)
+    try:
+        __prepare_rules(rules, notion_project_handler)
+
+        for page_id, page_rules in triggered_rules:
+            try:
+                notion_page_handler = NotionPageHandler(page_id, workspace['token'], mutation_queue=mutation_queue,
+                                                        filter_properties=scan_properties,
+                                                        user_directory=notion_project_handler.user_directory)
+            except Exception as err:
+                print(f"COULDN'T RETRIEVE CHANGED PAGE {page_id} ==> ", err)
+                continue
+            __apply_rules(page_rules, notion_page_handler, notion_project_handler)
+            mutation_queue.flush_page(page_id)
+
+        __finish_rules(rules, notion_project_handler)
+    finally:
+        results = mutation_queue.close()
+        print_mutation_results(results, f"WORKSPACE {workspace.get('name')} CHANGES")
+    return results
+
+
+def run_workspace_changes(workspace: Dict, events: List, rule_names: Optional[List[str]] = None) -> List[MutationResult]:
+    """`run_workspace_rules` for the pages named by webhook events."""
+    rules = select_rules(rule_names)
+    with track_workspace(workspace.get('name') or workspace['database_id']):
+        record_workspace_details(rules=[rule.name for rule in rules], changed_pages=len(events))
+        results = run_changed_page_rules(workspace, events, rules)
+        record_workspace_details(mutations=summarize_mutation_results(results))
+    return results
@@ -0,0 +1,86 @@
+"""
+Dispatcher and workers of the sharded fan-out. The dispatcher queues one shard per workspace;
+workers run shards within a time budget and queue whatever they can't finish, so a run is spread
+over as many invocations (and instances) as it needs instead of one HTTP request.
+"""
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+from rule_engine import run_workspace_shard
+from work_queue import Shard, WorkQueue
+
+# Time a worker invocation may spend on shards; keep it below the function timeout
+WORKER_TIME_BUDGET_SECONDS = float(os.getenv("WORKER_TIME_BUDGET_SECONDS", 480))
+# Part of the budget kept for the rules' batched work and the last writes after the deadline
+CHECKPOINT_MARGIN_SECONDS = float(os.getenv("CHECKPOINT_MARGIN_SECONDS", 60))
+
+
+def dispatch_shards(workspaces: List[Dict], rule_names: List[str], queue: WorkQueue) -> List[Shard]:
+    """Queue the first shard of every workspace; workers fan out from there."""
+    run_id = uuid.uuid4().hex
+    shards = [Shard(workspace['database_id'], list(rule_names), run_id=run_id) for workspace in workspaces]
+    for shard in shards:
+        queue.put(shard)
+    return shards
+
+
+def find_workspace(workspaces: List[Dict], database_id: str) -> Optional[Dict]:
+    """The workspace of a database, matching ids with or without dashes."""
+    database_id = database_id.replace('-', '')
+    return next((workspace for workspace in workspaces
+                 if (workspace.get('database_id') or '').replace('-', '') == database_id), None)
+
+
+class ShardWorker:
+    def __init__(self, queue: WorkQueue, workspaces: List[Dict], time_budget: float = WORKER_TIME_BUDGET_SECONDS,
+                 margin: float = CHECKPOINT_MARGIN_SECONDS):
+        """
+        :param queue: Where shards are handed off to, and pulled from by `run_queued_shards`.
+        :param workspaces: The configured workspaces, to look shards' workspaces up in.
+        :param time_budget: Seconds from now the worker may run for.
+        :param margin: Seconds before the end of the budget at which shards stop taking new pages.
+        """
+        self.queue = queue
+        self.workspaces = workspaces
+        self.deadline = time.monotonic() + time_budget - margin
+        self.processed = 0
+        self.handed_off = 0
+        self.failed = 0
+
+    def hand_off(self, shard: Shard):
+        self.queue.put(shard)
+        self.handed_off += 1
+
+    def run_shard(self, shard: Shard, task_id: int = None):
+        """Run one shard; raises when it fails, so the queue can retry it."""
+        workspace = find_workspace(self.workspaces, shard.database_id)
+        if workspace is None:
+            # The workspace was removed since the shard was queued; there is nothing to retry
+            print(f"NO WORKSPACE FOR SHARD OF DATABASE {shard.database_id}")
+            return
+        checkpoint = (lambda progress: self.queue.checkpoint(task_id, progress)) if task_id is not None else None
+        try:
+            run_workspace_shard(workspace, shard, self.deadline, self.hand_off, checkpoint)
+        except Exception:
+            self.failed += 1
+            raise
+        self.processed += 1
+
+    def run_queued_shards(self):
+        """Claim and run shards from the queue until it is empty or the time budget is used up."""
+        while time.monotonic() < self.deadline:
+            claimed = self.queue.claim()
+            if claimed is None:
+                return
+            task_id, shard = claimed
+            try:
+                self.run_shard(shard, task_id)
+            except Exception as err:
+                print(f"SHARD OF DATABASE {shard.database_id} ERR ==> ", err)
+                self.queue.release(task_id)
+                continue
+            self.queue.complete(task_id)
+
+    def get_report(self) -> Dict:
+        return {'processed': self.processed, 'handed_off': self.handed_off, 'failed': self.failed}
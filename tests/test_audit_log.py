@@ -0,0 +1,61 @@
+import gzip
+import json
+
+import pytest
+
+import audit_log
+from audit_log import AuditLog, FileAuditSink, GCSAuditSink, StdoutAuditSink, create_audit_sink
+
+ENVIRONMENT = ("AUDIT_STORE", "AUDIT_LOG_BUCKET", "AUDIT_DIR", "K_SERVICE", "FUNCTION_TARGET")
+
+
+@pytest.fixture(autouse=True)
+def clean_environment(monkeypatch, tmp_path):
+    for name in ENVIRONMENT:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("AUDIT_DIR", str(tmp_path))
+
+
+class FakeStorageClient:
+    def bucket(self, name):
+        return name
+
+
+def test_local_runs_write_a_file():
+    assert isinstance(create_audit_sink("run_automations", "run"), FileAuditSink)
+
+
+def test_deployed_runs_without_a_bucket_print_to_stdout(monkeypatch):
+    monkeypatch.setenv("K_SERVICE", "run-automations")
+
+    assert isinstance(create_audit_sink("run_automations", "run"), StdoutAuditSink)
+
+
+def test_gcs_without_a_bucket_falls_back(monkeypatch):
+    monkeypatch.setenv("AUDIT_STORE", "gcs")
+
+    assert isinstance(create_audit_sink("run_automations", "run"), FileAuditSink)
+
+
+def test_the_audit_bucket_is_used_with_the_shared_storage_client(monkeypatch):
+    monkeypatch.setenv("AUDIT_LOG_BUCKET", "audit-bucket")
+    monkeypatch.setattr(audit_log, "get_storage_client", FakeStorageClient)
+
+    sink = create_audit_sink("run_automations", "run")
+
+    assert isinstance(sink, GCSAuditSink)
+    assert sink.bucket == "audit-bucket"
+
+
+def test_file_and_stdout_sinks_get_the_same_records(tmp_path, capsys):
+    file_sink = FileAuditSink(str(tmp_path / "audit.ndjson.gz"))
+    for sink in (file_sink, StdoutAuditSink()):
+        log = AuditLog(sink, "run")
+        log.record("assignee_backfilled", page_id="page", user_id="user")
+        log.close()
+
+    with gzip.open(file_sink.path, "rt") as file:
+        written = [json.loads(line) for line in file]
+    printed = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [record["event"] for record in written] == ["assignee_backfilled"]
+    assert [{**record, "time": None} for record in printed] == [{**record, "time": None} for record in written]
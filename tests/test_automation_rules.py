@@ -0,0 +1,41 @@
+from automation_rules import ProjectNamingRule
+from notion_project_handler import NotionProjectHandler
+
+
+class SchemaClient:
+    def __init__(self, properties: dict):
+        self.properties = properties
+        self.updates = []
+        self.databases = self
+
+    def retrieve(self, database_id):
+        return {"properties": self.properties}
+
+    def update(self, database_id, properties):
+        self.updates.append(properties)
+
+
+def build_project_handler(client: SchemaClient) -> NotionProjectHandler:
+    project_handler = NotionProjectHandler({"name": "test", "token": "secret_test", "database_id": "database"})
+    project_handler.notion_client = client
+    return project_handler
+
+
+def test_naming_rule_leaves_a_schema_with_the_checkbox_alone():
+    client = SchemaClient({"Project name": {"type": "title"}, "title checked": {"type": "checkbox"}})
+    project_handler = build_project_handler(client)
+    project_handler.get_database_properties()
+
+    ProjectNamingRule().prepare(project_handler)
+
+    assert client.updates == []
+
+
+def test_naming_rule_adds_the_missing_checkbox():
+    client = SchemaClient({"Project name": {"type": "title"}})
+    project_handler = build_project_handler(client)
+    project_handler.get_database_properties()
+
+    ProjectNamingRule().prepare(project_handler)
+
+    assert client.updates == [{"title checked": {"checkbox": {}}}]
@@ -0,0 +1,43 @@
+import pytest
+
+from name_classifier import classify_project_name
+
+
+@pytest.mark.parametrize("name", [
+    "Drawer has been stocked",
+    "Supplies have been organized",
+    "Onboarding docs are written",
+    "Roadmap is set up",
+    "Invoice backlog is fully paid",
+])
+def test_outcome_names_are_valid(name):
+    assert classify_project_name(name) == (True, name)
+
+
+@pytest.mark.parametrize("name", [
+    "Fix login bug",
+    "Write release notes",
+    "Prepare sales deck",
+])
+def test_task_names_are_invalid_without_a_suggestion(name):
+    assert classify_project_name(name) == (False, None)
+
+
+@pytest.mark.parametrize("name", [
+    # Adjectives and nouns after is/are/has been are not outcomes the rules can vouch for
+    "Car is red",
+    "Kitchen is open",
+    "Budget is ten thousand",
+    "Drawer has been a mess",
+    "Fixed asset register",
+    # Verbs that also open noun phrases
+    "Plan for Q3",
+    "Book club",
+    "Review meeting",
+    "Update log",
+    # No verb, or a single word
+    "Q3 budget",
+    "Fix",
+])
+def test_ambiguous_names_go_to_claude(name):
+    assert classify_project_name(name) is None
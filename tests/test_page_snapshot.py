@@ -0,0 +1,56 @@
+from automation_rules import AssigneeBackfillRule
+from notion_page_handler import NotionPageHandler
+from page_snapshot import PageSnapshot
+
+ASSIGNEE_ID = "11111111-1111-1111-1111-111111111111"
+EDITOR_ID = "22222222-2222-2222-2222-222222222222"
+
+
+def build_page(assignees: list) -> dict:
+    return {
+        "object": "page",
+        "id": "33333333-3333-3333-3333-333333333333",
+        "last_edited_time": "2024-05-01T10:00:00.000Z",
+        "created_by": {"object": "user", "id": EDITOR_ID},
+        "last_edited_by": {"object": "user", "id": EDITOR_ID},
+        "properties": {
+            "Status": {"id": "status", "type": "status", "status": {"id": "in-progress", "name": "In progress"}},
+            "Assignee": {"id": "assignee", "type": "people", "people": assignees},
+        },
+    }
+
+
+class RecordingQueue:
+    def __init__(self):
+        self.updates = []
+
+    def update_properties(self, page_id: str, properties: dict):
+        self.updates.append((page_id, properties))
+
+
+def test_assignees_are_read_from_the_page_properties():
+    snapshot = PageSnapshot.from_page(build_page([{"object": "user", "id": ASSIGNEE_ID}]))
+
+    assert snapshot.assignee_ids == (ASSIGNEE_ID,)
+
+
+def test_assignee_backfill_leaves_assigned_pages_alone():
+    queue = RecordingQueue()
+    page_handler = NotionPageHandler.from_page(build_page([{"object": "user", "id": ASSIGNEE_ID}]),
+                                               "secret_test", mutation_queue=queue)
+
+    AssigneeBackfillRule().apply(page_handler, None)
+
+    assert page_handler.get_page_assignees() == [{"object": "user", "id": ASSIGNEE_ID}]
+    assert queue.updates == []
+
+
+def test_assignee_backfill_assigns_unassigned_pages_to_their_last_editor():
+    queue = RecordingQueue()
+    page_handler = NotionPageHandler.from_page(build_page([]), "secret_test", mutation_queue=queue)
+
+    AssigneeBackfillRule().apply(page_handler, None)
+
+    assert [properties["Assignee"]["people"] for _, properties in queue.updates] == [
+        [{"object": "user", "id": EDITOR_ID.replace("-", "")}]
+    ]
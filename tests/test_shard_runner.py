@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+import rule_engine
+from notion_project_handler import NotionProjectHandler
+from work_queue import Shard
+
+
+class FailingQueryClient:
+    """Answers the first database query with a full response, then fails."""
+
+    def __init__(self):
+        self.queries = 0
+        self.databases = self
+
+    def retrieve(self, database_id):
+        return {"properties": {}}
+
+    def query(self, **query):
+        self.queries += 1
+        if self.queries > 1:
+            raise RuntimeError("query failed")
+        return {"results": [], "has_more": True, "next_cursor": "cursor-2"}
+
+
+def test_failed_query_fails_the_shard(monkeypatch):
+    client = FailingQueryClient()
+
+    class ProjectHandler(NotionProjectHandler):
+        def __init__(self, workspace):
+            super().__init__(workspace)
+            self.notion_client = client
+
+    monkeypatch.setattr(rule_engine, "NotionProjectHandler", ProjectHandler)
+    monkeypatch.setattr(rule_engine, "load_user_directory", lambda *args: None)
+    handed_off = []
+    workspace = {"name": "test", "token": "secret_test", "database_id": "database"}
+
+    with pytest.raises(RuntimeError):
+        rule_engine.run_shard_rules(workspace, Shard("database", ["assignee"], responses=2),
+                                    time.monotonic() + 60, handed_off.append)
+
+    assert client.queries == 2
+    assert handed_off == []
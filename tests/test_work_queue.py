@@ -0,0 +1,51 @@
+import types
+
+from google.api_core.exceptions import AlreadyExists
+
+from work_queue import CloudTasksWorkQueue, Shard
+
+QUEUE_PATH = "projects/project/locations/location/queues/shards"
+
+
+class FakeCloudTasksClient:
+    def __init__(self):
+        self.tasks = {}
+
+    def create_task(self, parent, task):
+        if task["name"] in self.tasks:
+            raise AlreadyExists("task exists")
+        self.tasks[task["name"]] = task
+
+
+def build_queue() -> CloudTasksWorkQueue:
+    # Skips __init__, which needs google-cloud-tasks and credentials
+    queue = CloudTasksWorkQueue.__new__(CloudTasksWorkQueue)
+    queue.tasks_v2 = types.SimpleNamespace(HttpMethod=types.SimpleNamespace(POST="POST"))
+    queue.already_exists = AlreadyExists
+    queue.client = FakeCloudTasksClient()
+    queue.queue_path = QUEUE_PATH
+    queue.worker_url = "https://worker"
+    queue.service_account_email = None
+    return queue
+
+
+def test_a_shard_handed_off_twice_is_queued_once():
+    queue = build_queue()
+    shard = Shard("database", ["nudge"], "cursor-2", run_id="run")
+
+    queue.put(shard)
+    queue.put(Shard("database", ["nudge"], "cursor-2", run_id="run"))
+
+    assert len(queue.client.tasks) == 1
+    assert next(iter(queue.client.tasks)).startswith(f"{QUEUE_PATH}/tasks/shard-")
+
+
+def test_shards_of_other_runs_or_cursors_are_queued():
+    queue = build_queue()
+
+    queue.put(Shard("database", ["nudge"], "cursor-2", run_id="run"))
+    queue.put(Shard("database", ["nudge"], "cursor-3", run_id="run"))
+    queue.put(Shard("database", ["nudge"], "cursor-2", run_id="other-run"))
+    queue.put(Shard("database", ["nudge"], "cursor-2", skip=40, run_id="run"))
+
+    assert len(queue.client.tasks) == 4
@@ -0,0 +1,55 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class StaleWhileRevalidateCache:
+    """
+    Process-wide cache whose entries expire after `ttl` seconds but are still served while a
+    background thread refreshes them, so warm invocations never wait on a reload.
+
+    `loader(key, previous)` returns the fresh value; it gets the previous value (or None) so it can
+    make a conditional request and hand the previous value back when nothing changed. A missing
+    entry is loaded synchronously. A failing refresh keeps serving the stale value.
+    """
+
+    def __init__(self, loader: Callable[[Hashable, Optional[Any]], Any], ttl: float):
+        self.loader = loader
+        self.ttl = ttl
+        self.entries: Dict[Hashable, Tuple[Any, float]] = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, loaded_at = entry
+                if time.monotonic() - loaded_at >= self.ttl and key not in self.refreshing:
+                    self.refreshing.add(key)
+                    threading.Thread(target=self.__refresh, args=(key, value), daemon=True).start()
+                return value
+
+        value = self.loader(key, None)
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+        return value
+
+    def __refresh(self, key: Hashable, previous: Any):
+        try:
+            value = self.loader(key, previous)
+            with self.lock:
+                self.entries[key] = (value, time.monotonic())
+        except Exception as err:
+            print(f"ERROR REFRESHING CACHED {key} ==> ", err)
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def invalidate(self, key: Hashable = None):
+        """Drop one entry, or every entry when no key is given."""
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
@@ -0,0 +1,80 @@
+"""
+Directory of a workspace's users, built from `users.list`, to check mention and assignment targets
+before anything is written.
+
+Notion lists the workspace's members and bots; guests and people removed from the workspace are
+not listed, so an id missing from the directory can't be notified either.
+"""
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from notion_client_registry import get_notion_client
+from ttl_cache import StaleWhileRevalidateCache
+
+USER_DIRECTORY_TTL_SECONDS = float(os.getenv("USER_DIRECTORY_TTL_SECONDS", 900))
+
+
+class DirectoryUser(NamedTuple):
+    id: str
+    type: str  # "person" or "bot"
+    name: Optional[str] = None
+    email: Optional[str] = None
+
+
+class UserDirectory:
+    def __init__(self, users: Iterable[Dict]):
+        """:param users: User objects as returned by `users.list`."""
+        self.users: Dict[str, DirectoryUser] = {}
+        for user in users:
+            if not user.get('id'):
+                continue
+            self.users[user['id'].replace('-', '')] = DirectoryUser(
+                user['id'], user.get('type') or 'person', user.get('name'),
+                (user.get('person') or {}).get('email'),
+            )
+
+    def __len__(self):
+        return len(self.users)
+
+    def get(self, user_id: str) -> Optional[DirectoryUser]:
+        return self.users.get(user_id.replace('-', '')) if user_id else None
+
+    def is_valid_target(self, user_id: str) -> bool:
+        """Whether the user can be mentioned or assigned: a listed person, not a bot, guest or removed member."""
+        user = self.get(user_id)
+        return user is not None and user.type == 'person'
+
+    def filter_valid_targets(self, user_ids: Iterable[str]) -> List[str]:
+        return [user_id for user_id in user_ids if self.is_valid_target(user_id)]
+
+
+def list_workspace_users(notion_client) -> List[Dict]:
+    """Every user of the workspace, following `next_cursor` until the end."""
+    users = []
+    query = {"page_size": 100}
+    while True:
+        response = notion_client.users.list(**query)
+        users.extend(response.get("results", []))
+        next_cursor = response.get("next_cursor")
+        if not response.get("has_more") or not next_cursor:
+            return users
+        query["start_cursor"] = next_cursor
+
+
+def __load_user_directory(token: str, previous: Optional[UserDirectory] = None) -> UserDirectory:
+    return UserDirectory(list_workspace_users(get_notion_client(token)))
+
+
+__directories = StaleWhileRevalidateCache(__load_user_directory, USER_DIRECTORY_TTL_SECONDS)
+
+
+def get_user_directory(token: str) -> Optional[UserDirectory]:
+    """
+    The user directory of a token's workspace, kept across warm invocations and refreshed in the
+    background once older than USER_DIRECTORY_TTL_SECONDS. None when the users can't be listed
+    (e.g. the integration lacks user information capabilities); targets are then not checked.
+    """
+    try:
+        return __directories.get(token)
+    except Exception as err:
+        print("ERROR LISTING WORKSPACE USERS ==> ", err)
+        return None
@@ -0,0 +1,215 @@
+"""
+Event-driven mode: Notion webhook events are parsed into page events, buffered per page and
+debounced, and the rules their changes can trigger run on the pages once they have settled.
+
+A burst of edits to one page (typing in a title, ticking several properties) becomes a single
+run on that page, WEBHOOK_DEBOUNCE_SECONDS after its last event; a page that keeps changing is
+still processed once its first event is WEBHOOK_MAX_WAIT_SECONDS old.
+"""
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from instrumentation import record_workspace_errors
+from rule_engine import run_workspace_changes
+from shard_runner import find_workspace
+from workspace_runner import run_workspaces
+
+WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", 10))
+WEBHOOK_MAX_WAIT_SECONDS = float(os.getenv("WEBHOOK_MAX_WAIT_SECONDS", 60))
+DELETED_EVENT_TYPE = 'page.deleted'
+
+
+class PageEvent(NamedTuple):
+    """
+    The changes to one page: the event types seen and the ids (or names) of the properties
+    updated. `properties` is None when an event did not say which properties changed.
+    """
+    page_id: str
+    database_id: str
+    types: Tuple[str, ...]
+    properties: Optional[Tuple[str, ...]] = ()
+
+    def merge(self, other: 'PageEvent') -> 'PageEvent':
+        types = tuple(sorted(set(self.types) | set(other.types)))
+        if self.properties is None or other.properties is None:
+            return self._replace(types=types, properties=None)
+        return self._replace(types=types, properties=tuple(sorted(set(self.properties) | set(other.properties))))
+
+    def to_json(self) -> str:
+        return json.dumps(self)
+
+    @classmethod
+    def from_json(cls, text: str) -> 'PageEvent':
+        page_id, database_id, types, properties = json.loads(text)
+        return cls(page_id, database_id, tuple(types), tuple(properties) if properties is not None else None)
+
+
+def __get_database_id(parent: Dict) -> Optional[str]:
+    if parent.get('type') == 'database':
+        return parent.get('id')
+    # Pages in a database's data source name the database separately
+    return parent.get('database_id')
+
+
+def parse_webhook_event(event: Dict) -> Optional[PageEvent]:
+    """
+    The page event of a Notion webhook event, or None for events about anything but a database
+    page, and for changes made only by integrations: the automations' own writes come back as
+    events too, and reacting to them would loop.
+    """
+    entity = event.get('entity') or {}
+    if entity.get('type') != 'page' or not entity.get('id') or not event.get('type', '').startswith('page.'):
+        return None
+    authors = event.get('authors') or []
+    if authors and all(author.get('type') == 'bot' for author in authors):
+        return None
+    data = event.get('data') or {}
+    database_id = __get_database_id(data.get('parent') or {})
+    if not database_id:
+        return None
+    updated_properties = data.get('updated_properties')
+    return PageEvent(
+        entity['id'].replace('-', ''),
+        database_id.replace('-', ''),
+        (event['type'],),
+        tuple(updated_properties) if updated_properties is not None else
+        (() if event['type'] != 'page.properties_updated' else None),
+    )
+
+
+def parse_webhook_events(body) -> List[PageEvent]:
+    """Page events of a webhook body: one event, or a list of them as in the recorded fixtures."""
+    events = body if isinstance(body, list) else [body] if isinstance(body, dict) else []
+    return [page_event for page_event in map(parse_webhook_event, events) if page_event]
+
+
+def is_valid_signature(raw_body: bytes, signature: Optional[str], verification_token: str) -> bool:
+    """Check the `X-Notion-Signature` header: "sha256=" + HMAC-SHA256 of the body keyed by the verification token."""
+    if not signature:
+        return False
+    expected = "sha256=" + hmac.new(verification_token.encode("utf-8"), raw_body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+class PageEventBuffer:
+    """
+    Pending page events in a SQLite file, one row per page. The file is local to an instance, so
+    deploy the webhook function with a single instance; events lost with an instance are picked
+    up by the reconciliation sweep.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.__connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS page_events (
+                    page_id TEXT PRIMARY KEY,
+                    event TEXT NOT NULL,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def __connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def add(self, events: List[PageEvent], now: float = None):
+        """Merge events into the pending ones; a deleted page is dropped instead."""
+        now = now or time.time()
+        with self.lock, self.__connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            for event in events:
+                if DELETED_EVENT_TYPE in event.types:
+                    connection.execute("DELETE FROM page_events WHERE page_id = ?", (event.page_id,))
+                    continue
+                row = connection.execute(
+                    "SELECT event FROM page_events WHERE page_id = ?", (event.page_id,)
+                ).fetchone()
+                if row is not None:
+                    event = PageEvent.from_json(row[0]).merge(event)
+                connection.execute(
+                    "INSERT INTO page_events (page_id, event, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (page_id) DO UPDATE SET event = excluded.event, last_seen = excluded.last_seen",
+                    (event.page_id, event.to_json(), now, now)
+                )
+            connection.execute("COMMIT")
+
+    def take_ready(self, now: float = None, debounce_seconds: float = WEBHOOK_DEBOUNCE_SECONDS,
+                   max_wait_seconds: float = WEBHOOK_MAX_WAIT_SECONDS) -> List[PageEvent]:
+        """
+        Remove and return the events of pages quiet for `debounce_seconds` or waiting for
+        `max_wait_seconds`. Put back the events of a run that fails with `put_back`.
+        """
+        now = now or time.time()
+        with self.lock, self.__connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                "SELECT page_id, event FROM page_events WHERE last_seen <= ? OR first_seen <= ? ORDER BY first_seen",
+                (now - debounce_seconds, now - max_wait_seconds)
+            ).fetchall()
+            connection.executemany("DELETE FROM page_events WHERE page_id = ?", [(row[0],) for row in rows])
+            connection.execute("COMMIT")
+        return [PageEvent.from_json(row[1]) for row in rows]
+
+    def put_back(self, events: List[PageEvent], now: float = None):
+        """Return taken events whose run failed, merged with any newer events of their pages, so a later call retries them."""
+        self.add(events, now)
+
+    def get_pending_count(self) -> int:
+        with self.lock, self.__connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM page_events").fetchone()[0]
+
+
+def get_page_event_buffer() -> PageEventBuffer:
+    return PageEventBuffer(os.getenv("WEBHOOK_BUFFER_PATH", "/tmp/notion-webhook-events.sqlite3"))
+
+
+def run_ready_page_events(buffer: PageEventBuffer, workspaces: List[Dict], rule_names: List[str],
+                          **debounce) -> Dict:
+    """
+    Run the rules on every page whose events have settled, several workspaces at once. A failing
+    workspace does not stop the others, and its events are put back in the buffer to be retried.
+
+    :return: Counts of the pages processed, of those put back after their workspace failed, and of
+        those whose database is not a configured workspace.
+    """
+    events_by_database: Dict[str, List[PageEvent]] = {}
+    for event in buffer.take_ready(**debounce):
+        events_by_database.setdefault(event.database_id, []).append(event)
+
+    report = {'pages': 0, 'put_back_pages': 0, 'unknown_database_pages': 0}
+    changed_workspaces = []
+    for database_id, events in events_by_database.items():
+        workspace = find_workspace(workspaces, database_id)
+        if workspace is None:
+            report['unknown_database_pages'] += len(events)
+            continue
+        report['pages'] += len(events)
+        changed_workspaces.append(workspace)
+
+    # Event database ids have no dashes
+    errors = run_workspaces(changed_workspaces, lambda workspace: run_workspace_changes(
+        workspace, events_by_database[workspace['database_id'].replace('-', '')], rule_names
+    ))
+    record_workspace_errors(errors)
+    for workspace in changed_workspaces:
+        if errors.get(workspace.get('name') or workspace.get('database_id')):
+            events = events_by_database[workspace['database_id'].replace('-', '')]
+            buffer.put_back(events)
+            report['put_back_pages'] += len(events)
+    return report
@@ -0,0 +1,217 @@
+"""
+Queue of shards for the sharded fan-out: the dispatcher puts one shard per workspace, and workers
+hand the rest of a database off as new shards while they work through their slice of it.
+
+Backends:
+- `SQLiteWorkQueue`: a pull queue in a local SQLite file, with leases, for local runs and tests.
+- `CloudTasksWorkQueue`: a push queue; each shard becomes a Cloud Task that POSTs it to the worker.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, NamedTuple, Optional, Tuple
+from instrumentation import track_call
+
+# Pages a shard covers, in query responses of 100 pages
+SHARD_RESPONSES = int(os.getenv("SHARD_RESPONSES", 5))
+# A lease not renewed for this long is considered abandoned and the shard is handed out again
+LEASE_SECONDS = float(os.getenv("WORK_QUEUE_LEASE_SECONDS", 600))
+MAX_ATTEMPTS = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", 5))
+
+
+class Shard(NamedTuple):
+    """
+    A slice of one workspace database: `responses` query responses starting at `cursor`, of which
+    the first `skip` pages were already processed. A shard with `hands_off_rest` queues the rest of
+    the database as a new shard once it has paged through its responses. Workspaces are referenced by
+    database id, so tokens never go through the queue.
+    """
+    database_id: str
+    rules: List[str]
+    cursor: Optional[str] = None
+    skip: int = 0
+    responses: int = SHARD_RESPONSES
+    hands_off_rest: bool = True
+    run_id: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Shard':
+        return cls(**{field: data[field] for field in cls._fields if field in data})
+
+
+class WorkQueue:
+    def put(self, shard: Shard):
+        raise NotImplementedError
+
+    def claim(self) -> Optional[Tuple[int, Shard]]:
+        """Lease the next shard; None when the queue is empty or delivers shards itself."""
+        return None
+
+    def checkpoint(self, task_id: int, shard: Shard):
+        """Record the progress of a claimed shard, so a worker that dies resumes from there."""
+
+    def complete(self, task_id: int):
+        """Remove a claimed shard once it is done or handed off."""
+
+    def release(self, task_id: int):
+        """Give a claimed shard back, e.g. after an error, so it is retried."""
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """Pull queue in a SQLite file. Several worker processes can share it."""
+
+    def __init__(self, path: str, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.__connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS shards (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_until REAL NOT NULL DEFAULT 0
+                )
+            """)
+
+    @contextmanager
+    def __connect(self):
+        # isolation_level=None so BEGIN IMMEDIATE below controls the transaction
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def put(self, shard: Shard):
+        with self.lock, self.__connect() as connection:
+            connection.execute("INSERT INTO shards (payload) VALUES (?)", (json.dumps(shard.to_dict()),))
+
+    def claim(self) -> Optional[Tuple[int, Shard]]:
+        now = time.time()
+        with self.lock, self.__connect() as connection:
+            # Take the write lock first, so two workers can't lease the same shard
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "UPDATE shards SET state = 'failed' WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                    (now, self.max_attempts)
+                )
+                row = connection.execute(
+                    "SELECT id, payload FROM shards WHERE state = 'queued' OR (state = 'leased' AND lease_until < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE shards SET state = 'leased', attempts = attempts + 1, lease_until = ? WHERE id = ?",
+                        (now + self.lease_seconds, row[0])
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row[0], Shard.from_dict(json.loads(row[1]))
+
+    def checkpoint(self, task_id: int, shard: Shard):
+        with self.lock, self.__connect() as connection:
+            connection.execute(
+                "UPDATE shards SET payload = ?, lease_until = ? WHERE id = ? AND state = 'leased'",
+                (json.dumps(shard.to_dict()), time.time() + self.lease_seconds, task_id)
+            )
+
+    def complete(self, task_id: int):
+        with self.lock, self.__connect() as connection:
+            connection.execute("DELETE FROM shards WHERE id = ?", (task_id,))
+
+    def release(self, task_id: int):
+        with self.lock, self.__connect() as connection:
+            connection.execute(
+                "UPDATE shards SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, lease_until = 0 "
+                "WHERE id = ?",
+                (self.max_attempts, task_id)
+            )
+
+    def get_counts(self) -> dict:
+        """Number of shards per state, e.g. {"queued": 3, "leased": 1}."""
+        with self.lock, self.__connect() as connection:
+            return dict(connection.execute("SELECT state, COUNT(*) FROM shards GROUP BY state").fetchall())
+
+
+class CloudTasksWorkQueue(WorkQueue):
+    """
+    Push queue on Cloud Tasks: every shard is sent to the worker function as the JSON body
+    {"shard": {...}}. Cloud Tasks retries a shard whose worker fails, and the queue's rate and
+    concurrency settings bound how many workers run at once.
+
+    Tasks are named after their shard, so when a retried worker hands the same shard off again,
+    Cloud Tasks rejects the duplicate (names stay reserved for about an hour after a task ran).
+    """
+
+    def __init__(self, queue_path: str, worker_url: str, service_account_email: str = None):
+        """
+        :param queue_path: "projects/<project>/locations/<location>/queues/<queue>".
+        :param worker_url: URL of the shard worker function.
+        :param service_account_email: Service account the tasks authenticate to the worker as.
+        """
+        # Imported here so only deployments using this backend need google-cloud-tasks
+        from google.api_core.exceptions import AlreadyExists
+        from google.cloud import tasks_v2
+        self.tasks_v2 = tasks_v2
+        self.already_exists = AlreadyExists
+        self.client = tasks_v2.CloudTasksClient()
+        self.queue_path = queue_path
+        self.worker_url = worker_url
+        self.service_account_email = service_account_email
+
+    def get_task_name(self, shard: Shard) -> Optional[str]:
+        """The task name of a shard of a dispatched run; shards without a run id get generated names."""
+        if not shard.run_id:
+            return None
+        digest = hashlib.sha256(json.dumps(shard.to_dict(), sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{self.queue_path}/tasks/shard-{digest}"
+
+    def put(self, shard: Shard):
+        body = json.dumps({"shard": shard.to_dict()}).encode("utf-8")
+        http_request = {
+            "http_method": self.tasks_v2.HttpMethod.POST,
+            "url": self.worker_url,
+            "headers": {"Content-Type": "application/json"},
+            "body": body,
+        }
+        if self.service_account_email:
+            http_request["oidc_token"] = {"service_account_email": self.service_account_email}
+        task = {"http_request": http_request}
+        task_name = self.get_task_name(shard)
+        if task_name:
+            task["name"] = task_name
+        try:
+            with track_call("cloud_tasks", "create_task", len(body)):
+                self.client.create_task(parent=self.queue_path, task=task)
+        except self.already_exists:
+            print(f"SHARD OF DATABASE {shard.database_id} AT {shard.cursor or 'start'} ALREADY QUEUED")
+
+
+def get_work_queue() -> WorkQueue:
+    """
+    Build the configured queue: Cloud Tasks when WORK_QUEUE=cloud_tasks (with CLOUD_TASKS_QUEUE,
+    SHARD_WORKER_URL and optionally CLOUD_TASKS_SERVICE_ACCOUNT), otherwise a SQLite file at WORK_QUEUE_PATH.
+    """
+    if os.getenv("WORK_QUEUE", "sqlite") == "cloud_tasks":
+        return CloudTasksWorkQueue(os.environ["CLOUD_TASKS_QUEUE"], os.environ["SHARD_WORKER_URL"],
+                                   os.getenv("CLOUD_TASKS_SERVICE_ACCOUNT"))
+    return SQLiteWorkQueue(os.getenv("WORK_QUEUE_PATH", "/tmp/notion-work-queue.sqlite3"))